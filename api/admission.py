@@ -0,0 +1,106 @@
+import functools
+import math
+import threading
+import time
+from api.config import *
+from api.dataset import current_dataset
+from api.endpoints import EndpointsUnavailable
+from flask import Response, request
+
+# WSGI environ key marking requests made by this process itself, e.g. by api.warmup, that are not rate limited
+INTERNAL_KEY = "ogcldapi.internal"
+MAX_CLIENTS = 10000  # clients tracked before idle ones' buckets are dropped
+
+
+def overloaded(message: str, status: int, retry_after: float) -> Response:
+    return Response(
+        message,
+        status=status,
+        mimetype="text/plain",
+        headers={"Retry-After": str(max(1, int(math.ceil(retry_after))))}
+    )
+
+
+class TokenBucket(object):
+    """Allows rate requests per second on average, in bursts of up to burst requests"""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Takes a token, returning 0, or returns the seconds until one will be available"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+class RateLimiter(object):
+    """A TokenBucket per client, a client being its address or, behind a proxy, RATE_LIMIT_CLIENT_HEADER's value"""
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: int = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def client() -> str:
+        if RATE_LIMIT_CLIENT_HEADER is not None and request.headers.get(RATE_LIMIT_CLIENT_HEADER) is not None:
+            return request.headers[RATE_LIMIT_CLIENT_HEADER].split(",")[0].strip()
+        return request.remote_addr
+
+    def check(self, client: str) -> float:
+        """0 if client may make a request now, else the seconds it must wait"""
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= MAX_CLIENTS:
+                    for k in [k for k, v in self._buckets.items() if v.full()]:
+                        del self._buckets[k]
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            return bucket.take()
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit():
+    """For before_request: a 429 response if the client has made too many requests recently, else None"""
+    if RATE_LIMIT_PER_SECOND <= 0 or request.environ.get(INTERNAL_KEY):
+        return None
+    wait = rate_limiter.check(RateLimiter.client())
+    if wait > 0:
+        return overloaded("Too many requests, please slow down", 429, wait)
+    return None
+
+
+def admit(view):
+    """Decorates a view that may query the store so that no more than STORE_QUERY_BUDGET of them run at once for a
+    Dataset, others waiting up to STORE_QUERY_WAIT seconds for a turn before being turned away with a 503, as are
+    those made while none of the Dataset's SPARQL endpoints is available"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        budget = current_dataset().store_budget
+        if not budget.acquire(timeout=STORE_QUERY_WAIT):
+            return overloaded("The service is busy, please try again shortly", 503, STORE_QUERY_WAIT)
+        try:
+            return view(*args, **kwargs)
+        except EndpointsUnavailable as e:
+            return overloaded("The triplestore is unavailable, please try again shortly", 503, e.retry_after)
+        finally:
+            budget.release()
+
+    return wrapper
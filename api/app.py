@@ -9,38 +9,79 @@ from flask import (
 )
 from flask_restx import Api, Resource
 from api.config import *
+from api.dataset import current_dataset, DatasetDispatcher
+from api.warmup import ready, start_warm_up
+from api.changes import start_change_detection
+from api.singleflight import coalesce
+from api.response_cache import cached
+from api.admission import admit, rate_limit
+from api.endpoints import EndpointsUnavailable, start_health_checks
 from pyldapi import Renderer
 from api.model import *
-from rdflib import Literal
 from rdflib.namespace import DCTERMS, RDF
 from flask_compress import Compress
 
-logging.basicConfig(
-    filename=LOGFILE,
-    level=logging.DEBUG,
-    datefmt="%Y-%m-%d %H:%M:%S",
-    format="%(asctime)s %(levelname)s %(filename)s:%(lineno)s %(message)s",
-)
+blueprint = Blueprint('api', __name__)
 
-app = Flask(__name__, template_folder=TEMPLATES_DIR, static_folder=STATIC_DIR)
-app.config["COMPRESS_MIMETYPES"] = [
-    'text/html',
-    'text/css',
-    'text/xml',
-    'application/json',
-    'application/geo+json',
-    'application/javascript',
-] + Renderer.RDF_MEDIA_TYPES
-Compress(app)
+api = Api(doc="/doc/", version='1.0', title="OGC LD API",
+          description="Open API Documentation for this {}".format(API_TITLE), decorators=[admit, coalesce, cached])
+# sapi = Namespace('oai', description="Search from DGGS Engine", version="1.0")
+# api.add_namespace(sapi)
 
-blueprint = Blueprint('api', __name__)
 
+def create_app():
+    """Builds the Flask application, with its logging, compression, dataset dispatch and routes
 
-@app.route("/")
+    Nothing is built when this module is imported, so that importing it is cheap and each caller, e.g. app.wsgi,
+    gets its own application.
+    """
+    logging.basicConfig(
+        filename=LOGFILE,
+        level=logging.DEBUG,
+        datefmt="%Y-%m-%d %H:%M:%S",
+        format="%(asctime)s %(levelname)s %(filename)s:%(lineno)s %(message)s",
+    )
+
+    app = Flask(__name__, template_folder=TEMPLATES_DIR, static_folder=STATIC_DIR)
+    app.config["COMPRESS_MIMETYPES"] = [
+        'text/html',
+        'text/css',
+        'text/xml',
+        'application/json',
+        'application/geo+json',
+        'application/javascript',
+        MVT_MEDIATYPE,
+    ] + Renderer.RDF_MEDIA_TYPES
+    Compress(app)
+    # serve each configured dataset under its own hostname or path prefix, see api.dataset
+    app.wsgi_app = DatasetDispatcher(app.wsgi_app)
+
+    app.before_request(limit_clients)
+    app.context_processor(context_processor)
+    # before the Api's routes, as it adds its own for "/"
+    app.add_url_rule("/", view_func=landing_page)
+    app.add_url_rule("/ready", view_func=ready_check)
+    api.init_app(app)
+    app.register_blueprint(blueprint)
+
+    return app
+
+
+def limit_clients():
+    # readiness checks come from load balancers, so are not limited
+    if request.endpoint not in ["ready_check", "static"]:
+        return rate_limit()
+
+
+@cached
+@coalesce
+@admit
 def landing_page():
     logging.debug("landing_page()")
     try:
         return LandingPageRenderer(request).render()
+    except EndpointsUnavailable:
+        raise  # a 503, see api.admission
     except Exception as e:
         logging.debug(e)
         return Response(
@@ -50,14 +91,13 @@ def landing_page():
         )
 
 
-api = Api(app, doc="/doc/", version='1.0', title="OGC LD API",
-          description="Open API Documentation for this {}".format(API_TITLE))
-# sapi = Namespace('oai', description="Search from DGGS Engine", version="1.0")
-# api.add_namespace(sapi)
-app.register_blueprint(blueprint)
+def ready_check():
+    """For load balancers & orchestrators: 200 once this worker's caches are warmed up, 503 until then"""
+    if ready.is_set():
+        return Response("ready", mimetype="text/plain")
+    return Response("warming up", status=503, mimetype="text/plain", headers={"Retry-After": "5"})
 
 
-@app.context_processor
 def context_processor():
     """
     A set of variables available globally for all Jinja templates.
@@ -78,7 +118,7 @@ def context_processor():
     return dict(
         LOCAL_URIS=LOCAL_URIS,
         MEDIATYPE_NAMES=MEDIATYPE_NAMES,
-        API_TITLE=API_TITLE,
+        API_TITLE=current_dataset().title,
     )
 
 
@@ -121,11 +161,8 @@ class CollectionsRoute(Resource):
 @api.param("collection_id", "The ID of a Collection delivered by this API. See /collections for the list.")
 class CollectionRoute(Resource):
     def get(self, collection_id):
-        g = get_graph()
         # get the URI for the Collection using the ID
-        collection_uri = None
-        for s in g.subjects(predicate=DCTERMS.identifier, object=Literal(collection_id)):
-            collection_uri = s
+        collection_uri = current_dataset().backend.collection_uri(collection_id)
 
         if collection_uri is None:
             return Response(
@@ -149,11 +186,8 @@ class FeaturesRoute(Resource):
 @api.param("item_id", "The ID of a Feature in this Collection's list of Items")
 class FeatureRoute(Resource):
     def get(self, collection_id, item_id):
-        g = get_graph()
         # get the URI for the Collection using the ID
-        collection_uri = None
-        for s in g.subjects(predicate=DCTERMS.identifier, object=Literal(collection_id)):
-            collection_uri = s
+        collection_uri = current_dataset().backend.collection_uri(collection_id)
 
         if collection_uri is None:
             return Response(
@@ -162,11 +196,10 @@ class FeatureRoute(Resource):
                 mimetype="text/plain"
             )
 
-        # get URIs for things with this ID  - IDs may not be unique across Collections
-        for s in g.subjects(predicate=DCTERMS.identifier, object=Literal(item_id)):
-            # if this Feature is in this Collection, return it
-            if (s, DCTERMS.isPartOf, collection_uri) in g:
-                return FeatureRenderer(request, str(s)).render()
+        # get the URI for the Feature with this ID in this Collection - IDs may not be unique across Collections
+        feature_uri = current_dataset().backend.feature_uri(collection_uri, item_id)
+        if feature_uri is not None:
+            return FeatureRenderer(request, feature_uri).render()
 
         return Response(
             "The Feature you have entered the ID for is not part of the Collection you entered the ID for",
@@ -175,6 +208,55 @@ class FeatureRoute(Resource):
         )
 
 
+@api.route("/collections/<string:collection_id>/aggregation")
+@api.param("collection_id", "The ID of a Collection delivered by this API. See /collections for the list.")
+@api.param("resolution", "The DGGS resolution to aggregate the Collection's Features to")
+class AggregationRoute(Resource):
+    def get(self, collection_id):
+        # get the URI for the Collection using the ID
+        collection_uri = current_dataset().backend.collection_uri(collection_id)
+
+        if collection_uri is None:
+            return Response(
+                "You have entered an unknown Collection ID",
+                status=400,
+                mimetype="text/plain"
+            )
+
+        return AggregationRenderer(request, Collection(collection_uri)).render()
+
+
+@api.route("/collections/<string:collection_id>/tiles/<int:z>/<int:x>/<int:y>")
+@api.param("collection_id", "The ID of a Collection delivered by this API. See /collections for the list.")
+@api.param("z", "The zoom level of the tile")
+@api.param("x", "The column of the tile")
+@api.param("y", "The row of the tile")
+class TileRoute(Resource):
+    def get(self, collection_id, z, x, y):
+        # get the URI for the Collection using the ID
+        collection_uri = current_dataset().backend.collection_uri(collection_id)
+
+        if collection_uri is None:
+            return Response(
+                "You have entered an unknown Collection ID",
+                status=400,
+                mimetype="text/plain"
+            )
+
+        if not valid_tile(z, x, y):
+            return Response(
+                "There is no tile {}/{}/{} in the Web Mercator tiling scheme".format(z, x, y),
+                status=400,
+                mimetype="text/plain"
+            )
+
+        tile = get_tile(Collection(collection_uri), z, x, y)
+        if len(tile) == 0:
+            return Response(status=204)
+
+        return Response(tile, mimetype=MVT_MEDIATYPE)
+
+
 @api.route("/object")
 class ObjectRoute(Resource):
     def get(self):
@@ -200,4 +282,8 @@ def render_api_error(title, status, message, mediatype="text/html"):
 
 
 if __name__ == "__main__":
+    app = create_app()
+    start_change_detection(app)
+    start_health_checks()
+    start_warm_up(app)
     app.run(debug=DEBUG, threaded=True, port=PORT)
@@ -0,0 +1,542 @@
+"""The queries the API makes of a Dataset's store, behind one interface so that the store can be swapped
+
+A Dataset's backend is a SPARQLBackend, querying its SPARQL endpoint or, for a local_file or snapshot_file, its
+in-process graph, or a SQLiteBackend, see api.sqlite_backend, for a Dataset loaded into an on-disk SQLite database.
+"""
+import itertools
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from rdflib import Literal
+from api.filters import TEMPORAL_PROPERTIES, And, Comparison, In, IsNull, Like, Not, Or, TIntersects, like_regex
+from api.sparql import SPARQLClient
+
+# the kinds of geometry literal a Feature may have, by property
+WKT = "wkt"  # geo:asWKT
+DGGS = "dggs"  # geox:asDGGS
+
+CollectionRow = namedtuple("CollectionRow", ["uri", "identifier", "title", "description"])
+FeatureRow = namedtuple("FeatureRow", ["uri", "identifier", "title", "description", "collection"])
+GeometryRow = namedtuple("GeometryRow", ["kind", "value", "role", "crs", "label"])
+FeatureDescription = namedtuple("FeatureDescription", ["feature", "geometries"])  # a FeatureRow & its GeometryRows
+
+# the properties of Features, and of their geometry nodes, that describe_features() fetches, by name
+HAS_GEOMETRY = "http://www.opengis.net/ont/geosparql#hasGeometry"
+FEATURE_PROPERTIES = {
+    "http://purl.org/dc/terms/identifier": "identifier",
+    "http://purl.org/dc/terms/title": "title",
+    "http://purl.org/dc/terms/description": "description",
+    "http://purl.org/dc/terms/isPartOf": "collection",
+}
+# the FeatureRow fields that features() and describe_features() may be asked to leave out, e.g. for a response that
+# won't show them
+OPTIONAL_PROPERTIES = ["title", "description"]
+GEOMETRY_NODE_PROPERTIES = {
+    "http://www.opengis.net/ont/geosparql#asWKT": WKT,
+    "https://linked.data.gov.au/def/geox#asDGGS": DGGS,
+    "https://linked.data.gov.au/def/geox#hasRole": "role",
+    "https://linked.data.gov.au/def/geox#inCRS": "crs",
+    "http://www.w3.org/2000/01/rdf-schema#label": "label",
+}
+
+
+class Backend(object):
+    """The operations the API needs of a store. URIs and literal values are given and returned as strings"""
+    def collections(self) -> List[CollectionRow]:
+        """The Dataset's Collections, ordered by URI"""
+        raise NotImplementedError
+
+    def collection(self, uri: str) -> Optional[CollectionRow]:
+        raise NotImplementedError
+
+    def collection_uri(self, identifier: str) -> Optional[str]:
+        """The URI of the Dataset's Collection with an identifier, or None if there is none"""
+        raise NotImplementedError
+
+    def feature_uri(self, collection_uri: str, identifier: str) -> Optional[str]:
+        """The URI of the Feature of a Collection with an identifier, or None. IDs may not be unique across
+        Collections"""
+        raise NotImplementedError
+
+    def member_count(self, collection_uri: str) -> int:
+        raise NotImplementedError
+
+    def members(self, collection_uri: str, start: int = 0, end: int = None) -> List[str]:
+        """The URIs of a page, [start, end), of a Collection's Features, ordered by URI"""
+        raise NotImplementedError
+
+    def features(
+            self,
+            feature_uris: List[str] = None,
+            collection_uri: str = None,
+            properties: Iterable[str] = None
+    ) -> List[FeatureRow]:
+        """The properties of the listed Features, in the same order, less any not found, or of all of a Collection's
+        Features, ordered by URI. Given properties, only those of the OPTIONAL_PROPERTIES in it are fetched, the
+        others being None"""
+        raise NotImplementedError
+
+    def geometries(
+            self,
+            feature_uris: List[str] = None,
+            collection_uri: str = None,
+            kinds: Tuple[str] = (WKT,)
+    ) -> Iterable[Tuple[str, str, str]]:
+        """(Feature URI, kind, literal value) for the geometries of the listed Features or of all of a Collection's
+        Features, of the given kinds, fetched as one batch"""
+        raise NotImplementedError
+
+    def temporals(self, collection_uri: str) -> Iterable[Tuple[str, str]]:
+        """(Feature URI, value) for the dcterms:date and dcterms:temporal values of all of a Collection's Features"""
+        raise NotImplementedError
+
+    def describe_features(
+            self,
+            feature_uris: List[str],
+            properties: Iterable[str] = None,
+            geometries: bool = True
+    ) -> List[FeatureDescription]:
+        """The properties of the listed Features together with all of their geometries, each with its role, CRS and
+        label if it has them, in the same order, less any not found, in one round trip. properties is as for
+        features(), and if geometries is False none are fetched"""
+        raise NotImplementedError
+
+    def features_where(self, collection_uri: str, where, feature_uris: List[str] = None) -> List[str]:
+        """The URIs of a Collection's Features, or of those listed, that match a filter tree, see api.filters, ordered
+        by URI"""
+        raise NotImplementedError
+
+    def features_in_bbox(self, collection_uri: str, bbox: Tuple[float, float, float, float], where=None) -> List[str]:
+        """The URIs of a Collection's Features whose WGS84 geometries overlap a (min x, min y, max x, max y) box, and
+        that match the filter tree where, if given"""
+        raise NotImplementedError
+
+    def features_in_cell(self, collection_uri: str, cell_id: str, where=None) -> List[str]:
+        """The URIs of a Collection's Features with a DGGS geometry having the cell, or a cell within it, and that
+        match the filter tree where, if given"""
+        raise NotImplementedError
+
+    def modified(self) -> Optional[str]:
+        """The Dataset's dcterms:modified value, if it has one. Only needed of stores that can change, see api.changes"""
+        raise NotImplementedError
+
+    def collection_signatures(self) -> Dict[str, Tuple[str, str, str]]:
+        """A signature of each of the Dataset's Collections, by URI, that changes when the Collection or any of its
+        Features or their geometries change: the number of triples about them, the total length of their values and
+        the latest dcterms:modified among them. Only needed of stores that can change, see api.changes"""
+        raise NotImplementedError
+
+
+def _values(uris: List[str]) -> str:
+    return " ".join("<{}>".format(x) for x in uris)
+
+
+def optional_properties(properties: Iterable[str] = None) -> List[str]:
+    """Those of the OPTIONAL_PROPERTIES to fetch, given the properties asked for, or None for all"""
+    return [x for x in OPTIONAL_PROPERTIES if properties is None or x in properties]
+
+
+def _first_rows(rows, make) -> dict:
+    """The first row for each subject, the first value, as a dict, for properties that may repeat"""
+    by_uri = {}
+    for r in rows:
+        if r[0] not in by_uri:
+            by_uri[r[0]] = make(*r)
+    return by_uri
+
+
+def feature_descriptions(
+        triples: Iterable[Tuple[str, str, str]],
+        feature_uris: List[str]
+) -> List[FeatureDescription]:
+    """Assembles FeatureDescriptions from (subject, predicate, object) values of the Features' and their geometry
+    nodes' triples"""
+    properties = {}  # subject: {name: first value}
+    nodes = {}  # Feature: its geometry nodes, in order
+    for s, p, o in triples:
+        if p == HAS_GEOMETRY:
+            nodes.setdefault(s, {})[o] = None
+        else:
+            name = FEATURE_PROPERTIES.get(p) or GEOMETRY_NODE_PROPERTIES.get(p)
+            if name is not None:
+                properties.setdefault(s, {}).setdefault(name, o)
+
+    descriptions = []
+    for uri in feature_uris:
+        p = properties.get(uri, {})
+        if p.get("identifier") is None:
+            continue
+        geometries = []
+        for node in nodes.get(uri, {}):
+            g = properties.get(node, {})
+            for kind in [WKT, DGGS]:
+                if g.get(kind) is not None:
+                    geometries.append(GeometryRow(kind, g[kind], g.get("role"), g.get("crs"), g.get("label")))
+        descriptions.append(FeatureDescription(
+            FeatureRow(uri, p["identifier"], p.get("title"), p.get("description"), p.get("collection")),
+            geometries
+        ))
+    return descriptions
+
+
+def sparql_filter(tree, subject: str = "?f") -> str:
+    """A filter tree, see api.filters, as a SPARQL FILTER expression on the Features bound to subject"""
+    variables = itertools.count()
+
+    def exists(path, condition):
+        v = "?v{}".format(next(variables))
+        return "EXISTS {{ {} {} {} . FILTER ({}) }}".format(subject, path, v, condition.replace("?v", v))
+
+    def term(value):
+        return repr(value) if isinstance(value, float) else Literal(value).n3()
+
+    def compile_tree(t):
+        if isinstance(t, Comparison):
+            operator = "!=" if t.operator == "<>" else t.operator
+            if isinstance(t.value, float):
+                return exists("<{}>".format(t.property), "xsd:double(STR(?v)) {} {}".format(operator, term(t.value)))
+            return exists("<{}>".format(t.property), "STR(?v) {} {}".format(operator, term(t.value)))
+        if isinstance(t, Like):
+            return exists("<{}>".format(t.property), "REGEX(STR(?v), {})".format(Literal(like_regex(t.pattern)).n3()))
+        if isinstance(t, In):
+            if any(isinstance(x, float) for x in t.values):
+                return compile_tree(Or(tuple(Comparison(t.property, "=", x) for x in t.values)))
+            return exists("<{}>".format(t.property), "STR(?v) IN ({})".format(", ".join(term(x) for x in t.values)))
+        if isinstance(t, IsNull):
+            return "NOT EXISTS {{ {} <{}> ?v{} }}".format(subject, t.property, next(variables))
+        if isinstance(t, TIntersects):
+            # a value's start and end, as in temporal_interval(), compared as in intervals_intersect()
+            start = 'IF(CONTAINS(STR(?v), "/"), STRBEFORE(STR(?v), "/"), STR(?v))'
+            end = 'IF(CONTAINS(STR(?v), "/"), STRAFTER(STR(?v), "/"), STR(?v))'
+            conditions = ["true"]
+            if t.end is not None:
+                conditions.append('({s} IN ("", "..") || SUBSTR({s}, 1, {n}) <= {end})'.format(
+                    s=start, n=len(t.end), end=term(t.end)))
+            if t.start is not None:
+                conditions.append('({e} IN ("", "..") || {e} >= SUBSTR({start}, 1, STRLEN({e})))'.format(
+                    e=end, start=term(t.start)))
+            return exists("|".join("<{}>".format(x) for x in TEMPORAL_PROPERTIES), " && ".join(conditions))
+        if isinstance(t, Not):
+            return "!({})".format(compile_tree(t.item))
+        return "({})".format((" && " if isinstance(t, And) else " || ").join(compile_tree(x) for x in t.items))
+
+    return compile_tree(tree)
+
+
+class SPARQLBackend(Backend):
+    """A Dataset's SPARQL endpoint or, if it has one, its in-process graph, queried with SPARQL"""
+    PREFIXES = """
+        PREFIX dcterms: <http://purl.org/dc/terms/>
+        PREFIX geo: <http://www.opengis.net/ont/geosparql#>
+        PREFIX geof: <http://www.opengis.net/def/function/geosparql/>
+        PREFIX geox: <https://linked.data.gov.au/def/geox#>
+        PREFIX ogcapi: <https://data.surroundaustralia.com/def/ogcapi/>
+        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+        """
+    GEOMETRY_PROPERTIES = {WKT: "geo:asWKT", DGGS: "geox:asDGGS"}
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.client = SPARQLClient(dataset.endpoints)
+
+    def select(self, query: str, variables: List[str]) -> Iterator[tuple]:
+        """The rows of a SELECT query, lazily, as tuples of the variables' values, as strings, or None where unbound"""
+        query = self.PREFIXES + query
+        if self.dataset.local_file is not None or self.dataset.snapshot_file is not None:
+            return (
+                tuple(str(r[x]) if r[x] is not None else None for x in variables)
+                for r in self.dataset.get_graph().query(query)
+            )
+
+        # the endpoint is queried directly, streaming the rows, as SPARQLStore parses whole results into a Graph
+        return self.client.select(query, variables)
+
+    def construct(self, query: str) -> Iterator[Tuple[str, str, str]]:
+        """The triples of a CONSTRUCT query, lazily, as (subject, predicate, object) values, as strings"""
+        query = self.PREFIXES + query
+        if self.dataset.local_file is not None or self.dataset.snapshot_file is not None:
+            return ((str(s), str(p), str(o)) for s, p, o in self.dataset.get_graph().query(query))
+
+        return self.client.construct(query)
+
+    def collections(self) -> List[CollectionRow]:
+        q = """
+            SELECT ?c ?identifier ?title ?description
+            WHERE {{
+                ?c a ogcapi:Collection ;
+                   dcterms:isPartOf <{}> .
+                OPTIONAL {{?c dcterms:identifier ?identifier}}
+                OPTIONAL {{?c dcterms:title ?title}}
+                OPTIONAL {{?c dcterms:description ?description}}
+            }}
+            ORDER BY ?c
+            """.format(self.dataset.dataset_uri)
+        return list(_first_rows(self.select(q, ["c", "identifier", "title", "description"]), CollectionRow).values())
+
+    def collection(self, uri: str) -> Optional[CollectionRow]:
+        q = """
+            SELECT ?identifier ?title ?description
+            WHERE {{
+                OPTIONAL {{<{0}> dcterms:identifier ?identifier}}
+                OPTIONAL {{<{0}> dcterms:title ?title}}
+                OPTIONAL {{<{0}> dcterms:description ?description}}
+            }}
+            """.format(uri)
+        row = next(self.select(q, ["identifier", "title", "description"]), None)
+        return CollectionRow(uri, *row) if row is not None and row[0] is not None else None
+
+    def collection_uri(self, identifier: str) -> Optional[str]:
+        q = """
+            SELECT ?c
+            WHERE {{
+                ?c a ogcapi:Collection ;
+                   dcterms:identifier {} ;
+                   dcterms:isPartOf <{}> .
+            }}
+            ORDER BY ?c
+            LIMIT 1
+            """.format(Literal(identifier).n3(), self.dataset.dataset_uri)
+        row = next(self.select(q, ["c"]), None)
+        return row[0] if row is not None else None
+
+    def feature_uri(self, collection_uri: str, identifier: str) -> Optional[str]:
+        q = """
+            SELECT ?f
+            WHERE {{
+                ?f dcterms:identifier {} ;
+                   dcterms:isPartOf <{}> .
+            }}
+            LIMIT 1
+            """.format(Literal(identifier).n3(), collection_uri)
+        row = next(self.select(q, ["f"]), None)
+        return row[0] if row is not None else None
+
+    def member_count(self, collection_uri: str) -> int:
+        q = """
+            SELECT (COUNT(?f) AS ?count)
+            WHERE {{
+                ?f dcterms:isPartOf <{}> .
+            }}
+            """.format(collection_uri)
+        return int(next(self.select(q, ["count"]))[0])
+
+    def members(self, collection_uri: str, start: int = 0, end: int = None) -> List[str]:
+        q = """
+            SELECT ?f
+            WHERE {{
+                ?f dcterms:isPartOf <{}> .
+            }}
+            ORDER BY ?f
+            {}
+            OFFSET {}
+            """.format(collection_uri, "LIMIT {}".format(end - start) if end is not None else "", start)
+        return [r[0] for r in self.select(q, ["f"])]
+
+    def features(
+            self,
+            feature_uris: List[str] = None,
+            collection_uri: str = None,
+            properties: Iterable[str] = None
+    ) -> List[FeatureRow]:
+        if feature_uris is not None:
+            if len(feature_uris) == 0:
+                return []
+            selection = "VALUES ?f {{ {} }} OPTIONAL {{?f dcterms:isPartOf ?collection}}".format(_values(feature_uris))
+        else:
+            selection = "?f dcterms:isPartOf <{0}> . BIND (<{0}> AS ?collection)".format(collection_uri)
+        q = """
+            SELECT ?f ?identifier ?title ?description ?collection
+            WHERE {{
+                {}
+                ?f dcterms:identifier ?identifier .
+                {}
+            }}
+            ORDER BY ?f
+            """.format(selection, "\n".join(
+                "OPTIONAL {{?f dcterms:{0} ?{0}}}".format(x) for x in optional_properties(properties)))
+        rows = _first_rows(self.select(q, ["f", "identifier", "title", "description", "collection"]), FeatureRow)
+        if feature_uris is None:
+            return list(rows.values())
+        return [rows[str(x)] for x in feature_uris if str(x) in rows]
+
+    def geometries(
+            self,
+            feature_uris: List[str] = None,
+            collection_uri: str = None,
+            kinds: Tuple[str] = (WKT,)
+    ) -> Iterable[Tuple[str, str, str]]:
+        if feature_uris is not None:
+            if len(feature_uris) == 0:
+                return []
+            selection = "VALUES ?f {{ {} }}".format(_values(feature_uris))
+        else:
+            selection = "?f dcterms:isPartOf <{}> .".format(collection_uri)
+        # a UNION, not a pattern per kind, so that Features with several geometries make a row for each, not a product
+        patterns = " UNION ".join(
+            '{{ ?f geo:hasGeometry/{} ?value . BIND ("{}" AS ?kind) }}'.format(self.GEOMETRY_PROPERTIES[k], k)
+            for k in kinds
+        )
+        q = """
+            SELECT ?f ?kind ?value
+            WHERE {{
+                {}
+                {}
+            }}
+            ORDER BY ?f
+            """.format(selection, patterns)
+        return self.select(q, ["f", "kind", "value"])
+
+    def temporals(self, collection_uri: str) -> Iterable[Tuple[str, str]]:
+        q = """
+            SELECT ?f ?value
+            WHERE {{
+                ?f dcterms:isPartOf <{}> ;
+                   ?p ?value .
+                VALUES ?p {{ {} }}
+            }}
+            """.format(collection_uri, " ".join("<{}>".format(x) for x in TEMPORAL_PROPERTIES))
+        return self.select(q, ["f", "value"])
+
+    def describe_features(
+            self,
+            feature_uris: List[str],
+            properties: Iterable[str] = None,
+            geometries: bool = True
+    ) -> List[FeatureDescription]:
+        if len(feature_uris) == 0:
+            return []
+        # a branch for the Features' own triples and one for their geometry nodes', so that neither multiplies the
+        # other, and only the properties used, so that nothing else is sent
+        predicates = ["dcterms:identifier", "dcterms:isPartOf"] + \
+            ["dcterms:" + x for x in optional_properties(properties)] + (["geo:hasGeometry"] if geometries else [])
+        geometry_branch = """
+                UNION
+                {
+                    ?f geo:hasGeometry ?g .
+                    ?g ?gp ?go .
+                    VALUES ?gp { geo:asWKT geox:asDGGS geox:hasRole geox:inCRS rdfs:label }
+                }"""
+        q = """
+            CONSTRUCT {{
+                ?f ?p ?o .
+                ?g ?gp ?go .
+            }}
+            WHERE {{
+                VALUES ?f {{ {} }}
+                {{
+                    ?f ?p ?o .
+                    VALUES ?p {{ {} }}
+                }}{}
+            }}
+            """.format(_values(feature_uris), " ".join(predicates), geometry_branch if geometries else "")
+        return feature_descriptions(self.construct(q), [str(x) for x in feature_uris])
+
+    def features_where(self, collection_uri: str, where, feature_uris: List[str] = None) -> List[str]:
+        if feature_uris is not None and len(feature_uris) == 0:
+            return []
+        q = """
+            SELECT ?f
+            WHERE {{
+                {}
+                ?f dcterms:isPartOf <{}> .
+                FILTER ({})
+            }}
+            ORDER BY ?f
+            """.format(
+                "VALUES ?f {{ {} }}".format(_values(feature_uris)) if feature_uris is not None else "",
+                collection_uri,
+                sparql_filter(where)
+            )
+        return [r[0] for r in self.select(q, ["f"])]
+
+    def features_in_bbox(self, collection_uri: str, bbox: Tuple[float, float, float, float], where=None) -> List[str]:
+        # a snapshot has a spatial index of its Features' envelopes, so needs no GeoSPARQL support
+        snapshot = self.dataset.get_snapshot()
+        if snapshot is not None:
+            feature_uris = [str(x) for x in snapshot.features_in_bbox(collection_uri, bbox)]
+            return feature_uris if where is None else self.features_where(collection_uri, where, feature_uris)
+        # nor does a local_file's in-process graph have geof:sfOverlaps, rdflib not implementing it, so the Features'
+        # envelopes are compared with the BBox here, as the snapshot and SQLite backends do
+        if self.dataset.local_file is not None:
+            from api.model.spatial_object import wkt_envelope
+
+            feature_uris = []
+            for f, kind, value in self.geometries(collection_uri=collection_uri):
+                envelope = wkt_envelope(value)
+                if envelope is not None and envelope[0] <= bbox[2] and envelope[2] >= bbox[0] and \
+                        envelope[1] <= bbox[3] and envelope[3] >= bbox[1]:
+                    feature_uris.append(f)
+            feature_uris = sorted(set(feature_uris))
+            return feature_uris if where is None else self.features_where(collection_uri, where, feature_uris)
+
+        q = """
+            SELECT DISTINCT ?f
+            WHERE {{
+                ?f a ogcapi:Feature ;
+                   dcterms:isPartOf <{collection_uri}> ;
+                   geo:hasGeometry/geo:asWKT ?wkt .
+
+                FILTER (geof:sfOverlaps(?wkt,
+                    '''
+                    <http://www.opengis.net/def/crs/OGC/1.3/CRS84>
+                    POLYGON ((
+                        {min_x} {min_y},
+                        {min_x} {max_y},
+                        {max_x} {max_y},
+                        {max_x} {min_y},
+                        {min_x} {min_y}
+                    ))
+                    '''^^geo:wktLiteral))
+                {where}
+            }}
+            ORDER BY ?f
+            """.format(collection_uri=collection_uri, min_x=bbox[0], min_y=bbox[1], max_x=bbox[2], max_y=bbox[3],
+                       where="FILTER ({})".format(sparql_filter(where)) if where is not None else "")
+        return [r[0] for r in self.select(q, ["f"])]
+
+    def features_in_cell(self, collection_uri: str, cell_id: str, where=None) -> List[str]:
+        # geo:sfOverlaps - any Cell of the Feature is within the BBox
+        q = """
+            SELECT DISTINCT ?f
+            WHERE {{
+                ?f a ogcapi:Feature ;
+                   dcterms:isPartOf <{}> .
+                ?f geo:hasGeometry/geox:asDGGS ?dggs .
+
+                FILTER CONTAINS(STR(?dggs), {})
+                {}
+            }}
+            ORDER BY ?f
+            """.format(
+                collection_uri,
+                Literal(cell_id).n3(),
+                "FILTER ({})".format(sparql_filter(where)) if where is not None else ""
+            )
+        return [r[0] for r in self.select(q, ["f"])]
+
+    def modified(self) -> Optional[str]:
+        q = """
+            SELECT ?modified
+            WHERE {{
+                <{}> dcterms:modified ?modified .
+            }}
+            """.format(self.dataset.dataset_uri)
+        for r in self.select(q, ["modified"]):
+            return r[0]
+        return None
+
+    def collection_signatures(self) -> Dict[str, Tuple[str, str, str]]:
+        q = """
+            SELECT ?c (COUNT(?o) AS ?triples) (SUM(STRLEN(STR(?o))) AS ?length)
+                   (MAX(IF(?p = dcterms:modified, STR(?o), "")) AS ?modified)
+            WHERE {{
+                ?c dcterms:isPartOf <{}> .
+                {{ ?c ?p ?o }}
+                UNION
+                {{ ?f dcterms:isPartOf ?c ; ?p ?o }}
+                UNION
+                {{ ?f dcterms:isPartOf ?c ; geo:hasGeometry ?g . ?g ?p ?o }}
+            }}
+            GROUP BY ?c
+            """.format(self.dataset.dataset_uri)
+        return {r[0]: tuple(r[1:]) for r in self.select(q, ["c", "triples", "length", "modified"])}
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from api.config import CACHE_HOURS, CACHE_STALE_HOURS
+
+
+class Cache(object):
+    """A thread-safe, in-process store of computed values that expire after CACHE_HOURS
+
+    Keys are tuples whose first element names the kind of value, e.g. ("extents", collection_uri), so that related
+    entries can be invalidated together by key prefix.
+
+    An expired value is kept for a further CACHE_STALE_HOURS, during which get_or_load() returns it at once, stale,
+    while it is loaded again in the background, and goes on returning it if that fails, e.g. while the store is down.
+    """
+    def __init__(self, timeout: float = None, stale: float = None, max_entries: int = None):
+        """max_entries, if given, bounds the number of entries, those set longest ago being dropped first"""
+        self.timeout = timeout if timeout is not None else float(CACHE_HOURS) * 3600
+        self.stale = stale if stale is not None else float(CACHE_STALE_HOURS) * 3600
+        self.max_entries = max_entries
+        self._entries = {}
+        self._refreshing = set()
+        self._generation = 0  # counts invalidations, so that refreshes begun before one are discarded
+        self._lock = threading.Lock()
+
+    def _fresh(self, entry):
+        return time.time() - entry[1] < self.timeout
+
+    def get(self, key: tuple, default=None):
+        entry = self._entries.get(key)
+        if entry is None or not self._fresh(entry):
+            return default
+        return entry[0]
+
+    def get_stale(self, key: tuple):
+        """(value, age in seconds) for key if it is cached, fresh or stale, else None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry[1]
+        return (entry[0], age) if age < self.timeout + self.stale else None
+
+    def set(self, key: tuple, value):
+        with self._lock:
+            self._entries.pop(key, None)  # so that it is now the last set
+            self._entries[key] = (value, time.time())
+            if self.max_entries is not None:
+                while len(self._entries) > self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+        return value
+
+    def get_or_load(self, key: tuple, loader):
+        """Returns the cached value for key, calling loader() to compute and cache it if it is missing or expired, or
+        in the background, returning the stale value meanwhile, if it has expired within the last CACHE_STALE_HOURS"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.time() - entry[1]
+            if age < self.timeout:
+                return entry[0]
+            if age < self.timeout + self.stale:
+                self.refresh(key, loader)
+                return entry[0]
+        return self.set(key, loader())
+
+    def refresh(self, key: tuple, loader):
+        """Caches loader() for key in the background, for the current Dataset, unless that is already under way. If
+        loader() fails, any value already cached is left as it is"""
+        from api.dataset import current_dataset
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            generation = self._generation
+        dataset = current_dataset()
+
+        def run():
+            try:
+                with dataset.activate():
+                    value = loader()
+                with self._lock:
+                    if generation != self._generation:
+                        return
+                self.set(key, value)
+            except Exception as e:
+                logging.warning("refreshing {} for {} failed, it stays stale: {}".format(key, dataset, e))
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name="cache-refresh", daemon=True).start()
+
+    def invalidate(self, *prefix):
+        """Removes every entry whose key starts with prefix, or all entries if no prefix is given"""
+        n = len(prefix)
+        with self._lock:
+            self._generation += 1
+            for key in [k for k in self._entries if k[:n] == prefix]:
+                del self._entries[key]
+
+
+class DatasetCache(object):
+    """The Cache of the Dataset being served, so that each Dataset's entries are kept and invalidated apart"""
+    def __getattr__(self, name):
+        from api.dataset import current_dataset
+        return getattr(current_dataset().cache, name)
+
+
+cache = DatasetCache()
@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from api.config import *
+from api.dataset import DATASETS
+
+# functions(collection_uri) called when a Collection, or any of its Features, changes, in addition to those that drop
+# the Collection's cached extents, geometries & tiles, aggregation and geosp fragments
+INVALIDATORS = []
+
+
+def invalidate_collection(collection_uri: str):
+    """Drops everything cached for a Collection and its Features in the current Dataset"""
+    from api.model.spatial_object import invalidate_collection_extents
+    from api.model.tiles import invalidate_tiles
+    from api.model.aggregation import invalidate_cell_aggregation
+    from api.model.fragments import invalidate_fragments
+
+    invalidate_collection_extents(collection_uri)
+    invalidate_tiles(collection_uri)
+    invalidate_cell_aggregation(collection_uri)
+    invalidate_fragments(collection_uri)
+    for invalidator in INVALIDATORS:
+        invalidator(collection_uri)
+
+
+class ChangeDetector(object):
+    """Detects which of a Dataset's Collections have changed in the triplestore since it last looked
+
+    The Dataset's dcterms:modified value is polled first as it is cheap. Only if that is missing or has changed is
+    each Collection's signature computed, in one aggregate query: the number of triples about the Collection, its
+    Features and their Geometries, the total length of their values and the latest dcterms:modified among them.
+    Collections whose signatures differ, or that have appeared or gone, have changed. If the Dataset's
+    dcterms:modified changes but no signature does, every Collection is taken to have changed.
+    """
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.modified = None
+        self.signatures = None
+
+    def check(self) -> list:
+        """The URIs of the Collections that have changed since the last check. The first check only records state"""
+        with self.dataset.activate():
+            modified = self.dataset.backend.modified()
+            if self.signatures is not None and modified is not None and modified == self.modified:
+                return []
+
+            signatures = self.dataset.backend.collection_signatures()
+            previous = self.signatures
+            self.modified, self.signatures = modified, signatures
+            if previous is None:
+                return []
+
+            changed = [c for c in set(signatures) | set(previous) if signatures.get(c) != previous.get(c)]
+            if len(changed) == 0 and modified is not None:
+                changed = list(set(signatures) | set(previous))
+            return sorted(changed)
+
+    def refresh(self) -> list:
+        """Checks for changes and drops the cached entries of the Collections that have changed"""
+        changed = self.check()
+        with self.dataset.activate():
+            for collection_uri in changed:
+                logging.info("{} changed in {}, dropping its cached entries".format(collection_uri, self.dataset))
+                invalidate_collection(collection_uri)
+        return changed
+
+
+def start_change_detection(app=None, datasets=None) -> threading.Thread:
+    """Polls every Dataset for changes each CHANGES_POLL_SECONDS, in the background
+
+    Changed Collections' cached entries are dropped and, given the app, they are then warmed up again, and their geosp
+    fragments built. Datasets served from a local_file, snapshot_file or sqlite_file don't change, a replaced
+    snapshot being noticed by the Dataset itself, so are not polled.
+    """
+    if CHANGES_POLL_SECONDS <= 0:
+        return None
+    detectors = [
+        ChangeDetector(x) for x in (datasets if datasets is not None else DATASETS)
+        if x.local_file is None and x.snapshot_file is None and x.sqlite_file is None
+    ]
+    if len(detectors) == 0:
+        return None
+
+    def run():
+        while True:
+            for detector in detectors:
+                try:
+                    changed = detector.refresh()
+                    if len(changed) > 0 and app is not None:
+                        from api.warmup import build_all_fragments, warm_up
+                        warm_up(app, [detector.dataset], changed)
+                        build_all_fragments([detector.dataset], changed)
+                except Exception as e:
+                    logging.warning("change detection for {} failed: {}".format(detector.dataset, e))
+            time.sleep(CHANGES_POLL_SECONDS)
+
+    t = threading.Thread(target=run, name="change-detection", daemon=True)
+    t.start()
+    return t
@@ -15,18 +15,48 @@ LOGFILE = os.getenv("LOGFILE", os.path.join(APP_DIR, "ogcldapi.log"))
 
 CACHE_FILE = os.getenv("CACHE_DIR", os.path.join(APP_DIR, "cache", "DATA.pickle"))
 CACHE_HOURS = os.getenv("CACHE_HOURS", 1)
+CACHE_STALE_HOURS = float(os.getenv("CACHE_STALE_HOURS", 24))  # how long expired values are served while reloaded
+RESPONSE_CACHE_SECONDS = float(os.getenv("RESPONSE_CACHE_SECONDS", 60))  # 0 for none, see api.response_cache
+RESPONSE_STALE_SECONDS = float(os.getenv("RESPONSE_STALE_SECONDS", 600))  # then served stale while revalidated
+RESPONSE_STALE_IF_ERROR_SECONDS = float(os.getenv("RESPONSE_STALE_IF_ERROR_SECONDS", 86400))  # or if that fails
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", 2000))  # per dataset
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 2000000))  # larger responses aren't cached
+TILES_DIR = os.getenv("TILES_DIR", os.path.join(APP_DIR, "cache", "tiles"))
+DGGS_AGGREGATION_MAX_RESOLUTION = int(os.getenv("DGGS_AGGREGATION_MAX_RESOLUTION", 6))
+WARMUP = str(os.getenv("WARMUP", True)).lower() == "true"  # warm caches up at startup, see api.warmup
+WARMUP_PAGES = int(os.getenv("WARMUP_PAGES", 2))  # pages of items per Collection
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", 4))
+WARMUP_MEDIATYPES = os.getenv("WARMUP_MEDIATYPES", "text/html,application/json").split(",")
+CHANGES_POLL_SECONDS = int(os.getenv("CHANGES_POLL_SECONDS", 60))  # 0 to not poll for changes, see api.changes
+SINGLE_FLIGHT = str(os.getenv("SINGLE_FLIGHT", True)).lower() == "true"  # coalesce identical concurrent requests
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))  # the largest per_page or limit a client may ask for
+STORE_QUERY_BUDGET = int(os.getenv("STORE_QUERY_BUDGET", 16))  # concurrent store-querying requests per dataset
+STORE_QUERY_WAIT = float(os.getenv("STORE_QUERY_WAIT", 2))  # seconds to wait for the budget before a 503
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", 0))  # requests per client, 0 for no limit
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 20))
+RATE_LIMIT_CLIENT_HEADER = os.getenv("RATE_LIMIT_CLIENT_HEADER")  # e.g. X-Forwarded-For, behind a trusted proxy
+GEOMETRY_PROCESSES = int(os.getenv("GEOMETRY_PROCESSES", os.cpu_count() or 1))  # for parsing large batches of WKT
+GEOMETRY_PARALLEL_MIN_CHARS = int(os.getenv("GEOMETRY_PARALLEL_MIN_CHARS", 2000000))  # smaller batches run inline
 LOCAL_URIS = os.getenv("LOCAL_URIS", True)
 VERSION = os.getenv("VERSION", __version__)
 API_TITLE = os.getenv("API_TITLE", "OGC LD API")
 LANDING_PAGE_URL = os.getenv("LANDING_PAGE_URL", "http://localhost:5000")
 DATASET_URI = os.getenv("DATASET_URI", "https://example.org/dataset/x")
-SPARQL_ENDPOINT = os.getenv("SPARQL_ENDPOINT", "http://example.org/service/sparql")
+SPARQL_ENDPOINT = os.getenv("SPARQL_ENDPOINT", "http://example.org/service/sparql")  # comma separated replicas
+SPARQL_TIMEOUT = float(os.getenv("SPARQL_TIMEOUT", 60))  # seconds to wait for the endpoint to respond
+SPARQL_BALANCING = os.getenv("SPARQL_BALANCING", "round_robin")  # or least_latency, see api.endpoints
+SPARQL_HEDGE_PERCENTILE = float(os.getenv("SPARQL_HEDGE_PERCENTILE", 95))  # latency to ask another replica, 0 never
+SPARQL_FAILURE_THRESHOLD = int(os.getenv("SPARQL_FAILURE_THRESHOLD", 3))  # failures in a row to skip a replica
+SPARQL_CIRCUIT_SECONDS = float(os.getenv("SPARQL_CIRCUIT_SECONDS", 30))  # how long a failed replica is skipped for
+SPARQL_HEALTH_CHECK_SECONDS = float(os.getenv("SPARQL_HEALTH_CHECK_SECONDS", 10))  # 0 for no health checks
+LOCAL_DATASET_FILE = os.getenv("LOCAL_DATASET_FILE")  # serve from this RDF file, in memory, not SPARQL_ENDPOINT
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE")  # or serve from this memory-mapped snapshot, see api.snapshot
+SQLITE_FILE = os.getenv("SQLITE_FILE")  # or serve from this SQLite database, see api.sqlite_backend
+SNAPSHOT_CHECK_SECONDS = float(os.getenv("SNAPSHOT_CHECK_SECONDS", 10))  # how often to look for a new snapshot
+DATASETS_FILE = os.getenv("DATASETS_FILE")  # JSON list of datasets to serve, see api.dataset.load_datasets()
 
 
 def get_graph():
-    import logging
-    logging.debug("get_graph() for {}".format(SPARQL_ENDPOINT))
-    g = Graph("SPARQLStore")
-    g.open(SPARQL_ENDPOINT)
-
-    return g
+    """The SPARQLStore Graph of the Dataset being served, see api.dataset"""
+    from api.dataset import current_dataset
+    return current_dataset().get_graph()
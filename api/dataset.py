@@ -0,0 +1,205 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from api.config import *
+from api.cache import Cache
+from api.endpoints import EndpointPool
+from flask import has_request_context, request
+
+# the WSGI environ key DatasetDispatcher places the requested Dataset under
+ENVIRON_KEY = "ogcldapi.dataset"
+
+
+class Dataset(object):
+    """One dataset served by this API, with its own store backend, connections and budget, caches and tile cache directory
+
+    A Dataset is selected for each request by DatasetDispatcher, either by hostname or by a path prefix that it is
+    mounted under, so several datasets can share one process and its workers.
+    """
+    def __init__(
+            self,
+            name: str,
+            dataset_uri: str,
+            sparql_endpoint,
+            landing_page_url: str,
+            title: str = None,
+            path_prefix: str = None,
+            hostname: str = None,
+            local_file: str = None,
+            snapshot_file: str = None,
+            sqlite_file: str = None
+    ):
+        self.name = name
+        self.dataset_uri = dataset_uri
+        # a URL, or replicas' URLs, as a list or comma separated, balanced between, see api.endpoints
+        if isinstance(sparql_endpoint, str):
+            sparql_endpoint = [x.strip() for x in sparql_endpoint.split(",") if x.strip() != ""]
+        self.sparql_endpoint = sparql_endpoint[0]
+        self.endpoints = EndpointPool(sparql_endpoint)
+        self.landing_page_url = landing_page_url.rstrip("/")
+        self.title = title if title is not None else API_TITLE
+        self.path_prefix = "/" + path_prefix.strip("/") if path_prefix is not None else None
+        self.hostname = hostname
+        self.local_file = local_file
+        self.snapshot_file = snapshot_file
+        self.sqlite_file = sqlite_file
+        self._index = None
+        self._index_lock = threading.Lock()
+        self._snapshot = None
+        self._snapshot_checked = 0
+        self.cache = Cache()
+        self.responses = Cache(RESPONSE_CACHE_SECONDS, RESPONSE_STALE_IF_ERROR_SECONDS, RESPONSE_CACHE_ENTRIES)
+        self.search_index = None  # built on first use, see api.search
+        self.store_budget = threading.BoundedSemaphore(STORE_QUERY_BUDGET)
+        self.tiles_dir = os.path.join(TILES_DIR, hashlib.sha1(dataset_uri.encode()).hexdigest())
+        self._local = threading.local()
+        if sqlite_file is not None:
+            from api.sqlite_backend import SQLiteBackend
+            self.backend = SQLiteBackend(self)
+        else:
+            from api.backend import SPARQLBackend
+            self.backend = SPARQLBackend(self)
+
+    def get_graph(self):
+        """This Dataset's SPARQLStore Graph for the current thread, opened once per thread and endpoint and then reused
+
+        If the Dataset is served from a snapshot_file or local_file instead, a Graph over its read-only TripleIndex,
+        mapped or built on first use and shared by all threads, or from a sqlite_file, a Graph over its database.
+        """
+        if self.sqlite_file is not None:
+            return self.backend.graph()
+        if self.snapshot_file is not None:
+            return self.get_snapshot().graph()
+        if self.local_file is not None:
+            return self._local_graph()
+        # the preferred of the endpoints, which SPARQLStore can't fail over from, but won't be one that has failed
+        endpoint = self.endpoints.order()[0].url
+        graphs = getattr(self._local, "graphs", None)
+        if graphs is None:
+            graphs = self._local.graphs = {}
+        g = graphs.get(endpoint)
+        if g is None:
+            logging.debug("get_graph() for {}".format(endpoint))
+            g = Graph("SPARQLStore")
+            g.open(endpoint)
+            graphs[endpoint] = g
+        return g
+
+    def _local_graph(self):
+        with self._index_lock:
+            if self._index is None:
+                from api.triple_index import TripleIndex
+                logging.debug("indexing {}".format(self.local_file))
+                self._index = TripleIndex.load(self.local_file).graph()
+            return self._index
+
+    def get_snapshot(self):
+        """This Dataset's mapped snapshot, if it has one, remapped if the file has been replaced since it was checked,
+        at most SNAPSHOT_CHECK_SECONDS ago, in which case everything cached from the old snapshot is dropped"""
+        if self.snapshot_file is None:
+            return None
+        from api.snapshot import Snapshot
+        with self._index_lock:
+            now = time.monotonic()
+            if self._snapshot is None or now - self._snapshot_checked >= SNAPSHOT_CHECK_SECONDS:
+                self._snapshot_checked = now
+                if self._snapshot is None or not self._snapshot.same_file(os.stat(self.snapshot_file)):
+                    logging.info("mapping snapshot {} for {}".format(self.snapshot_file, self))
+                    replaced = self._snapshot is not None
+                    self._snapshot = Snapshot(self.snapshot_file)
+                    if replaced:
+                        self.cache.invalidate()
+                        self.responses.invalidate()
+                        self.search_index = None
+                        shutil.rmtree(self.tiles_dir, ignore_errors=True)
+            return self._snapshot
+
+    def activate(self):
+        """Makes this the current Dataset outside a request, e.g. in background jobs: with dataset.activate(): ..."""
+        return _Activation(self)
+
+    def __repr__(self):
+        return "Dataset({})".format(self.name)
+
+
+class _Activation(object):
+    def __init__(self, dataset: Dataset):
+        self.dataset = dataset
+        self.token = None
+
+    def __enter__(self):
+        self.token = _active.set(self.dataset)
+        return self.dataset
+
+    def __exit__(self, *args):
+        _active.reset(self.token)
+
+
+def load_datasets():
+    """The Datasets listed in DATASETS_FILE or, if that is not set, the single Dataset configured by the environment
+
+    DATASETS_FILE is a JSON list of objects with the keys name, dataset_uri, sparql_endpoint, a URL or a list of
+    replicas' URLs, & landing_page_url and, optionally, title, one of path_prefix or hostname, and one of local_file,
+    an RDF file, snapshot_file, a snapshot made by api.snapshot, or sqlite_file, a database made by
+    api.sqlite_backend, to serve the dataset from instead of its SPARQL endpoint.
+    """
+    if DATASETS_FILE is None:
+        return [Dataset(
+            "default",
+            DATASET_URI,
+            SPARQL_ENDPOINT,
+            LANDING_PAGE_URL,
+            local_file=LOCAL_DATASET_FILE,
+            snapshot_file=SNAPSHOT_FILE,
+            sqlite_file=SQLITE_FILE
+        )]
+
+    with open(DATASETS_FILE) as f:
+        return [Dataset(**x) for x in json.load(f)]
+
+
+DATASETS = load_datasets()
+_active = contextvars.ContextVar("dataset", default=None)
+
+
+def current_dataset() -> Dataset:
+    """The Dataset of the request being handled, else the one activated, else the first configured"""
+    if has_request_context():
+        dataset = request.environ.get(ENVIRON_KEY)
+        if dataset is not None:
+            return dataset
+    dataset = _active.get()
+    return dataset if dataset is not None else DATASETS[0]
+
+
+class DatasetDispatcher(object):
+    """WSGI middleware that selects each request's Dataset by hostname or by path prefix
+
+    A path prefix is moved from PATH_INFO to SCRIPT_NAME so that routes, and the URLs that Flask generates, work
+    unchanged beneath it. Requests that match no Dataset are served by the first one configured.
+    """
+    def __init__(self, wsgi_app, datasets=None):
+        self.wsgi_app = wsgi_app
+        self.datasets = datasets if datasets is not None else DATASETS
+
+    def select(self, environ) -> Dataset:
+        host = environ.get("HTTP_HOST", environ.get("SERVER_NAME", "")).split(":")[0]
+        path = environ.get("PATH_INFO", "")
+        for dataset in self.datasets:
+            if dataset.hostname is not None and dataset.hostname == host:
+                return dataset
+            if dataset.path_prefix is not None and (
+                    path == dataset.path_prefix or path.startswith(dataset.path_prefix + "/")):
+                environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + dataset.path_prefix
+                environ["PATH_INFO"] = path[len(dataset.path_prefix):] or "/"
+                return dataset
+        return self.datasets[0]
+
+    def __call__(self, environ, start_response):
+        environ[ENVIRON_KEY] = self.select(environ)
+        return self.wsgi_app(environ, start_response)
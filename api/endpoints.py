@@ -0,0 +1,167 @@
+"""Load balancing, hedging and failover across a Dataset's SPARQL endpoints, e.g. read replicas of one triplestore
+
+Each query goes to an endpoint chosen by SPARQL_BALANCING: round_robin, or least_latency, the endpoint with the lowest
+recent latency weighted by its requests in flight. If no response has begun by SPARQL_HEDGE_PERCENTILE of that
+endpoint's recent latencies, a duplicate is sent to the next endpoint and whichever responds first is used, so a
+replica's GC pause costs at most that percentile. A failed request is retried on the next endpoint.
+
+Each endpoint has a circuit breaker: after SPARQL_FAILURE_THRESHOLD consecutive failures it is skipped for
+SPARQL_CIRCUIT_SECONDS, then let one trial request through, which closes the circuit again if it succeeds. Health
+checks, an ASK query to every endpoint each SPARQL_HEALTH_CHECK_SECONDS, open and close circuits without waiting for
+requests to fail. If every circuit is open, queries fail at once with EndpointsUnavailable, a 503, see api.admission.
+"""
+import collections
+import itertools
+import logging
+import threading
+import time
+from typing import List, Optional
+from api.config import *
+
+ROUND_ROBIN = "round_robin"
+LEAST_LATENCY = "least_latency"
+LATENCY_WINDOW = 200  # recent latencies kept per endpoint
+HEDGE_MIN_SAMPLES = 20  # latencies needed before an endpoint's percentile is trusted for hedging
+HEALTH_CHECK_QUERY = "ASK {}"
+
+
+class EndpointsUnavailable(Exception):
+    """Every endpoint's circuit is open. retry_after is the seconds until the first will let a trial request through"""
+    def __init__(self, retry_after: float):
+        super().__init__("No SPARQL endpoint is available")
+        self.retry_after = retry_after
+
+
+class Endpoint(object):
+    """One SPARQL endpoint, with its recent latencies, requests in flight and circuit breaker state"""
+    def __init__(self, url: str):
+        self.url = url
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)  # seconds to the start of each recent response
+        self.in_flight = 0
+        self.failures = 0  # consecutive
+        self.open_until = 0.0  # while failures >= SPARQL_FAILURE_THRESHOLD, skipped until this time.monotonic()
+        self.trial = False  # a half-open circuit's one trial request is in flight
+        self._lock = threading.Lock()
+
+    def is_open(self, now: float) -> bool:
+        return self.failures >= SPARQL_FAILURE_THRESHOLD and (now < self.open_until or self.trial)
+
+    def acquire(self) -> bool:
+        """Counts a request to this endpoint in, False if its circuit is open, taking a half-open circuit's trial"""
+        with self._lock:
+            now = time.monotonic()
+            if self.is_open(now):
+                return False
+            if self.failures >= SPARQL_FAILURE_THRESHOLD:
+                self.trial = True
+            self.in_flight += 1
+            return True
+
+    def succeeded(self, latency: Optional[float]):
+        """Counts a request out that got a response, after latency seconds, closing the circuit"""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if self.failures >= SPARQL_FAILURE_THRESHOLD:
+                logging.info("SPARQL endpoint {} has recovered".format(self.url))
+            self.failures = 0
+            self.trial = False
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def failed(self):
+        """Counts a request out that failed, opening the circuit after SPARQL_FAILURE_THRESHOLD in a row"""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self.failures += 1
+            self.trial = False
+            if self.failures >= SPARQL_FAILURE_THRESHOLD:
+                if self.failures == SPARQL_FAILURE_THRESHOLD:
+                    logging.warning("SPARQL endpoint {} has failed, skipping it".format(self.url))
+                self.open_until = time.monotonic() + SPARQL_CIRCUIT_SECONDS
+
+    def latency(self) -> float:
+        """The mean of the recent latencies, 0 until there are any so that a new endpoint is tried"""
+        latencies = list(self.latencies)
+        return sum(latencies) / len(latencies) if len(latencies) > 0 else 0.0
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """The percentile of the recent latencies, or None if too few are known"""
+        latencies = sorted(self.latencies)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def __repr__(self):
+        return "Endpoint({})".format(self.url)
+
+
+class EndpointPool(object):
+    """A Dataset's SPARQL endpoints, ordered for each query by the balancing strategy, less any with open circuits"""
+    def __init__(self, urls: List[str], balancing: str = SPARQL_BALANCING):
+        if balancing not in [ROUND_ROBIN, LEAST_LATENCY]:
+            raise ValueError("Unknown SPARQL balancing strategy {}".format(balancing))
+        self.endpoints = [Endpoint(x) for x in urls]
+        self.balancing = balancing
+        self._turn = itertools.count()
+
+    def order(self) -> List[Endpoint]:
+        """The endpoints to send a query to, in order of preference, raising EndpointsUnavailable if there are none"""
+        now = time.monotonic()
+        endpoints = [x for x in self.endpoints if not x.is_open(now)]
+        if len(endpoints) == 0:
+            raise EndpointsUnavailable(max(0.0, min(x.open_until for x in self.endpoints) - now))
+        if self.balancing == LEAST_LATENCY:
+            return sorted(endpoints, key=lambda x: x.latency() * (x.in_flight + 1))
+        turn = next(self._turn) % len(endpoints)
+        return endpoints[turn:] + endpoints[:turn]
+
+    def hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        """Seconds to wait for endpoint before also asking another, or None to not hedge"""
+        if SPARQL_HEDGE_PERCENTILE <= 0 or len(self.endpoints) < 2:
+            return None
+        return endpoint.percentile(SPARQL_HEDGE_PERCENTILE)
+
+    def check(self, session):
+        """Sends every endpoint the health check query, recording failures and recoveries but not latencies, as
+        the query is too trivial to predict others'"""
+        for endpoint in self.endpoints:
+            with endpoint._lock:
+                endpoint.in_flight += 1  # as succeeded() and failed() count it out
+            try:
+                response = session.post(
+                    endpoint.url,
+                    data={"query": HEALTH_CHECK_QUERY},
+                    headers={"Accept": "application/sparql-results+json"},
+                    timeout=min(SPARQL_TIMEOUT, SPARQL_HEALTH_CHECK_SECONDS),
+                )
+                response.close()
+                if response.status_code >= 500:
+                    response.raise_for_status()
+            except Exception as e:
+                logging.debug("health check of {} failed: {}".format(endpoint.url, e))
+                endpoint.failed()
+            else:
+                endpoint.succeeded(None)
+
+
+def start_health_checks(datasets=None) -> threading.Thread:
+    """Checks the endpoints of every Dataset served from SPARQL each SPARQL_HEALTH_CHECK_SECONDS, in the background"""
+    if SPARQL_HEALTH_CHECK_SECONDS <= 0:
+        return None
+    import requests
+    from api.dataset import DATASETS
+    pools = [
+        x.endpoints for x in (datasets if datasets is not None else DATASETS)
+        if x.local_file is None and x.snapshot_file is None and x.sqlite_file is None
+    ]
+
+    def run():
+        session = requests.Session()
+        while True:
+            for pool in pools:
+                pool.check(session)
+            time.sleep(SPARQL_HEALTH_CHECK_SECONDS)
+
+    t = threading.Thread(target=run, name="sparql-health-checks", daemon=True)
+    t.start()
+    return t
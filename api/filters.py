@@ -0,0 +1,230 @@
+"""Filters on Features' properties: OGC API Features property queries, e.g. title=Alpha, and CQL2 text
+
+A filter is parsed into a tree of the namedtuples below, which each Backend compiles for its store, e.g. into a
+SPARQL FILTER, so that only matching Features are fetched. A comparison holds for a Feature if any of its values of
+the property satisfies it, so e.g. NOT (title = 'x') holds if none of its titles is x. Strings are compared by their
+lexical forms, so ISO 8601 dates compare correctly, and numbers numerically.
+
+The CQL2 text subset supported is: comparisons (=, <>, <, <=, >, >=) of a property with a string or a number,
+[NOT] LIKE, with % and _ wildcards, [NOT] IN (...), IS [NOT] NULL, AND, OR, NOT and parentheses, with DATE('...')
+and TIMESTAMP('...') taken as strings.
+
+The datetime parameter is a TIntersects, which holds for a Feature if any of its dcterms:date or dcterms:temporal
+values, each an ISO 8601 instant or interval, intersects the interval given.
+"""
+import re
+from collections import namedtuple
+from typing import Optional, Tuple
+
+# the Feature properties that may be queried, by name
+QUERYABLES = {
+    x: "http://purl.org/dc/terms/" + x for x in [
+        "identifier", "title", "description", "created", "modified", "issued", "date", "subject", "type", "source",
+        "creator", "publisher", "contributor", "language", "license", "rights",
+    ]
+}
+
+Comparison = namedtuple("Comparison", ["property", "operator", "value"])  # value is a str or float
+Like = namedtuple("Like", ["property", "pattern"])  # CQL2 LIKE pattern, with % and _ wildcards
+In = namedtuple("In", ["property", "values"])
+IsNull = namedtuple("IsNull", ["property"])  # the Feature has no value of the property
+And = namedtuple("And", ["items"])
+Or = namedtuple("Or", ["items"])
+Not = namedtuple("Not", ["item"])
+TIntersects = namedtuple("TIntersects", ["start", "end"])  # ISO 8601 strings, None where the interval is open
+
+# the Feature properties whose values are the Feature's times, see TIntersects
+TEMPORAL_PROPERTIES = ["http://purl.org/dc/terms/date", "http://purl.org/dc/terms/temporal"]
+
+TOKENS = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^']|'')*')
+        |(?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+        |(?P<operator><>|<=|>=|=|<|>)
+        |(?P<punctuation>[(),])
+        |(?P<word>[A-Za-z_][A-Za-z0-9_:.\-]*|"[^"]+")
+    )""", re.VERBOSE)
+KEYWORDS = ["AND", "OR", "NOT", "LIKE", "IN", "IS", "NULL"]
+
+
+class FilterError(ValueError):
+    """Raised when a filter cannot be parsed or uses a property that is not queryable"""
+    pass
+
+
+def queryable(name: str) -> str:
+    """The URI of a queryable property, raising a FilterError if it is not one"""
+    if name not in QUERYABLES:
+        raise FilterError(
+            "'{}' is not a queryable property. You may only use one of '{}'".format(name, "', '".join(QUERYABLES)))
+    return QUERYABLES[name]
+
+
+def temporal_interval(value: str) -> Tuple[Optional[str], Optional[str]]:
+    """The (start, end) of an ISO 8601 instant, e.g. 2001-05-01, or interval, e.g. 2001-05-01/2010, where '..' or an
+    empty part means the interval is open"""
+    parts = value.strip().split("/")
+    if len(parts) == 1:
+        return parts[0], parts[0]
+    start, end = parts[0], parts[1]
+    return start if start not in ["", ".."] else None, end if end not in ["", ".."] else None
+
+
+def intervals_intersect(interval: Tuple[Optional[str], Optional[str]], start: Optional[str], end: Optional[str]):
+    """Whether interval intersects the interval from start to end. Times are compared as ISO 8601 strings, each
+    covering the whole of its period, so e.g. 2001 intersects 2001-05-01"""
+    return (interval[0] is None or end is None or interval[0][:len(end)] <= end) and \
+        (interval[1] is None or start is None or interval[1] >= start[:len(interval[1])])
+
+
+def _tokens(text: str) -> list:
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        m = TOKENS.match(text, position)
+        if m is None or m.end() == position:
+            raise FilterError("The filter could not be parsed at '{}'".format(text[position:].strip()[:20]))
+        position = m.end()
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == "string":
+            value = value[1:-1].replace("''", "'")
+        elif kind == "number":
+            value = float(value)
+        elif kind == "word":
+            if value.startswith('"'):
+                value = value[1:-1]
+            elif value.upper() in KEYWORDS:
+                kind, value = "keyword", value.upper()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser(object):
+    """A recursive descent parser of the CQL2 text subset"""
+    def __init__(self, text: str):
+        self.tokens = _tokens(text)
+        self.position = 0
+
+    def peek(self, kind: str = None, value=None) -> bool:
+        if self.position >= len(self.tokens):
+            return False
+        token = self.tokens[self.position]
+        return (kind is None or token[0] == kind) and (value is None or token[1] == value)
+
+    def take(self, kind: str = None, value=None):
+        if not self.peek(kind, value):
+            found = "'{}'".format(self.tokens[self.position][1]) if self.position < len(self.tokens) else "the end"
+            raise FilterError("The filter could not be parsed: expected {} but found {}".format(
+                value if value is not None else "a " + kind, found))
+        self.position += 1
+        return self.tokens[self.position - 1][1]
+
+    def parse(self):
+        tree = self.disjunction()
+        if self.position < len(self.tokens):
+            raise FilterError("The filter could not be parsed at '{}'".format(self.tokens[self.position][1]))
+        return tree
+
+    def disjunction(self):
+        items = [self.conjunction()]
+        while self.peek("keyword", "OR"):
+            self.take()
+            items.append(self.conjunction())
+        return items[0] if len(items) == 1 else Or(tuple(items))
+
+    def conjunction(self):
+        items = [self.negation()]
+        while self.peek("keyword", "AND"):
+            self.take()
+            items.append(self.negation())
+        return items[0] if len(items) == 1 else And(tuple(items))
+
+    def negation(self):
+        if self.peek("keyword", "NOT"):
+            self.take()
+            return Not(self.negation())
+        if self.peek("punctuation", "("):
+            self.take()
+            tree = self.disjunction()
+            self.take("punctuation", ")")
+            return tree
+        return self.predicate()
+
+    def literal(self):
+        if self.peek("string") or self.peek("number"):
+            return self.take()
+        if self.peek("word") and self.tokens[self.position][1].upper() in ["DATE", "TIMESTAMP"]:
+            # compared by its lexical form, as ISO 8601 strings are
+            self.take()
+            self.take("punctuation", "(")
+            value = self.take("string")
+            self.take("punctuation", ")")
+            return value
+        return self.take("string")
+
+    def predicate(self):
+        name = self.take("word")
+        uri = queryable(name)
+        if self.peek("operator"):
+            return Comparison(uri, self.take(), self.literal())
+        if self.peek("keyword", "IS"):
+            self.take()
+            negated = self.peek("keyword", "NOT")
+            if negated:
+                self.take()
+            self.take("keyword", "NULL")
+            return Not(IsNull(uri)) if negated else IsNull(uri)
+        negated = self.peek("keyword", "NOT")
+        if negated:
+            self.take()
+        if self.peek("keyword", "LIKE"):
+            self.take()
+            tree = Like(uri, self.take("string"))
+        else:
+            self.take("keyword", "IN")
+            self.take("punctuation", "(")
+            values = [self.literal()]
+            while self.peek("punctuation", ","):
+                self.take()
+                values.append(self.literal())
+            self.take("punctuation", ")")
+            tree = In(uri, tuple(values))
+        return Not(tree) if negated else tree
+
+
+def parse_cql2_text(text: str):
+    """The filter tree of a CQL2 text expression, raising a FilterError if it is not in the supported subset"""
+    return _Parser(text).parse()
+
+
+def to_text(tree) -> str:
+    """A filter tree as normalised CQL2 text, e.g. for cache keys and for display"""
+    def literal(value):
+        return repr(value) if isinstance(value, float) else "'{}'".format(value.replace("'", "''"))
+
+    def name(uri):
+        return next(k for k, v in QUERYABLES.items() if v == uri)
+
+    if isinstance(tree, Comparison):
+        return "{} {} {}".format(name(tree.property), tree.operator, literal(tree.value))
+    if isinstance(tree, Like):
+        return "{} LIKE {}".format(name(tree.property), literal(tree.pattern))
+    if isinstance(tree, In):
+        return "{} IN ({})".format(name(tree.property), ", ".join(literal(x) for x in tree.values))
+    if isinstance(tree, IsNull):
+        return "{} IS NULL".format(name(tree.property))
+    if isinstance(tree, TIntersects):
+        return "T_INTERSECTS(datetime, INTERVAL({}, {}))".format(
+            *(literal(x) if x is not None else "'..'" for x in [tree.start, tree.end]))
+    if isinstance(tree, Not):
+        return "NOT ({})".format(to_text(tree.item))
+    return "({})".format(" {} ".format("AND" if isinstance(tree, And) else "OR").join(to_text(x) for x in tree.items))
+
+
+def like_regex(pattern: str) -> str:
+    """A CQL2 LIKE pattern as an anchored regular expression"""
+    return "^" + "".join(
+        ".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern
+    ) + "$"
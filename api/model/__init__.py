@@ -5,3 +5,5 @@ from api.model.collections import CollectionsRenderer
 from api.model.collection import Collection, CollectionRenderer
 from api.model.features import FeaturesRenderer
 from api.model.feature import Feature, FeatureRenderer, Geometry, GeometryRole, CRS
+from api.model.tiles import get_tile, valid_tile, MVT_MEDIATYPE
+from api.model.aggregation import AggregationRenderer
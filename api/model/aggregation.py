@@ -0,0 +1,183 @@
+import re
+from typing import List
+from api.model.profiles import *
+from api.model.parameters import QueryParameters, ParameterError, PROFILE_PARAMS, int_parameter
+from api.config import *
+from api.dataset import current_dataset
+from api.cache import cache
+from api.backend import DGGS
+from api.model.link import *
+import json
+from flask import Response, render_template
+
+# the Cell IDs in a DGGS literal, e.g. R1234 & R124 in "<https://w3id.org/dggs/tb16pix> POLYGON ((R1234 R124))"
+DGGS_CELL_ID = re.compile(r"\b([A-Z])([0-8]*)\b")
+CHILDREN = 9  # TB16Pix cells have 3 x 3 children
+
+
+def cell_index(face: str, digits: str) -> int:
+    """The index of a cell among all cells of its resolution: face * 9^resolution + its digits read in base 9"""
+    return (ord(face) - ord("A")) * CHILDREN ** len(digits) + (int(digits, CHILDREN) if digits != "" else 0)
+
+
+def cell_id(index: int, resolution: int) -> str:
+    face, n = divmod(int(index), CHILDREN ** resolution)
+    digits = ""
+    for i in range(resolution):
+        n, d = divmod(n, CHILDREN)
+        digits = str(d) + digits
+    return chr(ord("A") + face) + digits
+
+
+class CellAggregation(object):
+    """Per-cell Feature counts and coverage of a Collection's DGGS geometries at every resolution up to a maximum
+
+    Each Feature's cells are first placed at the finest resolution, coarser cells being expanded to their descendants
+    and finer ones truncated to their ancestor with a fractional coverage. Coarser resolutions are then rolled up
+    from the one below by integer division of the cell indices, so every resolution is precomputed as three sorted
+    arrays: cell indices, distinct Feature counts and the fraction of each cell covered (0 - 1).
+    """
+    __slots__ = ("max_resolution", "levels")
+
+    def __init__(self, collection_uri: str):
+        import numpy
+
+        features = {}
+        native = []  # (feature number, face, digits)
+        for uri, _, dggs in current_dataset().backend.geometries(collection_uri=collection_uri, kinds=(DGGS,)):
+            f = features.setdefault(uri, len(features))
+            if dggs.startswith("<"):
+                dggs = dggs[dggs.index(">") + 1:]
+            for face, digits in DGGS_CELL_ID.findall(dggs):
+                native.append((f, face, digits))
+
+        finest = max([len(x[2]) for x in native], default=0)
+        self.max_resolution = min(finest, DGGS_AGGREGATION_MAX_RESOLUTION)
+
+        cells = []
+        feats = []
+        weights = []
+        for f, face, digits in native:
+            if len(digits) >= self.max_resolution:
+                cells.append(numpy.array([cell_index(face, digits[:self.max_resolution])], dtype=numpy.int64))
+                weights.append(numpy.array([float(CHILDREN) ** (self.max_resolution - len(digits))]))
+            else:
+                n = CHILDREN ** (self.max_resolution - len(digits))
+                cells.append(cell_index(face, digits) * n + numpy.arange(n, dtype=numpy.int64))
+                weights.append(numpy.ones(n))
+            feats.append(numpy.full(len(cells[-1]), f, dtype=numpy.int64))
+
+        cells = numpy.concatenate(cells) if len(cells) > 0 else numpy.zeros(0, dtype=numpy.int64)
+        feats = numpy.concatenate(feats) if len(feats) > 0 else numpy.zeros(0, dtype=numpy.int64)
+        weights = numpy.concatenate(weights) if len(weights) > 0 else numpy.zeros(0)
+
+        # finest resolution, coverage capped at the whole cell where Features overlap
+        level_cells, inverse = numpy.unique(cells, return_inverse=True)
+        coverage = numpy.minimum(numpy.bincount(inverse, weights=weights, minlength=len(level_cells)), 1.0)
+        pairs = numpy.unique(numpy.column_stack((cells, feats)), axis=0)
+
+        self.levels = [None] * (self.max_resolution + 1)
+        for resolution in range(self.max_resolution, -1, -1):
+            counts = numpy.bincount(
+                numpy.searchsorted(level_cells, pairs[:, 0]), minlength=len(level_cells)
+            )
+            self.levels[resolution] = (level_cells, counts, coverage)
+
+            # roll up to the parent resolution
+            parent_cells, inverse = numpy.unique(level_cells // CHILDREN, return_inverse=True)
+            coverage = numpy.bincount(inverse, weights=coverage / CHILDREN, minlength=len(parent_cells))
+            level_cells = parent_cells
+            pairs = numpy.unique(numpy.column_stack((pairs[:, 0] // CHILDREN, pairs[:, 1])), axis=0)
+
+    def cells(self, resolution: int):
+        """(cell ID, Feature count, coverage) for every cell at a resolution that any Feature touches"""
+        level_cells, counts, coverage = self.levels[resolution]
+        return [
+            (cell_id(c, resolution), int(n), round(float(v), 6))
+            for c, n, v in zip(level_cells, counts, coverage)
+        ]
+
+
+def get_cell_aggregation(collection_uri: str) -> CellAggregation:
+    return cache.get_or_load(("aggregation", str(collection_uri)), lambda: CellAggregation(collection_uri))
+
+
+def invalidate_cell_aggregation(collection_uri: str = None):
+    """Drops the cached aggregation of a Collection, or of all Collections, after their Features change"""
+    if collection_uri is None:
+        cache.invalidate("aggregation")
+    else:
+        cache.invalidate("aggregation", str(collection_uri))
+
+
+class AggregationRenderer(Renderer):
+    def __init__(self, request, collection, other_links: List[Link] = None):
+        self.collection = collection
+        self.links = []
+        if other_links is not None:
+            self.links.extend(other_links)
+
+        super().__init__(
+            request,
+            current_dataset().landing_page_url + "/collections/" + self.collection.identifier + "/aggregation",
+            profiles={"oai": profile_openapi},
+            default_profile_token="oai"
+        )
+
+        self.ALLOWED_PARAMS = PROFILE_PARAMS + ["resolution"]
+        try:
+            QueryParameters({k: v for k, v in request.values.items() if k != "resolution"}, self.ALLOWED_PARAMS)
+            self.aggregation = get_cell_aggregation(self.collection.uri)
+            self.resolution = int_parameter(
+                request.values, "resolution", None, minimum=0, maximum=self.aggregation.max_resolution)
+            if self.resolution is None:
+                raise ParameterError(
+                    "You must supply a 'resolution' parameter between 0 and {}".format(self.aggregation.max_resolution))
+            self.valid = True, None
+        except ParameterError as e:
+            self.valid = False, str(e)
+
+    def render(self):
+        # return without rendering anything if there is an error with the parameters
+        if not self.valid[0]:
+            return Response(self.valid[1], status=400, mimetype="text/plain")
+
+        # try returning alt profile
+        response = super().render()
+        if response is not None:
+            return response
+        elif self.profile == "oai":
+            if self.mediatype in [MediaType.JSON.value, MediaType.GEOJSON.value]:
+                return self._render_oai_json()
+            else:
+                return self._render_oai_html()
+
+    def _render_oai_json(self):
+        page_json = {
+            "links": [x.to_dict() for x in self.links],
+            "collection": self.collection.identifier,
+            "resolution": self.resolution,
+            "cells": [
+                {"id": c, "count": n, "coverage": v} for c, n, v in self.aggregation.cells(self.resolution)
+            ],
+        }
+
+        return Response(
+            json.dumps(page_json),
+            mimetype=str(MediaType.JSON.value),
+            headers=self.headers,
+        )
+
+    def _render_oai_html(self):
+        _template_context = {
+            "links": self.links,
+            "collection": self.collection,
+            "resolution": self.resolution,
+            "max_resolution": self.aggregation.max_resolution,
+            "cells": self.aggregation.cells(self.resolution),
+        }
+
+        return Response(
+            render_template("aggregation.html", **_template_context),
+            headers=self.headers,
+        )
@@ -2,6 +2,7 @@ from api.model.link import *
 from flask import Response, render_template
 from api.model.profiles import *
 from api.config import *
+from api.dataset import current_dataset
 import json
 
 
@@ -87,7 +88,7 @@ class ApiDescRenderer(Renderer):
         """
         self.paths = {}
         for rule in paths.iter_rules():
-            self.paths[LANDING_PAGE_URL + "/" + rule.endpoint] = {
+            self.paths[current_dataset().landing_page_url + "/" + rule.endpoint] = {
                 "get": {
                     "description": "Returns all pets from the system that the user has access to",
                     "operationId": "findPets",
@@ -114,7 +115,7 @@ class ApiDescRenderer(Renderer):
                 ]
             }
 
-        super().__init__(request, LANDING_PAGE_URL + "/api", {"oai": profile_openapi}, "oai")
+        super().__init__(request, current_dataset().landing_page_url + "/api", {"oai": profile_openapi}, "oai")
 
     def render(self):
         # try returning alt profile
@@ -163,9 +164,9 @@ class ApiDescRenderer(Renderer):
         """
         page_json = {
             "swagger": "2.0",
-            "basePath": LANDING_PAGE_URL + "/api",
+            "basePath": current_dataset().landing_page_url + "/api",
             "info": {
-                "title": API_TITLE,
+                "title": current_dataset().title,
                 "version": VERSION
             },
             "paths": self.paths,
@@ -179,7 +180,7 @@ class ApiDescRenderer(Renderer):
 
     def _render_oai_html(self):
         _template_context = {
-            "uri": LANDING_PAGE_URL + "/api",
+            "uri": current_dataset().landing_page_url + "/api",
         }
 
         return Response(
@@ -1,59 +1,100 @@
-from typing import List, Union
+from typing import List, Optional, Union
 from api.model.profiles import *
+from api.model.parameters import QueryParameters, ParameterError
 from api.config import *
+from api.dataset import current_dataset
 from api.model.link import *
+from api.model.record import Record, lazy
+from api.model.columnar import FeatureColumns
+from api.model.spatial_object import SpatialExtent, TemporalExtent, get_collection_extents
 import json
 from flask import Response, render_template
-import markdown
 from rdflib import URIRef, Literal
 from rdflib.namespace import DCTERMS, RDF
 
 
-class Collection(object):
+class Collection(Record):
+    __slots__ = (
+        "uri",
+        "identifier",
+        "title",
+        "links",
+        "_description_source",
+        "_description",
+        "_feature_count",
+    )
+
     def __init__(
             self,
             uri: Union[str, URIRef],
             other_links: List[Link] = None,
+            identifier: str = None,
+            title: str = None,
+            description: str = None,
     ):
-        self.uri = uri if type(uri) == str else str(uri)
-        g = get_graph()
-        # Feature properties
-        self.description = None
-        for p, o in g.predicate_objects(subject=URIRef(self.uri)):
-            if p == DCTERMS.title:
-                self.title = str(o)
-            elif p == DCTERMS.identifier:
-                self.identifier = str(o)
-            elif p == DCTERMS.description:
-                self.description = markdown.markdown(str(o))
-
-        # Collection other properties
-        self.extent_spatial = None
-        self.extent_temporal = None
-        self.links = [
-            Link(LANDING_PAGE_URL + "/collections/" + self.identifier + "/items",
+        """If identifier is given, the Collection's properties are taken from the arguments rather than the store"""
+        uri = uri if type(uri) == str else str(uri)
+        if identifier is None:
+            row = current_dataset().backend.collection(uri)
+            if row is not None:
+                identifier, title, description = row.identifier, row.title, row.description
+
+        links = [
+            Link(current_dataset().landing_page_url + "/collections/" + identifier + "/items",
                  rel=RelType.ITEMS.value,
                  type=MediaType.GEOJSON.value,
-                 title=self.title)
+                 title=title)
         ]
         if other_links is not None:
-            self.links.extend(other_links)
+            links.extend(other_links)
+
+        self._set(
+            uri=uri,
+            identifier=identifier,
+            title=title,
+            _description_source=description,
+            links=tuple(links),
+        )
 
-        self.feature_count = 0
-        for s in g.subjects(predicate=DCTERMS.isPartOf, object=URIRef(self.uri)):
-            self.feature_count += 1
+    @lazy
+    def description(self):
+        """The Collection's description, rendered from Markdown to HTML"""
+        import markdown
+        return markdown.markdown(self._description_source) if self._description_source is not None else None
 
-    def to_dict(self):
-        self.links = [x.__dict__ for x in self.links]
+    @property
+    def extent_spatial(self) -> Optional[SpatialExtent]:
+        return get_collection_extents(self.uri)[0]
 
-        delattr(self, "feature_count")  # this attribute is for internal use only and can be misleading if communicated
-        return self.__dict__
+    @property
+    def extent_temporal(self) -> Optional[TemporalExtent]:
+        return get_collection_extents(self.uri)[1]
 
-    def to_geo_json_dict(self):
-        self.links = [x.__dict__ for x in self.links]
+    def extent_dict(self):
+        extent = {}
+        if self.extent_spatial is not None:
+            extent["spatial"] = self.extent_spatial.to_dict()
+        if self.extent_temporal is not None:
+            extent["temporal"] = self.extent_temporal.to_dict()
+        return extent
+
+    @lazy
+    def feature_count(self):
+        return current_dataset().backend.member_count(self.uri)
+
+    def to_dict(self):
+        # feature_count is for internal use only and can be misleading if communicated so is not included
+        return {
+            "uri": self.uri,
+            "description": self.description,
+            "title": self.title,
+            "identifier": self.identifier,
+            "extent": self.extent_dict(),
+            "links": [x.to_dict() for x in self.links],
+        }
 
-        delattr(self, "feature_count")  # this attribute is for internal use only and can be misleading if communicated
-        return self.__dict__
+    def to_geo_json_dict(self):
+        return self.to_dict()
 
     def to_geosp_graph(self):
         g = Graph()
@@ -95,13 +136,13 @@ class CollectionRenderer(Renderer):
         self.collection = Collection(collection_uri)
         self.links = [
             Link(
-                LANDING_PAGE_URL + "/collections.json",
+                current_dataset().landing_page_url + "/collections.json",
                 rel=RelType.SELF.value,
                 type=MediaType.JSON.value,
                 title="This Document"
             ),
             Link(
-                LANDING_PAGE_URL + "/collections.html",
+                current_dataset().landing_page_url + "/collections.html",
                 rel=RelType.SELF.value,
                 type=MediaType.HTML.value,
                 title="This Document in HTML"
@@ -112,17 +153,18 @@ class CollectionRenderer(Renderer):
 
         super().__init__(
             request,
-            LANDING_PAGE_URL + "/collection/" + self.collection.identifier,
-            profiles={"oai": profile_openapi},
+            current_dataset().landing_page_url + "/collection/" + self.collection.identifier,
+            profiles={"oai": profile_openapi_features},
             default_profile_token="oai"
         )
 
         self.ALLOWED_PARAMS = ["_profile", "_mediatype"]
 
     def render(self):
-        for v in self.request.values.items():
-            if v[0] not in self.ALLOWED_PARAMS:
-                return Response("The parameter {} you supplied is not allowed".format(v[0]), status=400)
+        try:
+            QueryParameters(self.request.values, self.ALLOWED_PARAMS)
+        except ParameterError as e:
+            return Response(str(e), status=400, mimetype="text/plain")
 
         # try returning alt profile
         response = super().render()
@@ -131,12 +173,14 @@ class CollectionRenderer(Renderer):
         elif self.profile == "oai":
             if self.mediatype == MediaType.JSON.value:
                 return self._render_oai_json()
+            elif self.mediatype in [MediaType.FLATGEOBUF.value, MediaType.GEOPARQUET.value]:
+                return self._render_oai_binary()
             else:
                 return self._render_oai_html()
 
     def _render_oai_json(self):
         page_json = {
-            "links": [x.__dict__ for x in self.links],
+            "links": [x.to_dict() for x in self.links],
             "collection": self.collection.to_dict()
         }
 
@@ -146,6 +190,20 @@ class CollectionRenderer(Renderer):
             headers=self.headers,
         )
 
+    def _render_oai_binary(self):
+        # all of this Collection's Features, as columns
+        columns = FeatureColumns.load(collection_uri=self.collection.uri)
+        if self.mediatype == MediaType.FLATGEOBUF.value:
+            content = columns.to_flatgeobuf()
+        else:
+            content = columns.to_geoparquet()
+
+        return Response(
+            content,
+            mimetype=self.mediatype,
+            headers=self.headers,
+        )
+
     def _render_oai_html(self):
         _template_context = {
             "links": self.links,
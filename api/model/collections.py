@@ -1,47 +1,40 @@
 from pyldapi import ContainerRenderer
 from typing import List
 from api.model.profiles import *
+from api.model.parameters import QueryParameters, ParameterError, PROFILE_PARAMS, PAGING_PARAMS
 from api.model.collection import Collection
 from api.config import *
+from api.dataset import current_dataset
+from api.search import search
 from api.model.link import *
 import json
 from flask import Response, render_template
 from flask_paginate import Pagination
-from rdflib import URIRef
-from rdflib.namespace import DCTERMS, RDF
 
 
 class Collections:
-    def __init__(self):
-        self.collections = []
-        g = get_graph()
-        for s in g.subjects(predicate=RDF.type, object=OGCAPI.Collection):
-            if (s, DCTERMS.isPartOf, URIRef(DATASET_URI)) in g:
-                identifier = None
-                title = None
-                description = None
-                for p, o in g.predicate_objects(subject=s):
-                    if p == DCTERMS.identifier:
-                        identifier = str(o)
-                    elif p == DCTERMS.title:
-                        title = str(o)
-                    elif p == DCTERMS.description:
-                        description = str(o)
-
-                self.collections.append(Collection(s))
+    def __init__(self, q: str = None):
+        """All of the Dataset's Collections or, given q, those matching it, best first, see api.search"""
+        self.collections = [
+            Collection(x.uri, identifier=x.identifier, title=x.title, description=x.description)
+            for x in current_dataset().backend.collections()
+        ]
+        if q is not None:
+            by_uri = {x.uri: x for x in self.collections}
+            self.collections = [by_uri[x] for x in search(q, current_dataset().dataset_uri) if x in by_uri]
 
 
 class CollectionsRenderer(ContainerRenderer):
     def __init__(self, request, other_links: List[Link] = None):
         self.links = [
             Link(
-                LANDING_PAGE_URL + "/collections.json",
+                current_dataset().landing_page_url + "/collections.json",
                 rel=RelType.SELF.value,
                 type=MediaType.JSON.value,
                 title="This Document"
             ),
             Link(
-                LANDING_PAGE_URL + "/collections.html",
+                current_dataset().landing_page_url + "/collections.html",
                 rel=RelType.SELF.value,
                 type=MediaType.HTML.value,
                 title="This Document in HTML"
@@ -50,50 +43,40 @@ class CollectionsRenderer(ContainerRenderer):
         if other_links is not None:
             self.links.extend(other_links)
 
-        self.page = (
-            int(request.values.get("page")) if request.values.get("page") is not None else 1
-        )
-        self.per_page = (
-            int(request.values.get("per_page"))
-            if request.values.get("per_page") is not None
-            else 20
-        )
-        # limit
-        limit = int(request.values.get("limit")) if request.values.get("limit") is not None else None
+        self.ALLOWED_PARAMS = PROFILE_PARAMS + PAGING_PARAMS + ["q"]
+        try:
+            self.parameters = QueryParameters(request.values, self.ALLOWED_PARAMS)
+            self.valid = True, None
+        except ParameterError as e:
+            self.valid = False, str(e)
+            return
 
-        # if limit is set, ignore page & per_page
-        if limit is not None:
-            self.start = 0
-            self.end = limit
-        else:
-            # generate list for requested page and per_page
-            self.start = (self.page - 1) * self.per_page
-            self.end = self.start + self.per_page
+        self.page = self.parameters.page
+        self.per_page = self.parameters.per_page
+        self.start = self.parameters.start
+        self.end = self.parameters.end
 
-        self.collections = Collections().collections
+        self.collections = Collections(self.parameters.q).collections
         self.collections_count = len(self.collections)
-        requested_collections = self.collections[self.start:self.end]
+        self.requested_collections = self.collections[self.start:self.end]
 
-        print(self.collections)
         super().__init__(
             request,
-            LANDING_PAGE_URL + "/collections",
+            current_dataset().landing_page_url + "/collections",
             "Collections",
             "The Collections of Features delivered by this OGC API instance",
             None,
             None,
-            [(LANDING_PAGE_URL + "/collections/" + x.identifier, x.title) for x in requested_collections],
+            [(current_dataset().landing_page_url + "/collections/" + x.identifier, x.title) for x in self.requested_collections],
             self.collections_count,
             profiles={"oai": profile_openapi},
             default_profile_token="oai"
         )
 
-        self.ALLOWED_PARAMS = ["_profile", "_view", "_mediatype", "_format", "page", "per_page", "limit", "bbox"]
-
     def render(self):
-        for v in self.request.values.items():
-            if v[0] not in self.ALLOWED_PARAMS:
-                return Response("The parameter {} you supplied is not allowed".format(v[0]), status=400)
+        # return without rendering anything if there is an error with the parameters
+        if not self.valid[0]:
+            return Response(self.valid[1], status=400, mimetype="text/plain")
 
         # try returning alt profile
         response = super().render()
@@ -106,18 +89,9 @@ class CollectionsRenderer(ContainerRenderer):
                 return self._render_oai_html()
 
     def _render_oai_json(self):
-        collection_dicts = [
-            {
-                "uri": x[0],
-                "id": x[1],
-                "title": x[2],
-                "description": x[3]
-            } for x in self.collections
-        ]
-
         page_json = {
-            "links": [x.__dict__ for x in self.links],
-            "collections": collection_dicts
+            "links": [x.to_dict() for x in self.links],
+            "collections": [x.to_dict() for x in self.requested_collections]
         }
 
         return Response(
@@ -132,7 +106,8 @@ class CollectionsRenderer(ContainerRenderer):
         _template_context = {
             "links": self.links,
             "collections": self.members,
-            "pagination": pagination
+            "pagination": pagination,
+            "q": self.parameters.q,
         }
 
         return Response(
@@ -0,0 +1,243 @@
+import io
+import json
+import struct
+from typing import List, Tuple
+from api.dataset import current_dataset
+from api.model.geojson import wkts_to_geojson
+from geomet import wkb
+
+# FlatGeobuf (https://flatgeobuf.org) enumerations and magic bytes, from its header.fbs & feature.fbs schemas
+FGB_MAGIC = b"fgb\x03fgb\x00"
+FGB_GEOMETRY_TYPES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+    "GeometryCollection": 7,
+}
+FGB_COLUMN_TYPE_STRING = 11
+
+# the non-geometry columns of a batch, in order, the last two of which may be left out
+COLUMNS = ["uri", "identifier", "title", "description"]
+# the number of Features described per query when loading a batch with geometries
+DESCRIBE_BATCH = 500
+
+
+def _xy(coordinates) -> List[float]:
+    """Flattens a list of points to [x0, y0, x1, y1, ...], dropping any Z or M values"""
+    xy = []
+    for point in coordinates:
+        xy.append(point[0])
+        xy.append(point[1])
+    return xy
+
+
+class FeatureColumns(object):
+    """A batch of Features held as columns, for encoding to binary, columnar formats
+
+    Geometries are the Features' WGS84 geometries as GeoJSON geometry dicts, or None for Features that have none.
+    """
+    __slots__ = ("uri", "identifier", "title", "description", "geometry", "columns")
+
+    def __init__(self, rows, columns: List[str] = None):
+        """rows are (uri, identifier, title, description, wkt) tuples. columns, of COLUMNS, are those to encode"""
+        self.columns = columns if columns is not None else COLUMNS
+        self.uri = []
+        self.identifier = []
+        self.title = []
+        self.description = []
+        wkts = []
+        for row in rows:
+            self.uri.append(row[0])
+            self.identifier.append(row[1])
+            self.title.append(row[2])
+            self.description.append(row[3])
+            wkts.append(row[4])
+        self.geometry = wkts_to_geojson(wkts, rewound=False)
+
+    @classmethod
+    def load(
+            cls,
+            feature_uris: List[str] = None,
+            collection_uri: str = None,
+            properties: Tuple[str, ...] = None,
+            skip_geometry: bool = False
+    ):
+        """Loads the listed Features, e.g. a page, or all of a Collection's Features, described with their geometries
+        DESCRIBE_BATCH at a time. Each Feature's geometry is the one its GeoJSON has, the first WGS84 geometry of
+        ordered_geometries(). Only the properties, title & description, listed in properties, if given, are loaded,
+        and no geometries if skip_geometry, in which case the Features are loaded in one batch"""
+        from api.model.feature import CRS, ordered_geometries
+
+        backend = current_dataset().backend
+        columns = [x for x in COLUMNS if x in ["uri", "identifier"] or properties is None or x in properties]
+        if feature_uris is not None:
+            feature_uris = [str(x) for x in feature_uris]
+        if skip_geometry:
+            return cls((tuple(x[:4]) + (None,) for x in backend.features(feature_uris, collection_uri, properties)),
+                       columns)
+
+        if feature_uris is None:
+            feature_uris = backend.members(collection_uri)
+        rows = []
+        for i in range(0, len(feature_uris), DESCRIBE_BATCH):
+            for described in backend.describe_features(feature_uris[i:i + DESCRIBE_BATCH], properties):
+                wgs84 = [x for x in ordered_geometries(described.geometries) if x.crs == CRS.WGS84]
+                rows.append(tuple(described.feature[:4]) + (wgs84[0].coordinates if len(wgs84) > 0 else None,))
+        return cls(rows, columns)
+
+    def __len__(self):
+        return len(self.uri)
+
+    def to_geoparquet(self) -> bytes:
+        """Encodes this batch as GeoParquet: WKB geometries plus a string column per property"""
+        import pyarrow
+        import pyarrow.parquet
+
+        geometry_types = sorted(set(g["type"] for g in self.geometry if g is not None))
+        geo = {
+            "version": "1.0.0",
+            "primary_column": "geometry",
+            "columns": {
+                # no "crs" member means OGC:CRS84, i.e. WGS84 long/lat
+                "geometry": {"encoding": "WKB", "geometry_types": geometry_types}
+            },
+        }
+        columns = {k: pyarrow.array(getattr(self, k), type=pyarrow.string()) for k in self.columns}
+        columns["geometry"] = pyarrow.array(
+            [wkb.dumps(g) if g is not None else None for g in self.geometry], type=pyarrow.binary())
+        table = pyarrow.table(columns)
+        table = table.replace_schema_metadata({b"geo": json.dumps(geo).encode()})
+        out = io.BytesIO()
+        pyarrow.parquet.write_table(table, out)
+        return out.getvalue()
+
+    def to_flatgeobuf(self) -> bytes:
+        """Encodes this batch as FlatGeobuf, without a spatial index, in the order of the batch"""
+        import flatbuffers
+        import numpy
+
+        geometry_types = set(g["type"] for g in self.geometry if g is not None)
+        geometry_type = FGB_GEOMETRY_TYPES[geometry_types.pop()] if len(geometry_types) == 1 else 0  # 0: Unknown
+
+        out = io.BytesIO()
+        out.write(FGB_MAGIC)
+
+        envelope = [numpy.inf, numpy.inf, -numpy.inf, -numpy.inf]
+        features = []
+        for i in range(len(self)):
+            b = flatbuffers.Builder(1024)
+            geometry = _fgb_geometry(b, self.geometry[i], envelope) if self.geometry[i] is not None else None
+            properties = b.CreateByteVector(self._fgb_properties(i))
+            b.StartObject(3)
+            if geometry is not None:
+                b.PrependUOffsetTRelativeSlot(0, geometry, 0)
+            b.PrependUOffsetTRelativeSlot(1, properties, 0)
+            b.FinishSizePrefixed(b.EndObject())
+            features.append(b.Output())
+
+        out.write(self._fgb_header(geometry_type, envelope))
+        for feature in features:
+            out.write(feature)
+        return out.getvalue()
+
+    def _fgb_header(self, geometry_type: int, envelope: List[float]) -> bytes:
+        import flatbuffers
+        import numpy
+
+        b = flatbuffers.Builder(1024)
+        columns = []
+        for name in self.columns:
+            column_name = b.CreateString(name)
+            b.StartObject(11)
+            b.PrependUOffsetTRelativeSlot(0, column_name, 0)
+            b.PrependUint8Slot(1, FGB_COLUMN_TYPE_STRING, 0)
+            columns.append(b.EndObject())
+        b.StartVector(4, len(columns), 4)
+        for column in reversed(columns):
+            b.PrependUOffsetTRelative(column)
+        columns = b.EndVector()
+
+        crs_org = b.CreateString("EPSG")
+        b.StartObject(6)
+        b.PrependUOffsetTRelativeSlot(0, crs_org, 0)
+        b.PrependInt32Slot(1, 4326, 0)
+        crs = b.EndObject()
+
+        envelope_vector = None
+        if numpy.isfinite(envelope).all():
+            envelope_vector = b.CreateNumpyVector(numpy.array(envelope, dtype=numpy.float64))
+
+        b.StartObject(14)
+        if envelope_vector is not None:
+            b.PrependUOffsetTRelativeSlot(1, envelope_vector, 0)
+        b.PrependUint8Slot(2, geometry_type, 0)
+        b.PrependUOffsetTRelativeSlot(7, columns, 0)
+        b.PrependUint64Slot(8, len(self), 0)
+        b.PrependUint16Slot(9, 0, 16)  # no spatial index
+        b.PrependUOffsetTRelativeSlot(10, crs, 0)
+        b.FinishSizePrefixed(b.EndObject())
+        return b.Output()
+
+    def _fgb_properties(self, i: int) -> bytes:
+        # each present value as its little-endian ushort column index then, for strings, a uint length and UTF-8
+        properties = b""
+        for n, name in enumerate(self.columns):
+            value = getattr(self, name)[i]
+            if value is not None:
+                value = value.encode("utf-8")
+                properties += struct.pack("<HI", n, len(value)) + value
+        return properties
+
+
+def _fgb_geometry(b, geometry: dict, envelope: List[float]) -> int:
+    """Builds a FlatGeobuf Geometry table from a GeoJSON geometry dict, widening envelope to cover it"""
+    import numpy
+
+    t = geometry["type"]
+    xy = []
+    ends = []
+    parts = []
+    if t == "Point":
+        xy = _xy([geometry["coordinates"]])
+    elif t in ["LineString", "MultiPoint"]:
+        xy = _xy(geometry["coordinates"])
+    elif t in ["Polygon", "MultiLineString"]:
+        for ring in geometry["coordinates"]:
+            xy.extend(_xy(ring))
+            ends.append(len(xy) // 2)
+        if len(ends) == 1:  # ends may be omitted if there is only one ring or line
+            ends = []
+    elif t == "MultiPolygon":
+        parts = [_fgb_geometry(b, {"type": "Polygon", "coordinates": p}, envelope) for p in geometry["coordinates"]]
+    elif t == "GeometryCollection":
+        parts = [_fgb_geometry(b, g, envelope) for g in geometry["geometries"]]
+
+    xy_vector = None
+    ends_vector = None
+    parts_vector = None
+    if len(xy) > 0:
+        envelope[0] = min(envelope[0], min(xy[0::2]))
+        envelope[1] = min(envelope[1], min(xy[1::2]))
+        envelope[2] = max(envelope[2], max(xy[0::2]))
+        envelope[3] = max(envelope[3], max(xy[1::2]))
+        xy_vector = b.CreateNumpyVector(numpy.array(xy, dtype=numpy.float64))
+    if len(ends) > 0:
+        ends_vector = b.CreateNumpyVector(numpy.array(ends, dtype=numpy.uint32))
+    if len(parts) > 0:
+        b.StartVector(4, len(parts), 4)
+        for part in reversed(parts):
+            b.PrependUOffsetTRelative(part)
+        parts_vector = b.EndVector()
+
+    b.StartObject(8)
+    if ends_vector is not None:
+        b.PrependUOffsetTRelativeSlot(0, ends_vector, 0)
+    if xy_vector is not None:
+        b.PrependUOffsetTRelativeSlot(1, xy_vector, 0)
+    b.PrependUint8Slot(6, FGB_GEOMETRY_TYPES.get(t, 0), 0)
+    if parts_vector is not None:
+        b.PrependUOffsetTRelativeSlot(7, parts_vector, 0)
+    return b.EndObject()
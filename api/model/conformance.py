@@ -1,7 +1,9 @@
 from api.model.link import *
 from flask import Response, render_template
 from api.model.profiles import *
+from api.model.parameters import QueryParameters, ParameterError
 from api.config import *
+from api.dataset import current_dataset
 import json
 
 
@@ -13,14 +15,15 @@ class ConformanceRenderer(Renderer):
 
         self.conformance_classes = conformance_classes
 
-        super().__init__(request, LANDING_PAGE_URL + "/conformance", {"oai": profile_openapi}, "oai")
+        super().__init__(request, current_dataset().landing_page_url + "/conformance", {"oai": profile_openapi}, "oai")
 
         self.ALLOWED_PARAMS = ["_profile", "_view", "_mediatype", "_format"]
 
     def render(self):
-        for v in self.request.values.items():
-            if v[0] not in self.ALLOWED_PARAMS:
-                return Response("The parameter {} you supplied is not allowed".format(v[0]), status=400)
+        try:
+            QueryParameters(self.request.values, self.ALLOWED_PARAMS)
+        except ParameterError as e:
+            return Response(str(e), status=400, mimetype="text/plain")
 
         # try returning alt profile
         response = super().render()
@@ -45,7 +48,7 @@ class ConformanceRenderer(Renderer):
 
     def _render_oai_html(self):
         _template_context = {
-            "uri": LANDING_PAGE_URL + "/conformance",
+            "uri": current_dataset().landing_page_url + "/conformance",
             "conformance_classes": self.conformance_classes
         }
 
@@ -1,15 +1,17 @@
-from typing import List
+from typing import List, Tuple
 from api.model.profiles import *
+from api.model.parameters import QueryParameters, ParameterError, RESPONSE_PROPERTIES, SHAPING_PARAMS
 from api.config import *
+from api.dataset import current_dataset
 from api.model.link import *
+from api.model.record import Record, lazy
 import json
 from flask import Response, render_template
 from rdflib import URIRef, Literal, BNode
-from rdflib.namespace import DCTERMS, RDF, RDFS, XSD
+from rdflib.namespace import RDF, RDFS
 from enum import Enum
-from geomet import wkt
-from geojson_rewind import rewind
-import markdown
+from api.model.geojson import wkt_to_geojson
+from api.backend import WKT, FeatureDescription, GeometryRow
 
 
 class GeometryRole(Enum):
@@ -27,12 +29,30 @@ class CRS(Enum):
     TB16PIX = "https://w3id.org/dggs/tb16pix"
 
 
-class Geometry(object):
+class Geometry(Record):
+    __slots__ = ("coordinates", "role", "label", "crs")
+
     def __init__(self, coordinates: str, role: GeometryRole, label: str, crs: CRS):
-        self.coordinates = coordinates
-        self.role = role
-        self.label = label
-        self.crs = crs
+        self._set(
+            coordinates=coordinates,
+            role=role,
+            label=label,
+            crs=crs,
+        )
+
+    @classmethod
+    def from_row(cls, row: GeometryRow) -> "Geometry":
+        """A Geometry as the store describes it, with the Boundary role, and its kind's CRS and label, by default"""
+        crs = CRS.WGS84 if row.kind == WKT else CRS.TB16PIX
+        if row.crs in [x.value for x in CRS]:
+            crs = CRS(row.crs)
+        return cls(
+            row.value,
+            GeometryRole(row.role) if row.role in [x.value for x in GeometryRole] else GeometryRole.Boundary,
+            row.label if row.label is not None else
+            "WGS84 Geometry" if crs == CRS.WGS84 else "TB16Pix Geometry",
+            crs,
+        )
 
     def to_dict(self):
         return {
@@ -45,84 +65,99 @@ class Geometry(object):
     def to_geo_json_dict(self):
         # this only works for WGS84 coordinates, no differentiation on role for now
         if self.crs == CRS.WGS84:
-            return wkt.loads(self.coordinates)
+            return wkt_to_geojson(self.coordinates, rewound=False)
         else:
             return TypeError("Only WGS84 geometries can be serialised in GeoJSON")
 
 
-class Feature(object):
+def ordered_geometries(rows: List[GeometryRow]) -> Tuple[Geometry, ...]:
+    """A Feature's Geometries, WGS84 first, then by role, so that GeoJSON gets the boundary if there is one"""
+    return tuple(sorted(
+        (Geometry.from_row(x) for x in rows),
+        key=lambda x: (x.crs != CRS.WGS84, list(GeometryRole).index(x.role))
+    ))
+
+
+class Feature(Record):
+    __slots__ = (
+        "uri",
+        "identifier",
+        "title",
+        "isPartOf",
+        "geometries",
+        "extent_spatial",
+        "extent_temporal",
+        "links",
+        "properties",
+        "_description_source",
+        "_description",
+    )
+
     def __init__(
             self,
             uri: str,
             other_links: List[Link] = None,
+            described: FeatureDescription = None,
+            properties: Tuple[str, ...] = None,
+            skip_geometry: bool = False,
     ):
-        self.uri = uri
-
-        q = """
-            PREFIX dcterms: <http://purl.org/dc/terms/>
-            PREFIX ogcapi: <https://data.surroundaustralia.com/def/ogcapi/>
-
-            SELECT ?identifier ?title ?description
-            WHERE {{
-                ?uri a ogcapi:Feature ;
-                   dcterms:isPartOf <{}> ;
-                   dcterms:identifier ?identifier ;
-                   OPTIONAL {{?uri dcterms:title ?title}}
-                   OPTIONAL {{?uri dcterms:description ?description}}
-            }}
-            """  # .format(collection_id)
-        g = get_graph()
-        # Feature properties
-        self.description = None
-        for p, o in g.predicate_objects(subject=URIRef(self.uri)):
-            if p == DCTERMS.identifier:
-                self.identifier = str(o)
-            elif p == DCTERMS.title:
-                self.title = str(o)
-            elif p == DCTERMS.description:
-                self.description = markdown.markdown(str(o))
-            elif p == DCTERMS.isPartOf:
-                self.isPartOf = str(o)
-
-        # Feature geometries
-        # out of band call for Geometries as BNodes not supported by SPARQLStore
-        q = """
-            PREFIX geo: <http://www.opengis.net/ont/geosparql#>
-            PREFIX geox: <https://linked.data.gov.au/def/geox#>
-            SELECT * 
-            WHERE {{
-                <{}>
-                    geo:hasGeometry/geo:asWKT ?g1 ;
-                    geo:hasGeometry/geox:asDGGS ?g2 .
-            }}
-            """.format(self.uri)
-        from SPARQLWrapper import SPARQLWrapper, JSON
-        sparql = SPARQLWrapper(SPARQL_ENDPOINT)
-        sparql.setQuery(q)
-        sparql.setReturnFormat(JSON)
-        ret = sparql.queryAndConvert()["results"]["bindings"]
-        self.geometries = [
-            Geometry(ret[0]["g1"]["value"], GeometryRole.Boundary, "WGS84 Geometry", CRS.WGS84),
-            Geometry(ret[0]["g2"]["value"], GeometryRole.Boundary, "TB16Pix Geometry", CRS.TB16PIX),
-        ]
-
-        # Feature other properties
-        self.extent_spatial = None
-        self.extent_temporal = None
-        self.links = [
-            Link(LANDING_PAGE_URL + "/collections/" + self.identifier + "/items",
+        """described is the Feature's FeatureDescription, if already fetched, e.g. in a batch with others. properties,
+        of RESPONSE_PROPERTIES, and skip_geometry limit what is fetched and then serialised, e.g. to leave out a long
+        description or a detailed geometry"""
+        # Feature properties and Geometries, in one round trip
+        if described is None:
+            described = next(iter(current_dataset().backend.describe_features(
+                [uri], properties=properties, geometries=not skip_geometry)), None)
+        identifier = None
+        title = None
+        description = None
+        is_part_of = None
+        geometries = ()
+        if described is not None:
+            _, identifier, title, description, is_part_of = described.feature
+            geometries = ordered_geometries(described.geometries)
+
+        links = [
+            Link(current_dataset().landing_page_url + "/collections/" + identifier + "/items",
                  rel=RelType.ITEMS.value,
                  type=MediaType.GEOJSON.value,
-                 title=self.title)
+                 title=title)
         ]
         if other_links is not None:
-            self.links.extend(other_links)
+            links.extend(other_links)
+
+        self._set(
+            uri=uri,
+            identifier=identifier,
+            title=title,
+            isPartOf=is_part_of,
+            geometries=geometries,
+            _description_source=description,
+            # Feature other properties
+            extent_spatial=None,
+            extent_temporal=None,
+            links=tuple(links),
+            properties=tuple(properties) if properties is not None else tuple(RESPONSE_PROPERTIES),
+        )
+
+    @lazy
+    def description(self):
+        """The Feature's description, rendered from Markdown to HTML"""
+        import markdown
+        return markdown.markdown(self._description_source) if self._description_source is not None else None
 
     def to_dict(self):
-        self.links = [x.__dict__ for x in self.links]
-        if self.geometries is not None:
-            self.geometries = [x.to_dict() for x in self.geometries]
-        return self.__dict__
+        return {
+            "uri": self.uri,
+            "identifier": self.identifier,
+            "title": self.title,
+            "description": self.description,
+            "isPartOf": self.isPartOf,
+            "geometries": [x.to_dict() for x in self.geometries],
+            "extent_spatial": self.extent_spatial,
+            "extent_temporal": self.extent_temporal,
+            "links": [x.to_dict() for x in self.links],
+        }
 
     def to_geo_json_dict(self):
         # this only serialises the Feature properties and WGS84 Geometries
@@ -136,19 +171,22 @@ class Feature(object):
             ]
           },
         """
-        geojson_geometry = [g.to_geo_json_dict() for g in self.geometries if g.crs == CRS.WGS84][0]  # one only
-
-        properties = {
-            "title": self.title,
-            "isPartOf": self.isPartOf
-        }
-        if self.description is not None:
+        wgs84 = [g for g in self.geometries if g.crs == CRS.WGS84]
+        geojson_geometry = wkt_to_geojson(wgs84[0].coordinates) if len(wgs84) > 0 else None  # one only
+
+        properties = {}
+        if "title" in self.properties:
+            properties["title"] = self.title
+        if "isPartOf" in self.properties:
+            properties["isPartOf"] = self.isPartOf
+        # only rendered from Markdown if it is wanted
+        if "description" in self.properties and self.description is not None:
             properties["description"] = self.description
 
         return {
             "id": self.uri,
             "type": "Feature",
-            "geometry": rewind(geojson_geometry),
+            "geometry": geojson_geometry,
             "properties": properties
         }
 
@@ -203,24 +241,35 @@ class Feature(object):
 
 class FeatureRenderer(Renderer):
     def __init__(self, request, feature_uri: str, other_links: List[Link] = None):
-        self.feature = Feature(feature_uri)
+        self.ALLOWED_PARAMS = ["_profile", "_view", "_mediatype"] + SHAPING_PARAMS
+        try:
+            self.parameters = QueryParameters(request.values, self.ALLOWED_PARAMS)
+            self.valid = True, None
+        except ParameterError as e:
+            self.parameters = None
+            self.valid = False, str(e)
+
+        if self.parameters is not None:
+            self.feature = Feature(
+                feature_uri, properties=self.parameters.properties, skip_geometry=self.parameters.skip_geometry)
+        else:
+            # only what the Renderer needs, as the response will be an error
+            self.feature = Feature(feature_uri, properties=(), skip_geometry=True)
         self.links = []
         if other_links is not None:
             self.links.extend(other_links)
 
         super().__init__(
             request,
-            LANDING_PAGE_URL + "/collections/" + self.feature.isPartOf + "/item/" + self.feature.identifier,
+            current_dataset().landing_page_url + "/collections/" + self.feature.isPartOf + "/item/" + self.feature.identifier,
             profiles={"oai": profile_openapi, "geosp": profile_geosparql},
             default_profile_token="oai"
         )
 
-        self.ALLOWED_PARAMS = ["_profile", "_view", "_mediatype"]
-
     def render(self):
-        for v in self.request.values.items():
-            if v[0] not in self.ALLOWED_PARAMS:
-                return Response("The parameter {} you supplied is not allowed".format(v[0]), status=400)
+        # return without rendering anything if there is an error with the parameters
+        if not self.valid[0]:
+            return Response(self.valid[1], status=400, mimetype="text/plain")
 
         # try returning alt profile
         response = super().render()
@@ -238,7 +287,7 @@ class FeatureRenderer(Renderer):
 
     def _render_oai_json(self):
         page_json = {
-            "links": [x.__dict__ for x in self.links],
+            "links": [x.to_dict() for x in self.links],
             "feature": self.feature.to_geo_json_dict()
         }
 
@@ -251,7 +300,7 @@ class FeatureRenderer(Renderer):
     def _render_oai_geojson(self):
         page_json = self.feature.to_geo_json_dict()
         if len(self.links) > 0:
-            page_json["links"] = [x.__dict__ for x in self.links]
+            page_json["links"] = [x.to_dict() for x in self.links]
 
         return Response(
             json.dumps(page_json),
@@ -271,7 +320,19 @@ class FeatureRenderer(Renderer):
         )
 
     def _render_geosp_rdf(self):
-        g = self.feature.to_geosp_graph()
+        if self.feature.isPartOf is not None:
+            from api.model.fragments import get_fragments, NTRIPLES_COMPATIBLE_MEDIATYPES
+            fragments = get_fragments(self.feature.isPartOf, [self.feature.uri])
+            # N-Triples is a subset of these formats so the pre-serialised fragment can be returned as is
+            if self.mediatype in NTRIPLES_COMPATIBLE_MEDIATYPES:
+                return Response(b"".join(fragments), mimetype=self.mediatype, headers=self.headers)
+            g = Graph()
+            g.bind("geo", GEO)
+            g.bind("geox", GEOX)
+            for fragment in fragments:
+                g.parse(data=fragment.decode("utf-8"), format="nt")
+        else:
+            g = self.feature.to_geosp_graph()
 
         # serialise in the appropriate RDF format
         if self.mediatype in ["application/rdf+json", "application/json"]:
@@ -1,210 +1,100 @@
 from pyldapi import ContainerRenderer
 from typing import List
 from api.model.profiles import *
+from api.model.parameters import QueryParameters, ParameterError, PROFILE_PARAMS, PAGING_PARAMS, FILTER_PARAMS, \
+    SHAPING_PARAMS
+from api.filters import And, TIntersects, to_text
 from api.config import *
+from api.dataset import current_dataset
 from api.model.link import *
 from api.model.collection import Collection
-from api.model.feature import Feature
+from api.model.columnar import FeatureColumns
+from api.model.fragments import get_fragments, NTRIPLES_COMPATIBLE_MEDIATYPES
+from api.model.spatial_object import get_temporal_index
+from api.search import search
 import json
 from flask import Response, render_template
 from flask_paginate import Pagination
 from rdflib import Graph, Literal, URIRef
-from rdflib.namespace import DCTERMS, XSD, RDF
-import re
+from rdflib.namespace import XSD, RDF
 
 
 class FeaturesList:
-    def __init__(self, request, collection_id):
-        self.request = request
-        self.page = (
-            int(request.values.get("page")) if request.values.get("page") is not None else 1
-        )
-        self.per_page = (
-            int(request.values.get("per_page"))
-            if request.values.get("per_page") is not None
-            else 20
-        )
-        # limit
-        self.limit = int(request.values.get("limit")) if request.values.get("limit") is not None else None
+    def __init__(self, collection_id, parameters: QueryParameters):
+        self.parameters = parameters
+        self.start = parameters.start
+        self.end = parameters.end
 
-        # if limit is set, ignore page & per_page
-        if self.limit is not None:
-            self.start = 0
-            self.end = self.limit
-        else:
-            # generate list for requested page and per_page
-            self.start = (self.page - 1) * self.per_page
-            self.end = self.start + self.per_page
-
-        g = get_graph()
+        backend = current_dataset().backend
 
         # get Collection
-        for s in g.subjects(predicate=DCTERMS.identifier, object=Literal(collection_id)):
-            self.collection = Collection(str(s))
+        self.collection = Collection(backend.collection_uri(collection_id))
+
+        # the Features found from in-process indexes, in order, to which any other filters are applied: those
+        # matching q, best first, and within the datetime, if the Collection's TemporalIndex is cached. Otherwise the
+        # datetime filter is evaluated by the store
+        self.candidates = None
+        self.where = self.parameters.filter
+        if self.parameters.q is not None:
+            self.candidates = search(self.parameters.q, self.collection.uri)
+        if self.parameters.datetime is not None:
+            index = get_temporal_index(self.collection.uri)
+            if index is not None:
+                self.candidates = self.matching(index.features(*self.parameters.datetime))
+            else:
+                temporal = TIntersects(*self.parameters.datetime)
+                self.where = temporal if self.where is None else And((self.where, temporal))
 
-        # get list of Features within this Collection
-        features_uris = []
+        # get this page of the Features within this Collection
         # filter if we have a filtering param
-        if request.values.get("bbox") is not None:
-            # work out what sort of BBOX filter it is and filter by that type
-            features_uris = self.get_feature_uris_by_bbox()
+        if self.parameters.bbox is not None:
+            # work out what sort of BBOX filter it is and filter by that type, and by any property filter with it
+            features_uris = self.matching(self.get_feature_uris_by_bbox())
+            self.feature_count = len(features_uris)
+            # truncate the list of Features to this page
+            page = features_uris[self.start:self.end]
+        elif self.candidates is not None:
+            features_uris = self.candidates
+            if self.where is not None:
+                features_uris = self.matching(backend.features_where(self.collection.uri, self.where, features_uris))
+            self.feature_count = len(features_uris)
+            page = features_uris[self.start:self.end]
+        elif self.where is not None:
+            # the filter is evaluated by the store, so only matching Features' URIs are fetched
+            features_uris = backend.features_where(self.collection.uri, self.where)
+            self.feature_count = len(features_uris)
+            page = features_uris[self.start:self.end]
         else:
-            # all features in list
-            for s in g.subjects(predicate=DCTERMS.isPartOf, object=URIRef(self.collection.uri)):
-                features_uris.append(s)
-
-        self.feature_count = len(features_uris)
-        # truncate the list of Features to this page
-        page = features_uris[self.start:self.end]
-
-        # Features - only this page's
-        self.features = []
-        for s in page:
-            description = None
-            for p, o in g.predicate_objects(subject=s):
-                if p == DCTERMS.identifier:
-                    identifier = str(o)
-                elif p == DCTERMS.title:
-                    title = str(o)
-                elif p == DCTERMS.description:
-                    description = str(o)
-            self.features.append(
-                (str(s), identifier, title, description)
-            )
+            # all features in list, paged by the store
+            self.feature_count = self.collection.feature_count
+            page = backend.members(self.collection.uri, self.start, self.end)
 
-        self.bbox_type = None
+        # Features - only this page's, as (uri, identifier, title, description) tuples, without the descriptions as
+        # the members only need titles
+        self.features = [tuple(x[:4]) for x in backend.features(page, properties=["title"])]
+
+    def matching(self, feature_uris: List[str]) -> List[str]:
+        """Those of feature_uris that are candidates, in the candidates' order, or all of them if there are none"""
+        if self.candidates is None:
+            return feature_uris
+        feature_uris = set(feature_uris)
+        return [x for x in self.candidates if x in feature_uris]
+
+    @property
+    def bbox_type(self):
+        return self.parameters.bbox.type if self.parameters.bbox is not None else None
 
     def get_feature_uris_by_bbox(self):
-        allowed_bbox_formats = {
-            "coords": r"([0-9\.\-]+),([0-9\.\-]+),([0-9\.\-]+),([0-9\.\-]+)",  # Lat Longs, e.g. 160.6,-55.95,-170,-25.89
-            "cell_id": r"([A-Z][0-9]{0,15})$",  # single DGGS Cell ID, e.g. R1234
-            "cell_ids": r"([A-Z][0-9]{0,15}),([A-Z][0-9]{0,15})",  # two DGGS cells, e.g. R123,R456
-        }
-        for k, v in allowed_bbox_formats.items():
-            if re.match(v, self.request.values.get("bbox")):
-                self.bbox_type = k
-
-        if self.bbox_type is None:
-            return None
-        elif self.bbox_type == "coords":
-            return self._get_filtered_features_list_bbox_wgs84()
+        if self.bbox_type == "coords":
+            parts = self.parameters.bbox.values
+            return current_dataset().backend.features_in_bbox(self.collection.uri, (
+                min(parts[0], parts[2]), min(parts[1], parts[3]), max(parts[0], parts[2]), max(parts[1], parts[3])
+            ), where=self.where)
         elif self.bbox_type == "cell_id":
-            return self._get_filtered_features_list_bbox_dggs()
+            return current_dataset().backend.features_in_cell(
+                self.collection.uri, self.parameters.bbox.values[0], where=self.where)
         elif self.bbox_type == "cell_ids":
-            pass
-
-    def _get_filtered_features_list_bbox_wgs84(self):
-        parts = self.request.values.get("bbox").split(",")
-
-        demo = """
-            149.041411262992398 -35.292795884738389, 
-            149.041411262992398 -35.141378579917053, 
-            149.314863045854082 -35.141378579917053,
-            149.314863045854082 -35.292795884738389,
-            149.041411262992398 -35.292795884738389
-            """
-
-        q = """
-            PREFIX dcterms: <http://purl.org/dc/terms/>
-            PREFIX geo: <http://www.opengis.net/ont/geosparql#>
-            PREFIX geof: <http://www.opengis.net/def/function/geosparql/>
-            PREFIX ogcapi: <https://data.surroundaustralia.com/def/ogcapi/>
-
-            SELECT ?f
-            WHERE {{
-                ?f a ogcapi:Feature ;
-                   dcterms:isPartOf <{collection_uri}> ;            
-                   geo:hasGeometry/geo:asWKT ?wkt .
-    
-                FILTER (geof:sfOverlaps(?wkt, 
-                    '''
-                    <http://www.opengis.net/def/crs/OGC/1.3/CRS84>
-                    POLYGON ((
-                        {tl_lon} {tl_lat}, 
-                        {tl_lon} {br_lat}, 
-                        {br_lon} {br_lat},
-                        {br_lon} {tl_lat},
-                        {tl_lon} {tl_lat}
-                    ))
-                    '''^^geo:wktLiteral))
-            }}
-            ORDER BY ?f
-            """.format(**{
-            "collection_uri": self.collection.uri,
-            "tl_lon": parts[0],
-            "tl_lat": parts[1],
-            "br_lon": parts[2],
-            "br_lat": parts[3]
-        })
-        features_uris = []
-        for r in get_graph().query(q):
-            features_uris.append(r["f"])
-
-        return features_uris
-
-    def _get_filtered_features_list_bbox_dggs(self):
-        # geo:sfOverlaps - any Cell of the Feature is within the BBox
-        q = """
-            PREFIX dcterms: <http://purl.org/dc/terms/>
-            PREFIX geo: <http://www.opengis.net/ont/geosparql#>
-            PREFIX geox: <https://linked.data.gov.au/def/geox#>
-            PREFIX ogcapi: <https://data.surroundaustralia.com/def/ogcapi/>
-
-            SELECT ?f
-            WHERE {{
-                ?f a ogcapi:Feature ;
-                   dcterms:isPartOf <{}> .
-                ?f geo:hasGeometry/geox:asDGGS ?dggs .
-
-                FILTER CONTAINS(STR(?dggs), "{}")
-            }}
-            """.format(self.collection.uri, self.request.values.get("bbox"))
-
-        # TODO: update as RDFlib updates
-        # for r in get_graph().query(q):
-        #     features_uris.append((r["f"], r["prefLabel"]))
-        from SPARQLWrapper import SPARQLWrapper, JSON
-        sparql = SPARQLWrapper(SPARQL_ENDPOINT)
-        sparql.setQuery(q)
-        sparql.setReturnFormat(JSON)
-        ret = sparql.queryAndConvert()["results"]["bindings"]
-        return [URIRef(r["f"]["value"]) for r in ret]
-
-        # geo:sfWithin - every Cell of the Feature is within the BBox
-        # q = """
-        #     PREFIX dcterms: <http://purl.org/dc/terms/>
-        #     PREFIX geo: <http://www.opengis.net/ont/geosparql#>
-        #     PREFIX geox: <https://linked.data.gov.au/def/geox#>
-        #     PREFIX ogcapi: <https://data.surroundaustralia.com/def/ogcapi/>
-        #
-        #     SELECT ?f ?coords
-        #     WHERE {{
-        #         ?f a ogcapi:Feature ;
-        #            dcterms:isPartOf <{}> .
-        #         ?f geo:hasGeometry/geox:asDGGS ?dggs .
-        #
-        #         BIND (STRBEFORE(STRAFTER(STR(?dggs), "POLYGON ("), ")")AS ?coords)
-        #     }}
-        #     """.format(self.collection.uri)
-        # from SPARQLWrapper import SPARQLWrapper, JSON
-        # sparql = SPARQLWrapper(SPARQL_ENDPOINT)
-        # sparql.setQuery(q)
-        # sparql.setReturnFormat(JSON)
-        # ret = sparql.queryAndConvert()["results"]["bindings"]
-        # feature_ids = []
-        # for r in ret:
-        #     within = True
-        #     for cell in r["coords"]["value"].split(" "):
-        #         if not str(cell).startswith(self.request.values.get("bbox")):
-        #             within = False
-        #             break
-        #     if within:
-        #         feature_ids.append(URIRef(r["f"]["value"]))
-        #
-        # return feature_ids
-
-    def _get_filtered_features_list_bbox_paging(self):
-        pass
+            return []
 
 
 class FeaturesRenderer(ContainerRenderer):
@@ -214,13 +104,13 @@ class FeaturesRenderer(ContainerRenderer):
         if self.valid[0]:
             self.links = [
                 Link(
-                    LANDING_PAGE_URL + "/collections.json",
+                    current_dataset().landing_page_url + "/collections.json",
                     rel=RelType.SELF.value,
                     type=MediaType.JSON.value,
                     title="This Document"
                 ),
                 Link(
-                    LANDING_PAGE_URL + "/collections.html",
+                    current_dataset().landing_page_url + "/collections.html",
                     rel=RelType.SELF.value,
                     type=MediaType.HTML.value,
                     title="This Document in HTML"
@@ -229,48 +119,29 @@ class FeaturesRenderer(ContainerRenderer):
             if other_links is not None:
                 self.links.extend(other_links)
 
-            self.feature_list = FeaturesList(request, collection_id)
+            self.feature_list = FeaturesList(collection_id, self.parameters)
 
             super().__init__(
                 request,
-                LANDING_PAGE_URL + "/collections/" + self.feature_list.collection.identifier + "/items",
+                current_dataset().landing_page_url + "/collections/" + self.feature_list.collection.identifier + "/items",
                 "Features",
                 "The Features of Collection {}".format(self.feature_list.collection.identifier),
                 None,
                 None,
-                [(LANDING_PAGE_URL + "/collections/" + self.feature_list.collection.identifier + "/items/" + x[1], x[2]) for x in self.feature_list.features],
+                [(current_dataset().landing_page_url + "/collections/" + self.feature_list.collection.identifier + "/items/" + x[1], x[2]) for x in self.feature_list.features],
                 self.feature_list.feature_count,
-                profiles={"oai": profile_openapi, "geosp": profile_geosparql},
+                profiles={"oai": profile_openapi_features, "geosp": profile_geosparql},
                 default_profile_token="oai"
             )
 
     def _valid_parameters(self):
-        allowed_params = ["_profile", "_view", "_mediatype", "_format", "page", "per_page", "limit", "bbox"]
-
-        allowed_bbox_formats = [
-            r"([0-9\.\-]+),([0-9\.\-]+),([0-9\.\-]+),([0-9\.\-]+)",  # Lat Longs, e.g. 160.6,-55.95,-170,-25.89
-            r"([A-Z][0-9]{0,15})$",  # single DGGS Cell ID, e.g. R1234
-            r"([A-Z][0-9]{0,15}),([A-Z][0-9]{0,15})",  # two DGGS cells, e.g. R123,R456
-        ]
-
-        for p in self.request.values.keys():
-            if p not in allowed_params:
-                return False, \
-                       "The parameter {} you supplied is not allowed. " \
-                       "For this API endpoint, you may only use one of '{}'".format(p, "', '".join(allowed_params)),
-
-        if self.request.values.get("limit") is not None:
-            try:
-                int(self.request.values.get("limit"))
-            except ValueError:
-                return False, "The parameter 'limit' you supplied is invalid. It must be an integer"
-
-        if self.request.values.get("bbox") is not None:
-            for p in allowed_bbox_formats:
-                if re.match(p, self.request.values.get("bbox")):
-                    return True, None
-            return False, "The parameter 'bbox' you supplied is invalid. Must be either two pairs of long/lat values, " \
-                          "a DGGS Cell ID or a pair of DGGS Cell IDs"
+        try:
+            self.parameters = QueryParameters(
+                self.request.values,
+                PROFILE_PARAMS + PAGING_PARAMS + ["bbox", "datetime", "q"] + FILTER_PARAMS + SHAPING_PARAMS
+            )
+        except ParameterError as e:
+            return False, str(e)
 
         return True, None
 
@@ -280,8 +151,7 @@ class FeaturesRenderer(ContainerRenderer):
             return Response(
                 self.valid[1],
                 status=400,
-                mimetype="text/plain",
-                headers=self.headers
+                mimetype="text/plain"
             )
 
         # try returning alt profile
@@ -294,6 +164,8 @@ class FeaturesRenderer(ContainerRenderer):
                 return self._render_oai_json()
             elif self.mediatype == MediaType.GEOJSON.value:
                 return self._render_oai_geojson()
+            elif self.mediatype in [MediaType.FLATGEOBUF.value, MediaType.GEOPARQUET.value]:
+                return self._render_oai_binary()
             else:
                 return self._render_oai_html()
         elif self.profile == "geosp":
@@ -304,7 +176,7 @@ class FeaturesRenderer(ContainerRenderer):
 
     def _render_oai_json(self):
         page_json = {
-            "links": [x.__dict__ for x in self.links],
+            "links": [x.to_dict() for x in self.links],
             "collection": self.feature_list.collection.to_dict(),
             "items": self.members,
         }
@@ -317,7 +189,7 @@ class FeaturesRenderer(ContainerRenderer):
 
     def _render_oai_geojson(self):
         page_json = {
-            "links": [x.__dict__ for x in self.links],
+            "links": [x.to_dict() for x in self.links],
             "collection": self.feature_list.collection.to_geo_json_dict(),
             "items": self.members,
         }
@@ -328,6 +200,24 @@ class FeaturesRenderer(ContainerRenderer):
             headers=self.headers,
         )
 
+    def _render_oai_binary(self):
+        # this page's Features, as columns
+        columns = FeatureColumns.load(
+            feature_uris=[x[0] for x in self.feature_list.features],
+            properties=self.parameters.properties,
+            skip_geometry=self.parameters.skip_geometry
+        )
+        if self.mediatype == MediaType.FLATGEOBUF.value:
+            content = columns.to_flatgeobuf()
+        else:
+            content = columns.to_geoparquet()
+
+        return Response(
+            content,
+            mimetype=self.mediatype,
+            headers=self.headers,
+        )
+
     def _render_oai_html(self):
         pagination = Pagination(page=self.page, per_page=self.per_page, total=self.feature_list.feature_count)
 
@@ -338,8 +228,15 @@ class FeaturesRenderer(ContainerRenderer):
             "pagination": pagination
         }
 
-        if self.request.values.get("bbox") is not None:  # it it exists at this point, it must be valid
-            _template_context["bbox"] = (self.feature_list.bbox_type, self.request.values.get("bbox"))
+        if self.parameters.bbox is not None:  # it it exists at this point, it must be valid
+            _template_context["bbox"] = (self.parameters.bbox.type, str(self.parameters.bbox))
+        if self.parameters.q is not None:
+            _template_context["q"] = self.parameters.q
+        if self.parameters.datetime is not None:
+            start, end = self.parameters.datetime
+            _template_context["datetime"] = start if start == end else "{}/{}".format(start or "..", end or "..")
+        if self.parameters.filter is not None:
+            _template_context["filter"] = to_text(self.parameters.filter)
 
         return Response(
             render_template("features.html", **_template_context),
@@ -381,9 +278,19 @@ class FeaturesRenderer(ContainerRenderer):
             Literal(self.feature_list.feature_count, datatype=XSD.integer)
         ))
 
-        for f in self.feature_list.features:
-            g = g + Feature(f[0]).to_geosp_graph()
-            g.add((URIRef(f[0]), DCTERMS.isPartOf, URIRef(self.feature_list.collection.uri)))
+        # the Features' triples, pre-serialised
+        fragments = get_fragments(self.feature_list.collection.uri, [f[0] for f in self.feature_list.features])
+
+        # N-Triples is a subset of these formats so the page's triples and the fragments can just be concatenated
+        if self.mediatype in NTRIPLES_COMPATIBLE_MEDIATYPES:
+            return Response(
+                g.serialize(format="nt", encoding="utf-8") + b"".join(fragments),
+                mimetype=self.mediatype,
+                headers=self.headers
+            )
+
+        for fragment in fragments:
+            g.parse(data=fragment.decode("utf-8"), format="nt")
 
         # serialise in the appropriate RDF format
         if self.mediatype in ["application/rdf+json", "application/json"]:
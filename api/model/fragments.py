@@ -0,0 +1,83 @@
+import hashlib
+from typing import Dict, List
+from api.config import *
+from api.cache import cache
+from api.dataset import current_dataset
+from api.model.feature import CRS, Geometry, ordered_geometries
+from rdflib import BNode, Literal, URIRef
+from rdflib.namespace import DCTERMS, RDF, RDFS
+
+# RDF formats that N-Triples is a subset of, so whose responses can be made by concatenating N-Triples fragments
+NTRIPLES_COMPATIBLE_MEDIATYPES = ["application/n-triples", "text/turtle", "text/n3"]
+# the number of Features described per query when building fragments
+FRAGMENT_BATCH = 500
+
+
+def _ntriple(s, p, o) -> str:
+    return "{} {} {} .\n".format(s.n3(), p.n3(), o.n3())
+
+
+def _fragment(feature_uri: str, collection_uri: str, geometries: List[Geometry]) -> bytes:
+    """A Feature's geosp profile triples, as in Feature.to_geosp_graph(), serialised as N-Triples
+
+    The Geometry blank nodes are labelled from a hash of the Feature URI so that the fragments of many Features can
+    be concatenated without their blank nodes clashing.
+    """
+    f = URIRef(feature_uri)
+    label = hashlib.sha1(feature_uri.encode()).hexdigest()[:16]
+    nt = _ntriple(f, RDF.type, GEO.Feature)
+    nt += _ntriple(f, DCTERMS.isPartOf, URIRef(collection_uri))
+    for n, geometry in enumerate(geometries):
+        g = BNode("g{}x{}".format(label, n))
+        nt += _ntriple(f, GEO.hasGeometry, g)
+        nt += _ntriple(g, RDFS.label, Literal(geometry.label))
+        nt += _ntriple(g, GEOX.hasRole, URIRef(geometry.role.value))
+        nt += _ntriple(g, GEOX.inCRS, URIRef(geometry.crs.value))
+        if geometry.crs == CRS.TB16PIX:
+            nt += _ntriple(g, GEOX.asDGGS, Literal(geometry.coordinates, datatype=GEOX.DggsLiteral))
+        else:
+            nt += _ntriple(g, GEO.asWKT, Literal(geometry.coordinates, datatype=GEO.WktLiteral))
+
+    return nt.encode("utf-8")
+
+
+def _load_fragments(collection_uri: str, feature_uris: List[str] = None) -> Dict[str, bytes]:
+    """Builds the fragments of the listed Features, or of all of a Collection's Features, a batch per query"""
+    backend = current_dataset().backend
+    if feature_uris is None:
+        feature_uris = backend.members(collection_uri)
+    fragments = {}
+    for i in range(0, len(feature_uris), FRAGMENT_BATCH):
+        for described in backend.describe_features(feature_uris[i:i + FRAGMENT_BATCH]):
+            fragments[described.feature.uri] = _fragment(
+                described.feature.uri, collection_uri, ordered_geometries(described.geometries))
+
+    return fragments
+
+
+def get_fragments(collection_uri: str, feature_uris: List[str]) -> List[bytes]:
+    """The N-Triples fragments of a Collection's Features, in order, building any not already cached in bulk"""
+    collection_uri = str(collection_uri)
+    feature_uris = [str(x) for x in feature_uris]
+    fragments = {x: cache.get(("fragments", collection_uri, x)) for x in feature_uris}
+    missing = [k for k, v in fragments.items() if v is None]
+    if len(missing) > 0:
+        for k, v in _load_fragments(collection_uri, missing).items():
+            fragments[k] = cache.set(("fragments", collection_uri, k), v)
+
+    return [fragments[x] for x in feature_uris if fragments[x] is not None]
+
+
+def build_fragments(collection_uri: str):
+    """Builds and caches the fragments of all of a Collection's Features"""
+    collection_uri = str(collection_uri)
+    for k, v in _load_fragments(collection_uri).items():
+        cache.set(("fragments", collection_uri, k), v)
+
+
+def invalidate_fragments(collection_uri: str = None):
+    """Drops the cached fragments of a Collection's Features, or of all Features, after they change"""
+    if collection_uri is None:
+        cache.invalidate("fragments")
+    else:
+        cache.invalidate("fragments", str(collection_uri))
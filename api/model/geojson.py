@@ -0,0 +1,80 @@
+import logging
+import threading
+from typing import List, Optional
+from api.config import GEOMETRY_PROCESSES, GEOMETRY_PARALLEL_MIN_CHARS
+from geomet import wkt
+from geojson_rewind import rewind
+
+CHUNKS_PER_PROCESS = 4  # so that a few very detailed geometries don't leave the other processes idle
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def wkt_to_geojson(coordinates: str, rewound: bool = True) -> dict:
+    """A GeoJSON geometry dict from a WKT literal's value, less any leading CRS IRI, wound as RFC 7946 requires"""
+    if coordinates.startswith("<"):
+        coordinates = coordinates[coordinates.index(">") + 1:]
+    geometry = wkt.loads(coordinates.strip())
+    return rewind(geometry) if rewound else geometry
+
+
+def _convert(wkts: List[Optional[str]], rewound: bool) -> list:
+    return [wkt_to_geojson(x, rewound) if x is not None else None for x in wkts]
+
+
+def _get_pool():
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver, not fork, as forking a multi-threaded WSGI worker can copy locks other threads hold
+            _pool = ProcessPoolExecutor(GEOMETRY_PROCESSES, mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def _chunks(wkts: List[Optional[str]], n: int) -> List[list]:
+    """Splits wkts, in order, into about n runs of about equal length in characters"""
+    size = sum(len(x) for x in wkts if x is not None) / n
+    chunks = [[]]
+    length = 0
+    for x in wkts:
+        if length >= size:
+            chunks.append([])
+            length = 0
+        chunks[-1].append(x)
+        length += len(x) if x is not None else 0
+    return chunks
+
+
+def wkts_to_geojson(wkts: List[Optional[str]], rewound: bool = True) -> list:
+    """GeoJSON geometry dicts, or None, for a batch of WKT literal values, or None, in order
+
+    Batches of GEOMETRY_PARALLEL_MIN_CHARS or more of WKT are parsed, and rewound, across GEOMETRY_PROCESSES
+    processes as the work is CPU bound. Smaller batches, for which starting the work elsewhere would cost more than
+    it saves, are parsed in this thread.
+    """
+    from concurrent.futures.process import BrokenProcessPool
+
+    wkts = list(wkts)
+    if GEOMETRY_PROCESSES <= 1 or sum(len(x) for x in wkts if x is not None) < GEOMETRY_PARALLEL_MIN_CHARS:
+        return _convert(wkts, rewound)
+
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(_convert, x, rewound) for x in _chunks(wkts, GEOMETRY_PROCESSES * CHUNKS_PER_PROCESS)]
+        return [g for f in futures for g in f.result()]
+    except BrokenProcessPool as e:
+        logging.warning("geometry process pool failed, converting inline: {}".format(e))
+        _reset_pool()
+        return _convert(wkts, rewound)
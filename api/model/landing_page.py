@@ -4,9 +4,10 @@ from flask import Response, render_template
 from rdflib import URIRef, Literal
 from rdflib.namespace import DCAT, DCTERMS, RDF
 from api.model.profiles import *
+from api.model.parameters import QueryParameters, ParameterError
 from api.config import *
+from api.dataset import current_dataset
 import json
-import markdown
 import logging
 
 
@@ -16,7 +17,7 @@ class LandingPage:
             other_links: List[Link] = None,
     ):
         logging.debug("LandingPage()")
-        self.uri = LANDING_PAGE_URL
+        self.uri = current_dataset().landing_page_url
 
         # make dummy Landing Page data
         g = get_graph()
@@ -26,41 +27,42 @@ class LandingPage:
                 if p == DCTERMS.title:
                     self.title = str(o)
                 elif p == DCTERMS.description:
+                    import markdown
                     self.description = markdown.markdown(o)
         logging.debug("LandingPage() RDF loops")
 
         # make links
         self.links = [
             Link(
-                LANDING_PAGE_URL,
+                current_dataset().landing_page_url,
                 rel=RelType.SELF,
                 type=MediaType.JSON,
                 hreflang=HrefLang.EN,
                 title="This document"
             ),
             Link(
-                LANDING_PAGE_URL + "/spec",
+                current_dataset().landing_page_url + "/spec",
                 rel=RelType.SERVICE_DESC,
                 type=MediaType.OPEN_API_3,
                 hreflang=HrefLang.EN,
                 title="API definition"
             ),
             Link(
-                LANDING_PAGE_URL + "/doc/",
+                current_dataset().landing_page_url + "/doc/",
                 rel=RelType.SERVICE_DOC,
                 type=MediaType.HTML,
                 hreflang=HrefLang.EN,
                 title="API documentation"
             ),
             Link(
-                LANDING_PAGE_URL + "/conformance",
+                current_dataset().landing_page_url + "/conformance",
                 rel=RelType.CONFORMANCE,
                 type=MediaType.JSON,
                 hreflang=HrefLang.EN,
                 title="OGC API conformance classes implemented by this server"
             ),
             Link(
-                LANDING_PAGE_URL + "/collections",
+                current_dataset().landing_page_url + "/collections",
                 rel=RelType.DATA,
                 type=MediaType.JSON,
                 hreflang=HrefLang.EN,
@@ -91,9 +93,10 @@ class LandingPageRenderer(Renderer):
 
     def render(self):
         logging.debug("LandingPageRenderer.render()")
-        for v in self.request.values.items():
-            if v[0] not in self.ALLOWED_PARAMS:
-                return Response("The parameter {} you supplied is not allowed".format(v[0]), status=400)
+        try:
+            QueryParameters(self.request.values, self.ALLOWED_PARAMS)
+        except ParameterError as e:
+            return Response(str(e), status=400, mimetype="text/plain")
 
         # try returning alt profile
         response = super().render()
@@ -183,6 +186,8 @@ class LandingPageRenderer(Renderer):
             return Response(g.serialize(format=self.mediatype), mimetype=self.mediatype)
 
     def _render_dcat_html(self):
+        import markdown
+
         _template_context = {
             "uri": self.dataset.uri,
             "label": self.dataset.label,
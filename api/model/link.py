@@ -1,4 +1,5 @@
 from enum import Enum
+from api.model.record import Record
 
 
 class RelType(Enum):
@@ -17,13 +18,17 @@ class MediaType(Enum):
     GEOJSON = "application/geo+json"
     TURTLE = "text/turtle"
     OPEN_API_3 = "application/vnd.oai.openapi+json;version=3.0"
+    FLATGEOBUF = "application/flatgeobuf"
+    GEOPARQUET = "application/vnd.apache.parquet"
 
 
 class HrefLang(Enum):
     EN = "en"
 
 
-class Link(object):
+class Link(Record):
+    __slots__ = ("href", "rel", "type", "hreflang", "title", "length")
+
     def __init__(
             self,
             href: str,
@@ -32,12 +37,14 @@ class Link(object):
             hreflang: HrefLang = None,
             title: str = None,
             length: int = None):
-        self.href = href
-        self.rel = rel
-        self.type = type
-        self.hreflang = hreflang
-        self.title = title
-        self.length = length
+        self._set(
+            href=href,
+            rel=rel,
+            type=type,
+            hreflang=hreflang,
+            title=title,
+            length=length,
+        )
 
     def render_as_http_header(self):
         http = "<{}>".format(self.href)
@@ -55,4 +62,4 @@ class Link(object):
         return http
 
     def to_dict(self):
-        return self.__dict__
+        return {k: getattr(self, k) for k in self.__slots__}
@@ -0,0 +1,191 @@
+import re
+from api.config import MAX_PAGE_SIZE
+from api.filters import QUERYABLES, And, Comparison, FilterError, parse_cql2_text, temporal_interval, to_text
+
+# precompiled once, shared by every renderer and by FeaturesList
+BBOX_FORMATS = {
+    "coords": re.compile(r"([0-9\.\-]+),([0-9\.\-]+),([0-9\.\-]+),([0-9\.\-]+)"),  # Lat Longs, e.g. 160.6,-55.95,-170,-25.89
+    "cell_id": re.compile(r"([A-Z][0-9]{0,15})"),  # single DGGS Cell ID, e.g. R1234
+    "cell_ids": re.compile(r"([A-Z][0-9]{0,15}),([A-Z][0-9]{0,15})"),  # two DGGS cells, e.g. R123,R456
+}
+# an ISO 8601 date or date-time, to any precision from the year, e.g. 2001, 2001-05-01 or 2001-05-01T10:30:00Z
+DATETIME_FORMAT = re.compile(
+    r"[0-9]{4}(-[0-9]{2}(-[0-9]{2}(T[0-9]{2}(:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?)?(Z|[+\-][0-9]{2}:?[0-9]{2})?)?)?)?")
+
+PROFILE_PARAMS = ["_profile", "_view", "_mediatype", "_format"]
+PAGING_PARAMS = ["page", "per_page", "limit"]
+FILTER_PARAMS = ["filter", "filter-lang"] + list(QUERYABLES)  # filter is CQL2 text, the others property queries
+SHAPING_PARAMS = ["properties", "skipGeometry"]
+# all of the parameters that QueryParameters parses, so normalises, as opposed to the profile parameters
+QUERY_PARAMS = PAGING_PARAMS + ["bbox", "datetime", "q"] + FILTER_PARAMS + SHAPING_PARAMS
+
+# the Feature properties that the properties parameter may choose from
+RESPONSE_PROPERTIES = ["title", "isPartOf", "description"]
+
+DEFAULT_PER_PAGE = 20
+
+
+class ParameterError(ValueError):
+    """Raised when a request's query string parameters are not allowed or are invalid"""
+    pass
+
+
+def int_parameter(values, name: str, default=None, minimum: int = 1, maximum: int = None):
+    """Parses the integer query string parameter name, raising a ParameterError if it is invalid or out of range"""
+    value = values.get(name)
+    if value is None:
+        return default
+    try:
+        i = int(value)
+    except ValueError:
+        raise ParameterError("The parameter '{}' you supplied is invalid. It must be an integer".format(name))
+    if i < minimum:
+        raise ParameterError(
+            "The parameter '{}' you supplied is invalid. It must be {} or greater".format(name, minimum))
+    if maximum is not None and i > maximum:
+        raise ParameterError(
+            "The parameter '{}' you supplied is invalid. It must be {} or less".format(name, maximum))
+    return i
+
+
+def bool_parameter(values, name: str, default: bool = False) -> bool:
+    """Parses the boolean query string parameter name, true or false, raising a ParameterError if it is neither"""
+    value = values.get(name)
+    if value is None:
+        return default
+    if value.lower() not in ["true", "false"]:
+        raise ParameterError("The parameter '{}' you supplied is invalid. It must be 'true' or 'false'".format(name))
+    return value.lower() == "true"
+
+
+def properties_parameter(values):
+    """The Feature properties chosen by the properties parameter, a comma separated list that may be empty, or None
+    for all of them, raising a ParameterError if any is not one of RESPONSE_PROPERTIES"""
+    value = values.get("properties")
+    if value is None:
+        return None
+    properties = tuple(x.strip() for x in value.split(",") if x.strip() != "")
+    for p in properties:
+        if p not in RESPONSE_PROPERTIES:
+            raise ParameterError(
+                "The parameter 'properties' you supplied is invalid. '{}' is not a property. "
+                "You may only use '{}'".format(p, "', '".join(RESPONSE_PROPERTIES)))
+    return properties
+
+
+class BBox(object):
+    __slots__ = ("type", "values")
+
+    def __init__(self, value: str):
+        for k, v in BBOX_FORMATS.items():
+            m = v.fullmatch(value)
+            if m is not None:
+                if k == "coords":
+                    try:
+                        self.values = tuple(float(x) for x in m.groups())
+                    except ValueError:
+                        break
+                else:
+                    self.values = m.groups()
+                self.type = k
+                return
+
+        raise ParameterError(
+            "The parameter 'bbox' you supplied is invalid. Must be either two pairs of long/lat values, "
+            "a DGGS Cell ID or a pair of DGGS Cell IDs"
+        )
+
+    def __str__(self):
+        # normalised form, e.g. 160.6,-55.95,-170.0,-25.89, suitable for cache keys
+        return ",".join(repr(x) if type(x) == float else x for x in self.values)
+
+    def __repr__(self):
+        return "BBox({}: {})".format(self.type, str(self))
+
+
+def datetime_parameter(values):
+    """The (start, end) of the datetime parameter, an instant or an interval, either end of which may be open, e.g.
+    2001-05-01, 2001/2010 or ../2010-06-30, or None if there is none, raising a ParameterError if it is invalid"""
+    value = values.get("datetime")
+    if value is None:
+        return None
+    start, end = temporal_interval(value)
+    if value.count("/") > 1 or (start is None and end is None) or \
+            any(x is not None and DATETIME_FORMAT.fullmatch(x) is None for x in [start, end]):
+        raise ParameterError(
+            "The parameter 'datetime' you supplied is invalid. It must be an ISO 8601 date or date-time, e.g. "
+            "2001-05-01, or an interval of two, either of which may be '..' for an open interval, e.g. 2001/2010")
+    if start is not None and end is not None and start[:len(end)] > end:
+        raise ParameterError("The parameter 'datetime' you supplied is invalid. Its interval ends before it starts")
+    return start, end
+
+
+def filter_parameters(values):
+    """The filter tree of the property queries, e.g. title=Alpha, and the CQL2 text filter parameter, all of which
+    must hold, or None if there are none, raising a ParameterError if any is invalid"""
+    items = [Comparison(v, "=", values.get(k)) for k, v in QUERYABLES.items() if values.get(k) is not None]
+    if values.get("filter") is not None:
+        if values.get("filter-lang", "cql2-text") != "cql2-text":
+            raise ParameterError("The parameter 'filter-lang' you supplied is invalid. It must be 'cql2-text'")
+        try:
+            items.append(parse_cql2_text(values.get("filter")))
+        except FilterError as e:
+            raise ParameterError("The parameter 'filter' you supplied is invalid. {}".format(e))
+    if len(items) == 0:
+        return None
+    return items[0] if len(items) == 1 else And(tuple(items))
+
+
+class QueryParameters(object):
+    """The query string parameters of a request, validated and parsed once
+
+    page, per_page, limit, bbox & datetime are parsed to typed values, any filter parameters to a filter tree, see
+    api.filters, q, the search terms, see api.search, is kept as given, properties & skip_geometry, from
+    skipGeometry, choose what of each Feature to fetch and return, and start & end give the slice of the members
+    list that was requested. Any parameter not in allowed, any value that cannot be parsed, or a per_page or limit over
+    MAX_PAGE_SIZE raises a ParameterError.
+    """
+    __slots__ = (
+        "page", "per_page", "limit", "bbox", "datetime", "filter", "q", "properties", "skip_geometry", "start", "end")
+
+    def __init__(self, values, allowed=None, default_per_page=DEFAULT_PER_PAGE):
+        allowed = allowed if allowed is not None else PROFILE_PARAMS
+        for p in values.keys():
+            if p not in allowed:
+                raise ParameterError(
+                    "The parameter {} you supplied is not allowed. "
+                    "For this API endpoint, you may only use one of '{}'".format(p, "', '".join(allowed))
+                )
+
+        self.page = int_parameter(values, "page", 1)
+        self.per_page = int_parameter(values, "per_page", default_per_page, maximum=MAX_PAGE_SIZE)
+        self.limit = int_parameter(values, "limit", None, maximum=MAX_PAGE_SIZE)
+        self.bbox = BBox(values.get("bbox")) if values.get("bbox") is not None else None
+        self.datetime = datetime_parameter(values)
+        self.filter = filter_parameters(values)
+        self.q = values.get("q", "").strip() or None
+        self.properties = properties_parameter(values)
+        self.skip_geometry = bool_parameter(values, "skipGeometry")
+
+        # if limit is set, ignore page & per_page
+        if self.limit is not None:
+            self.start = 0
+            self.end = self.limit
+        else:
+            # generate list for requested page and per_page
+            self.start = (self.page - 1) * self.per_page
+            self.end = self.start + self.per_page
+
+    def cache_key(self):
+        """A normalised, hashable form of these parameters for use in cache keys, see api.singleflight.request_key()"""
+        return (
+            self.page,
+            self.per_page,
+            self.limit,
+            None if self.bbox is None else (self.bbox.type, str(self.bbox)),
+            self.datetime,
+            None if self.filter is None else to_text(self.filter),
+            self.q,
+            self.properties,
+            self.skip_geometry,
+        )
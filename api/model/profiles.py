@@ -8,12 +8,31 @@ profile_openapi = Profile(
     comment="The OpenAPI Specification (OAS) defines a standard, language-agnostic interface to RESTful APIs which "
             "allows both humans and computers to discover and understand the capabilities of the service without "
             "access to source code, documentation, or through network traffic inspection.",
-    mediatypes=["text/html", "application/geo+json", "application/json", "application/vnd.oai.openapi+json;version=3.0"],
+    mediatypes=[
+        "text/html",
+        "application/geo+json",
+        "application/json",
+        "application/vnd.oai.openapi+json;version=3.0",
+    ],
     default_mediatype="application/geo+json",
     languages=["en"],  # default 'en' only for now
     default_language="en",
 )
 
+# the same, for a Collection and its items, whose Features are also offered as FlatGeobuf and GeoParquet
+profile_openapi_features = Profile(
+    profile_openapi.uri,
+    label=profile_openapi.label,
+    comment=profile_openapi.comment,
+    mediatypes=profile_openapi.mediatypes + [
+        "application/flatgeobuf",
+        "application/vnd.apache.parquet",
+    ],
+    default_mediatype=profile_openapi.default_mediatype,
+    languages=profile_openapi.languages,
+    default_language=profile_openapi.default_language,
+)
+
 profile_dcat = Profile(
     "https://www.w3.org/TR/vocab-dcat/",
     label="DCAT",
@@ -0,0 +1,39 @@
+class lazy(object):
+    """A read-only Record attribute that is loaded on first access and then kept
+
+    The loaded value is stored in the Record's slot of the same name prefixed with an underscore, so the loader must
+    be idempotent: two threads reading an unloaded attribute at the same time will both load it and the last wins.
+    """
+    def __init__(self, loader):
+        self.loader = loader
+        self.slot = "_" + loader.__name__
+        self.__doc__ = loader.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return getattr(instance, self.slot)
+        except AttributeError:
+            value = self.loader(instance)
+            object.__setattr__(instance, self.slot, value)
+            return value
+
+
+class Record(object):
+    """Base class for immutable, slotted model objects
+
+    Subclasses declare their attributes in __slots__ and set them once, in __init__, via _set(). Records can't be
+    changed afterwards so they may be cached and shared between threads.
+    """
+    __slots__ = ()
+
+    def _set(self, **attributes):
+        for k, v in attributes.items():
+            object.__setattr__(self, k, v)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} objects are immutable".format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{} objects are immutable".format(type(self).__name__))
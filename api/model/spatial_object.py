@@ -1,8 +1,151 @@
-class SpatialExtent:
-    def __init__(self):
-        self.bbox = ""
+import bisect
+import re
+from typing import Iterable, List, Optional, Tuple
+from api.backend import WKT
+from api.cache import cache
+from api.dataset import current_dataset
+from api.filters import intervals_intersect, temporal_interval
+from api.model.record import Record
 
+CRS84 = "http://www.opengis.net/def/crs/OGC/1.3/CRS84"
+GREGORIAN = "http://www.opengis.net/def/uom/ISO-8601/0/Gregorian"
 
-class TemporalExtent:
-    def __init__(self):
-        self.interval = ""
+# innermost parenthesised coordinate lists of a WKT literal, e.g. "149.0 -35.3, 149.3 -35.3" of a POLYGON ring
+WKT_COORDINATE_LISTS = re.compile(r"\(([^()]*)\)")
+
+
+def wkt_envelope(wkt: str) -> Optional[Tuple[float, float, float, float]]:
+    """The (min x, min y, max x, max y) of a WKT literal's coordinates, ignoring any Z/M values or leading CRS IRI"""
+    if wkt.startswith("<"):
+        wkt = wkt[wkt.index(">") + 1:]
+    xs = []
+    ys = []
+    for coordinates in WKT_COORDINATE_LISTS.findall(wkt):
+        for point in coordinates.split(","):
+            xy = point.split()
+            if len(xy) >= 2:
+                xs.append(float(xy[0]))
+                ys.append(float(xy[1]))
+    if len(xs) == 0:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+class SpatialExtent(Record):
+    __slots__ = ("bbox", "crs")
+
+    def __init__(self, bbox: Tuple[float, float, float, float], crs: str = CRS84):
+        self._set(bbox=tuple(bbox), crs=crs)
+
+    def extend(self, bbox: Optional[Tuple[float, float, float, float]]):
+        """A new SpatialExtent covering both this extent and bbox"""
+        if bbox is None:
+            return self
+        return SpatialExtent((
+            min(self.bbox[0], bbox[0]),
+            min(self.bbox[1], bbox[1]),
+            max(self.bbox[2], bbox[2]),
+            max(self.bbox[3], bbox[3]),
+        ), self.crs)
+
+    def to_dict(self):
+        return {
+            "bbox": [list(self.bbox)],
+            "crs": self.crs,
+        }
+
+
+class TemporalExtent(Record):
+    """A time interval given as ISO 8601 strings. A start or end of None means the interval is open at that end"""
+    __slots__ = ("interval", "trs")
+
+    def __init__(self, interval: Tuple[Optional[str], Optional[str]], trs: str = GREGORIAN):
+        self._set(interval=tuple(interval), trs=trs)
+
+    def extend(self, interval: Optional[Tuple[Optional[str], Optional[str]]]):
+        """A new TemporalExtent covering both this extent and interval"""
+        if interval is None:
+            return self
+        # ISO 8601 strings of the same precision sort chronologically
+        start = None if None in [self.interval[0], interval[0]] else min(self.interval[0], interval[0])
+        end = None if None in [self.interval[1], interval[1]] else max(self.interval[1], interval[1])
+        return TemporalExtent((start, end), self.trs)
+
+    def to_dict(self):
+        return {
+            "interval": [list(self.interval)],
+            "trs": self.trs,
+        }
+
+
+class TemporalIndex(object):
+    """A Collection's Features' dcterms:date and dcterms:temporal intervals, sorted by start and by end, so that those
+    intersecting a time slice are found by bisection rather than by a scan of the whole Collection"""
+    END = "\uffff"  # sorts after any ISO 8601 string, so that an end covers the whole of its period, e.g. 2001-05
+
+    def __init__(self, entries: Iterable[Tuple[str, Tuple[Optional[str], Optional[str]]]] = ()):
+        """entries are (Feature URI, (start, end)), as given by temporal_interval()"""
+        self.entries = list(entries)
+        self.by_start = sorted(self.entries, key=lambda x: x[1][0] or "")
+        self.starts = [x[1][0] or "" for x in self.by_start]
+        self.by_end = sorted(self.entries, key=lambda x: (x[1][1] or "") + self.END)
+        self.ends = [(x[1][1] or "") + self.END for x in self.by_end]
+
+    def features(self, start: Optional[str], end: Optional[str]) -> List[str]:
+        """The URIs, sorted, of the Features with an interval intersecting the interval from start to end"""
+        # those that start by the end or those that end from the start, whichever are fewer, less any not in both
+        starting = self.by_start[:bisect.bisect_right(self.starts, end + self.END)] if end is not None else None
+        ending = self.by_end[bisect.bisect_left(self.ends, start):] if start is not None else None
+        candidates = min([x for x in [starting, ending, self.entries] if x is not None], key=len)
+        return sorted({x[0] for x in candidates if intervals_intersect(x[1], start, end)})
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _extend(extent, value, extent_class):
+    if value is None:
+        return extent
+    if extent is None:
+        return extent_class(value)
+    return extent.extend(value)
+
+
+def get_collection_extents(collection_uri: str) -> Tuple[Optional[SpatialExtent], Optional[TemporalExtent]]:
+    """The spatial & temporal extents of all of a Collection's Features
+
+    These are computed from the Features' WGS84 geometry envelopes and dcterms:date or dcterms:temporal values, once
+    per Collection, and then kept in the cache, along with the Collection's TemporalIndex.
+    """
+    return cache.get_or_load(("extents", str(collection_uri)), lambda: _load_collection_extents(collection_uri))[:2]
+
+
+def get_temporal_index(collection_uri: str) -> Optional[TemporalIndex]:
+    """The Collection's TemporalIndex if it is cached, fresh, else None, for the store to be queried instead. It is not
+    built here as that needs all of the Collection's Features' times, but is whenever the extents are"""
+    extents = cache.get(("extents", str(collection_uri)))
+    return extents[2] if extents is not None else None
+
+
+def _load_collection_extents(collection_uri: str):
+    backend = current_dataset().backend
+    spatial = None
+    for _, _, wkt in backend.geometries(collection_uri=collection_uri, kinds=(WKT,)):
+        spatial = _extend(spatial, wkt_envelope(wkt), SpatialExtent)
+    temporal = None
+    intervals = set()  # (Feature URI, interval), as a Feature's date and temporal may be the same
+    for feature_uri, value in backend.temporals(collection_uri):
+        interval = temporal_interval(value)
+        temporal = _extend(temporal, interval, TemporalExtent)
+        intervals.add((feature_uri, interval))
+
+    return spatial, temporal, TemporalIndex(intervals)
+
+
+def invalidate_collection_extents(collection_uri: str = None):
+    """Drops the cached extents, and TemporalIndex, of a Collection, or of all Collections, so that they are recomputed
+    when next used"""
+    if collection_uri is None:
+        cache.invalidate("extents")
+    else:
+        cache.invalidate("extents", str(collection_uri))
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+from api.config import *
+from api.cache import cache
+from api.dataset import current_dataset
+
+MVT_MEDIATYPE = "application/vnd.mapbox-vector-tile"
+EXTENT = 4096  # tile units per tile side
+BUFFER = 64  # tile units kept beyond each tile edge so that clipped Features don't show seams
+MAX_ZOOM = 24
+HALF_CIRCUMFERENCE = 20037508.342789244  # of the Web Mercator (EPSG:3857) world, in metres
+MAX_LATITUDE = 85.0511287798
+
+
+def to_web_mercator(coordinates):
+    import numpy
+
+    x = coordinates[:, 0] * HALF_CIRCUMFERENCE / 180.0
+    lat = numpy.clip(coordinates[:, 1], -MAX_LATITUDE, MAX_LATITUDE)
+    y = numpy.log(numpy.tan((90.0 + lat) * math.pi / 360.0)) * HALF_CIRCUMFERENCE / math.pi
+    return numpy.column_stack((x, y))
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_bounds(z: int, x: int, y: int):
+    """The Web Mercator (min x, min y, max x, max y) of an XYZ tile"""
+    size = 2 * HALF_CIRCUMFERENCE / 2 ** z
+    min_x = -HALF_CIRCUMFERENCE + x * size
+    max_y = HALF_CIRCUMFERENCE - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+class CollectionGeometries(object):
+    """The WGS84 geometries of all of a Collection's Features, projected to Web Mercator and spatially indexed"""
+    __slots__ = ("identifiers", "titles", "geometries", "index")
+
+    def __init__(self, collection_uri: str):
+        backend = current_dataset().backend
+        features = {x.uri: x for x in backend.features(collection_uri=collection_uri, properties=["title"])}
+        self.identifiers = []
+        self.titles = []
+        wkts = []
+        for f, _, wkt in backend.geometries(collection_uri=collection_uri):
+            if f not in features:
+                continue
+            if wkt.startswith("<"):  # strip any CRS IRI, the literal must be WGS84 to be in this Collection's tiles
+                wkt = wkt[wkt.index(">") + 1:]
+            self.identifiers.append(features[f].identifier)
+            self.titles.append(features[f].title)
+            wkts.append(wkt)
+
+        import shapely
+        from shapely.strtree import STRtree
+
+        self.geometries = shapely.transform(shapely.from_wkt(wkts, on_invalid="ignore"), to_web_mercator)
+        self.index = STRtree(self.geometries)
+
+
+def get_collection_geometries(collection_uri: str) -> CollectionGeometries:
+    return cache.get_or_load(("geometries", str(collection_uri)), lambda: CollectionGeometries(collection_uri))
+
+
+def render_tile(collection, z: int, x: int, y: int) -> bytes:
+    """Encodes the Features of a Collection that fall within an XYZ tile as a Mapbox Vector Tile
+
+    Each Feature is clipped to the tile, plus a BUFFER, and simplified to the tile's resolution so the work done
+    depends on the tile rather than on the size of the Collection.
+    """
+    import mapbox_vector_tile
+    import shapely
+
+    geometries = get_collection_geometries(collection.uri)
+    bounds = tile_bounds(z, x, y)
+    unit = (bounds[2] - bounds[0]) / EXTENT
+    clip = (
+        bounds[0] - BUFFER * unit,
+        bounds[1] - BUFFER * unit,
+        bounds[2] + BUFFER * unit,
+        bounds[3] + BUFFER * unit,
+    )
+
+    features = []
+    for i in geometries.index.query(shapely.box(*clip)):
+        geometry = shapely.clip_by_rect(geometries.geometries[i], *clip).simplify(unit, preserve_topology=True)
+        if geometry.is_empty:
+            continue
+        properties = {"identifier": geometries.identifiers[i]}
+        if geometries.titles[i] is not None:
+            properties["title"] = geometries.titles[i]
+        features.append({"id": int(i) + 1, "geometry": geometry, "properties": properties})
+
+    if len(features) == 0:
+        return b""
+
+    return mapbox_vector_tile.encode(
+        [{"name": collection.identifier, "features": features}],
+        default_options={"quantize_bounds": bounds, "extents": EXTENT},
+    )
+
+
+def _collection_tiles_dir(collection_uri: str) -> str:
+    return os.path.join(current_dataset().tiles_dir, hashlib.sha1(str(collection_uri).encode()).hexdigest())
+
+
+def get_tile(collection, z: int, x: int, y: int) -> bytes:
+    """An XYZ tile of a Collection, from the tile cache on disk if it is there and younger than CACHE_HOURS"""
+    path = os.path.join(_collection_tiles_dir(collection.uri), str(z), str(x), "{}.mvt".format(y))
+    try:
+        if time.time() - os.path.getmtime(path) < float(CACHE_HOURS) * 3600:
+            with open(path, "rb") as f:
+                return f.read()
+    except OSError:
+        pass
+
+    tile = render_tile(collection, z, x, y)
+
+    # write to a temporary file of its own then rename, so concurrent readers never see a partial tile and concurrent
+    # writers never truncate each other's. Failing to cache a tile, e.g. as its directory is being dropped, is no
+    # reason to fail to serve it
+    tmp = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(tile)
+        os.replace(tmp, path)
+    except OSError as e:
+        logging.warning("could not cache tile {}: {}".format(path, e))
+        if tmp is not None:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    return tile
+
+
+def invalidate_tiles(collection_uri: str = None):
+    """Drops the cached tiles and geometries of a Collection, or of all the current Dataset's Collections"""
+    if collection_uri is None:
+        cache.invalidate("geometries")
+        shutil.rmtree(current_dataset().tiles_dir, ignore_errors=True)
+    else:
+        cache.invalidate("geometries", str(collection_uri))
+        shutil.rmtree(_collection_tiles_dir(collection_uri), ignore_errors=True)
@@ -0,0 +1,94 @@
+"""Stale-while-revalidate and stale-if-error caching of whole responses
+
+A successful GET response is kept in the Dataset's response Cache, keyed as api.singleflight keys requests, and is
+served from there while it is fresh, i.e. for RESPONSE_CACHE_SECONDS. For RESPONSE_STALE_SECONDS after that it is
+still served at once, with a Warning header saying that it is stale, while it is made again in the background. After
+that it is only served if making it again fails, i.e. raises or gives a 5xx status, e.g. as the store is down or all
+of the store query budget is in use, and then for up to RESPONSE_STALE_IF_ERROR_SECONDS, with a Warning header saying
+that revalidation failed. Every cached response served has an Age header.
+
+A Collection's changing drops all of its Dataset's cached responses, see api.changes.
+"""
+import functools
+import logging
+from api.config import *
+from api.cache import Cache
+from api.changes import INVALIDATORS
+from api.dataset import current_dataset
+from api.singleflight import request_key
+from flask import Response, current_app, make_response, request
+
+STALE_WARNING = '110 - "Response is Stale"'
+REVALIDATION_FAILED_WARNING = '111 - "Revalidation Failed"'
+
+
+def response_cache() -> Cache:
+    return current_dataset().responses
+
+
+def _cached_response(entry, age: float, warning: str = None) -> Response:
+    body, status, headers = entry
+    response = Response(body, status=status, headers=headers)
+    response.headers["Age"] = str(int(age))
+    if warning is not None:
+        response.headers["Warning"] = warning
+    return response
+
+
+def cached(view):
+    """Decorates a view so that its successful GET responses are cached and served fresh, then stale while they are
+    made again in the background, then stale only if making them again fails"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if RESPONSE_CACHE_SECONDS <= 0 or request.method != "GET":
+            return view(*args, **kwargs)
+        responses = response_cache()
+        key = request_key()
+
+        def load():
+            response = make_response(view(*args, **kwargs))
+            return response.get_data(), response.status_code, list(response.headers.items())
+
+        def store(entry):
+            if entry[1] == 200 and len(entry[0]) <= RESPONSE_CACHE_MAX_BYTES:
+                responses.set(key, entry)
+            return entry
+
+        cached_entry = responses.get_stale(key)
+        if cached_entry is not None:
+            entry, age = cached_entry
+            if age < RESPONSE_CACHE_SECONDS:
+                return _cached_response(entry, age)
+            if age < RESPONSE_CACHE_SECONDS + RESPONSE_STALE_SECONDS:
+                app = current_app._get_current_object()
+                environ = request.environ.copy()
+
+                def reload():
+                    with app.request_context(environ):
+                        return store(load())
+
+                responses.refresh(key, reload)
+                return _cached_response(entry, age, STALE_WARNING)
+
+        try:
+            entry = store(load())
+        except Exception as e:
+            if cached_entry is None:
+                raise
+            logging.warning("serving {} stale as making it again failed: {}".format(request.path, e))
+            return _cached_response(cached_entry[0], cached_entry[1], REVALIDATION_FAILED_WARNING)
+        if entry[1] >= 500 and cached_entry is not None:
+            logging.warning("serving {} stale as making it again gave a {}".format(request.path, entry[1]))
+            return _cached_response(cached_entry[0], cached_entry[1], REVALIDATION_FAILED_WARNING)
+        return Response(entry[0], status=entry[1], headers=entry[2])
+
+    return wrapper
+
+
+def invalidate_responses(collection_uri: str = None):
+    """Drops all of the current Dataset's cached responses, as a Collection's changing may change most of them, e.g.
+    the landing page's and Collections list's as well as its own and its Features'"""
+    response_cache().invalidate()
+
+
+INVALIDATORS.append(invalidate_responses)
@@ -0,0 +1,187 @@
+"""Full-text search of Collections and Features by their titles and descriptions, for the q parameter
+
+Each Dataset has a SearchIndex, an in-process inverted index from the tokens of its Collections' and Features'
+dcterms:title and dcterms:description values to the Collections and Features having them. It is built on first use,
+or while the Dataset is warmed up, from the Dataset's store, i.e. from its snapshot if it has one, and then kept up to
+date incrementally: when a Collection changes only it and its Features are indexed again, see api.changes. A
+snapshot's being replaced drops the whole index, to be built again from the new one.
+
+q is one or more comma separated terms, any of which may match, as in OGC API Records. A term matches the documents
+having all of its words, the last as a prefix so that e.g. 'alpha riv' matches 'Alpha river'. Matches are ranked by
+BM25, with a title's words counting TITLE_WEIGHT times a description's.
+"""
+import bisect
+import logging
+import math
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+from api.changes import INVALIDATORS
+from api.dataset import current_dataset
+
+TITLE_WEIGHT = 3
+# BM25's term frequency saturation and length normalisation
+K1 = 1.2
+B = 0.75
+WORDS = re.compile(r"\w+")
+
+
+def tokens(text: Optional[str]) -> List[str]:
+    """The words of text, case folded and without accents, e.g. 'Café Creek' gives ['cafe', 'creek']"""
+    if text is None:
+        return []
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return WORDS.findall(text.casefold())
+
+
+class SearchIndex(object):
+    """An inverted index of documents, Collections or Features, each within a scope, the URI of the Dataset or
+    Collection it is part of, by the words of their titles and descriptions"""
+    def __init__(self):
+        self.postings = {}  # word -> {document URI: weighted frequency}
+        self.documents = {}  # document URI -> (scope, weighted length, words)
+        self.scopes = {}  # scope -> set of document URIs
+        self.total_length = 0
+        self._vocabulary = None  # the words, sorted, for prefix matching, or None until it is next needed
+        self._lock = threading.Lock()
+
+    def add(self, uri: str, scope: str, title: Optional[str], description: Optional[str]):
+        """Indexes a document, replacing anything already indexed for it"""
+        frequencies = {}
+        for word in tokens(title):
+            frequencies[word] = frequencies.get(word, 0) + TITLE_WEIGHT
+        for word in tokens(description):
+            frequencies[word] = frequencies.get(word, 0) + 1
+        with self._lock:
+            self._remove(uri)
+            for word, frequency in frequencies.items():
+                if word not in self.postings:
+                    self.postings[word] = {}
+                    self._vocabulary = None
+                self.postings[word][uri] = frequency
+            length = sum(frequencies.values())
+            self.documents[uri] = (scope, length, tuple(frequencies))
+            self.scopes.setdefault(scope, set()).add(uri)
+            self.total_length += length
+
+    def remove(self, uri: str):
+        with self._lock:
+            self._remove(uri)
+
+    def remove_scope(self, scope: str):
+        """Removes every document within scope, e.g. all of a Collection's Features"""
+        with self._lock:
+            for uri in list(self.scopes.get(scope, ())):
+                self._remove(uri)
+
+    def _remove(self, uri: str):
+        document = self.documents.pop(uri, None)
+        if document is None:
+            return
+        scope, length, words = document
+        for word in words:
+            postings = self.postings[word]
+            del postings[uri]
+            if len(postings) == 0:
+                del self.postings[word]
+                self._vocabulary = None
+        self.scopes[scope].discard(uri)
+        self.total_length -= length
+
+    def _expand(self, prefix: str) -> List[str]:
+        """The words starting with prefix"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        words = []
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            words.append(self._vocabulary[i])
+            i += 1
+        return words
+
+    def _scores(self, term: str, scope: str) -> Dict[str, float]:
+        """The BM25 scores of the documents within scope matching all of a term's words, the last as a prefix"""
+        words = tokens(term)
+        if len(words) == 0:
+            return {}
+        # each word's alternatives: itself or, for the last, the words it is a prefix of
+        alternatives = [[x] for x in words[:-1]] + [self._expand(words[-1])]
+        in_scope = self.scopes.get(scope, set())
+        average_length = self.total_length / max(1, len(self.documents))
+        scores = None
+        for choices in alternatives:
+            word_scores = {}
+            for word in choices:
+                postings = self.postings.get(word, {})
+                idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+                for uri, frequency in postings.items():
+                    if uri in in_scope and (scores is None or uri in scores):
+                        length = self.documents[uri][1]
+                        word_scores[uri] = word_scores.get(uri, 0.0) + idf * frequency * (K1 + 1) / (
+                            frequency + K1 * (1 - B + B * length / average_length))
+            scores = word_scores if scores is None else {k: scores[k] + v for k, v in word_scores.items()}
+            if len(scores) == 0:
+                break
+        return scores
+
+    def search(self, q: str, scope: str) -> List[str]:
+        """The URIs of the documents within scope that match q, best first, then by URI"""
+        scores = {}
+        with self._lock:
+            for term in q.split(","):
+                for uri, score in self._scores(term, scope).items():
+                    scores[uri] = scores.get(uri, 0.0) + score
+        return sorted(scores, key=lambda x: (-scores[x], x))
+
+    def __len__(self):
+        return len(self.documents)
+
+
+_build_lock = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    """The current Dataset's SearchIndex, built from its store if it has not been, or since its snapshot changed"""
+    dataset = current_dataset()
+    dataset.get_snapshot()  # which drops the index if the snapshot has been replaced
+    index = dataset.search_index
+    if index is not None:
+        return index
+    with _build_lock:
+        if dataset.search_index is None:
+            logging.info("building the search index of {}".format(dataset))
+            index = SearchIndex()
+            for collection in dataset.backend.collections():
+                _index_collection(index, dataset, collection)
+            dataset.search_index = index
+            logging.info("indexed {} Collections and Features of {}".format(len(index), dataset))
+        return dataset.search_index
+
+
+def _index_collection(index: SearchIndex, dataset, collection):
+    index.add(collection.uri, dataset.dataset_uri, collection.title, collection.description)
+    for feature in dataset.backend.features(collection_uri=collection.uri):
+        index.add(feature.uri, collection.uri, feature.title, feature.description)
+
+
+def search(q: str, scope: str) -> List[str]:
+    """The URIs of the current Dataset's Collections, for its URI as scope, or a Collection's Features, for its URI,
+    matching q, best first"""
+    return get_search_index().search(q, scope)
+
+
+def reindex_collection(collection_uri: str):
+    """Indexes a changed Collection, and its Features, again, if the current Dataset's index has been built"""
+    dataset = current_dataset()
+    index = dataset.search_index
+    if index is None:
+        return
+    index.remove(collection_uri)
+    index.remove_scope(collection_uri)
+    collection = dataset.backend.collection(collection_uri)
+    if collection is not None:
+        _index_collection(index, dataset, collection)
+
+
+INVALIDATORS.append(reindex_collection)
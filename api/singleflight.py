@@ -0,0 +1,98 @@
+import functools
+import threading
+from api.config import *
+from api.dataset import current_dataset
+from api.model.parameters import QUERY_PARAMS, ParameterError, QueryParameters
+from flask import Response, make_response, request
+
+# the request headers that content negotiation depends on, so that are part of a request's key
+NEGOTIATION_HEADERS = ["Accept", "Accept-Profile"]
+
+
+class _Call(object):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Runs a function once for all of the concurrent callers using the same key
+
+    The first caller with a key computes the result while later callers with that key wait for, and share, it. Once
+    it is computed the key is forgotten, so this coalesces concurrent work rather than caching it.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+flights = SingleFlight()
+
+
+def request_key() -> tuple:
+    """The current request normalised: its Dataset, path, query string parameters and negotiation headers
+
+    The parameters that QueryParameters parses are keyed by their parsed values, so that e.g. bbox=1,2,3,4 and
+    bbox=1.0,2,3,4 share a key, and any others, e.g. the profile parameters, by their values, sorted.
+    """
+    parsed = {k: v for k, v in request.args.items() if k in QUERY_PARAMS}
+    try:
+        parameters = QueryParameters(parsed, QUERY_PARAMS).cache_key()
+    except ParameterError:
+        # answered with a 400, so as given
+        parameters = tuple(sorted(parsed.items()))
+    return (
+        current_dataset().name,
+        request.path,
+        parameters,
+        tuple(sorted((k, v) for k, v in request.args.items(multi=True) if k not in QUERY_PARAMS)),
+        tuple(request.headers.get(x, "") for x in NEGOTIATION_HEADERS),
+    )
+
+
+def coalesce(view):
+    """Decorates a view so that identical concurrent GET requests are served from a single call of it
+
+    The response is read into memory once and each waiting request is given its own copy of it.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not SINGLE_FLIGHT or request.method != "GET":
+            return view(*args, **kwargs)
+
+        def respond():
+            response = make_response(view(*args, **kwargs))
+            return response.get_data(), response.status_code, list(response.headers.items())
+
+        body, status, headers = flights.do(request_key(), respond)
+        return Response(body, status=status, headers=headers)
+
+    return wrapper
@@ -0,0 +1,145 @@
+"""Immutable, memory-mapped dataset snapshots
+
+A snapshot is a single file holding a TripleIndex's arrays and a spatial index of Feature envelopes. Every worker
+process maps it read-only, so they share one copy of it in the page cache, and opening it costs no parsing. To
+replace it, write a new snapshot alongside and rename it over the old one: workers notice and map the new file.
+
+Build one with: python -m api.snapshot SOURCE_RDF_FILE SNAPSHOT_FILE
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import List, Tuple
+import numpy
+from rdflib import URIRef
+from api.triple_index import TermDictionary, TripleIndex, TERM_ID
+
+MAGIC = b"OGCLDSNP"
+VERSION = 1
+ALIGNMENT = 8
+
+
+def _envelopes(index: TripleIndex):
+    """(Feature IDs, Collection IDs, envelopes) of every Feature with a WGS84 geometry, ordered by Collection"""
+    from api.model.spatial_object import wkt_envelope
+
+    q = """
+        PREFIX dcterms: <http://purl.org/dc/terms/>
+        PREFIX geo: <http://www.opengis.net/ont/geosparql#>
+
+        SELECT ?f ?c ?wkt
+        WHERE {
+            ?f dcterms:isPartOf ?c ;
+               geo:hasGeometry/geo:asWKT ?wkt .
+        }
+        """
+    features = []
+    collections = []
+    boxes = []
+    for r in index.graph().query(q):
+        box = wkt_envelope(str(r["wkt"]))
+        if box is not None:
+            features.append(index.terms.id(r["f"]))
+            collections.append(index.terms.id(r["c"]))
+            boxes.append(box)
+    features = numpy.array(features, dtype=TERM_ID)
+    collections = numpy.array(collections, dtype=TERM_ID)
+    boxes = numpy.array(boxes, dtype=numpy.float64).reshape(-1, 4)
+    order = numpy.argsort(collections, kind="stable")
+    return features[order], collections[order], boxes[order]
+
+
+def write_snapshot(index: TripleIndex, path: str):
+    """Writes index, and its Features' envelopes, as a snapshot file, replacing any at path atomically"""
+    envelope_features, envelope_collections, envelope_boxes = _envelopes(index)
+    sections = [
+        ("terms_blob", numpy.frombuffer(bytes(index.terms.blob), dtype=numpy.uint8)),
+        ("terms_offsets", index.terms.offsets),
+        ("terms_hashes", index.terms.hashes),
+        ("terms_hash_ids", index.terms.hash_ids),
+        ("spo_s", index.spo[0]), ("spo_p", index.spo[1]), ("spo_o", index.spo[2]),
+        ("pos_p", index.pos[0]), ("pos_o", index.pos[1]), ("pos_s", index.pos[2]),
+        ("envelope_features", envelope_features),
+        ("envelope_collections", envelope_collections),
+        ("envelope_boxes", envelope_boxes),
+    ]
+
+    # the header's size depends on the offsets in it, so lay the sections out after a generous allowance for it
+    header = {"namespaces": {k: str(v) for k, v in index.namespaces()}, "sections": {}}
+    offset = len(MAGIC) + 8 + len(json.dumps(header)) + 256 * len(sections)
+    for name, array in sections:
+        offset += -offset % ALIGNMENT
+        header["sections"][name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset += array.nbytes
+    header_bytes = json.dumps(header).encode("utf-8")
+    if len(MAGIC) + 8 + len(header_bytes) > header["sections"][sections[0][0]]["offset"]:
+        raise ValueError("The snapshot header is larger than the space allowed for it")
+
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", VERSION, len(header_bytes)) + header_bytes)
+        for name, array in sections:
+            f.write(b"\0" * (header["sections"][name]["offset"] - f.tell()))
+            f.write(numpy.ascontiguousarray(array).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Snapshot(object):
+    """A snapshot file, mapped read-only, as a TripleIndex plus a spatial index of its Features' envelopes"""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a dataset snapshot".format(path))
+        version, header_length = struct.unpack_from("<II", self._mmap, len(MAGIC))
+        if version != VERSION:
+            raise ValueError("{} is a version {} snapshot, not {}".format(path, version, VERSION))
+        header = json.loads(self._mmap[len(MAGIC) + 8:len(MAGIC) + 8 + header_length].decode("utf-8"))
+
+        a = {}
+        for name, section in header["sections"].items():
+            dtype = numpy.dtype(section["dtype"])
+            count = int(numpy.prod(section["shape"]))
+            a[name] = numpy.frombuffer(self._mmap, dtype=dtype, count=count, offset=section["offset"]) \
+                .reshape(section["shape"])
+
+        terms = TermDictionary(
+            memoryview(a["terms_blob"]), a["terms_offsets"], a["terms_hashes"], a["terms_hash_ids"])
+        self.index = TripleIndex(
+            terms, (a["spo_s"], a["spo_p"], a["spo_o"]), (a["pos_p"], a["pos_o"], a["pos_s"]))
+        for prefix, namespace in header["namespaces"].items():
+            self.index.bind(prefix, URIRef(namespace))
+        self.envelope_features = a["envelope_features"]
+        self.envelope_collections = a["envelope_collections"]
+        self.envelope_boxes = a["envelope_boxes"]
+        self._graph = self.index.graph()
+
+    def graph(self):
+        return self._graph
+
+    def same_file(self, stat: os.stat_result) -> bool:
+        return (stat.st_ino, stat.st_mtime_ns) == (self.stat.st_ino, self.stat.st_mtime_ns)
+
+    def features_in_bbox(self, collection_uri: str, bbox: Tuple[float, float, float, float]) -> List[URIRef]:
+        """The Features of a Collection whose envelopes intersect a (min x, min y, max x, max y) WGS84 box"""
+        c = self.index.terms.id(URIRef(collection_uri))
+        if c is None:
+            return []
+        lo, hi = self.envelope_collections.searchsorted(numpy.array([c, c + 1], dtype=TERM_ID))
+        boxes = self.envelope_boxes[lo:hi]
+        hits = (boxes[:, 0] <= bbox[2]) & (boxes[:, 2] >= bbox[0]) & \
+               (boxes[:, 1] <= bbox[3]) & (boxes[:, 3] >= bbox[1])
+        features = self.envelope_features[lo:hi][hits]
+        return sorted(set(self.index.terms.term(x) for x in features))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python -m api.snapshot SOURCE_RDF_FILE SNAPSHOT_FILE")
+    write_snapshot(TripleIndex.load(sys.argv[1]), sys.argv[2])
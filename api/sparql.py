@@ -0,0 +1,233 @@
+"""A streaming SPARQL protocol client
+
+SELECT results are requested as SPARQL TSV, one line per row with each term in N-Triples syntax, and parsed line by
+line as the response arrives, so a caller can page through, or stop reading, a large result without every binding
+being held in memory at once.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+from api.config import *
+from api.endpoints import EndpointPool, EndpointsUnavailable
+
+TSV = "text/tab-separated-values"
+JSON = "application/sparql-results+json"
+NTRIPLES = "application/n-triples"
+TURTLE = "text/turtle"
+TRIPLE_TERMS = re.compile(r"[ \t]+")
+ESCAPES = re.compile(r"\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))")
+ESCAPED_CHARACTERS = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+
+
+def _unescape(match) -> str:
+    if match.group(3) is not None:
+        return ESCAPED_CHARACTERS.get(match.group(3), match.group(3))
+    return chr(int(match.group(1) or match.group(2), 16))
+
+
+def term_value(term: str) -> Optional[str]:
+    """The value of a term in N-Triples syntax, as in SPARQL TSV, as rdflib's str() of the term would give, or None if
+    it is empty, i.e. unbound"""
+    if term == "":
+        return None
+    if term.startswith("<"):
+        return term[1:-1]
+    if term.startswith('"'):
+        # any language tag or datatype IRI follows the closing quote, and can't contain one
+        quote = 3 if term.startswith('"""') else 1  # Turtle's long quotes, which some endpoints write
+        lexical = term[quote:term.rindex('"') + 1 - quote]
+        return ESCAPES.sub(_unescape, lexical) if "\\" in lexical else lexical
+    if term.startswith("_:"):
+        return term[2:]
+    return term  # a number or boolean, in Turtle's abbreviated form
+
+
+def _lines(response) -> Iterator[str]:
+    """A response's lines, split on line feeds only as, unlike str.splitlines(), a literal may hold other breaks"""
+    rest = b""
+    for chunk in response.iter_content(chunk_size=65536):
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8")
+    if rest != b"":
+        yield rest.rstrip(b"\r").decode("utf-8")
+
+
+def _triple(line: str) -> Tuple[str, str, str]:
+    """The subject, predicate & object terms of an N-Triples line, of which only the object, a literal, has spaces"""
+    s, p, o = TRIPLE_TERMS.split(line.strip(), 2)
+    return s, p, o[:-1].rstrip()  # less the closing " ."
+
+
+def _close_response(future):
+    """Closes the response of a hedged request that lost"""
+    if future.exception() is None:
+        future.result().close()
+
+
+class SPARQLClient(object):
+    """Queries a SPARQL endpoint, or a pool of replicas, over HTTP, with connections kept alive per thread
+
+    Queries are balanced, hedged and failed over across a pool's endpoints, see api.endpoints.
+    """
+    def __init__(self, endpoints, timeout: float = SPARQL_TIMEOUT):
+        """endpoints is an EndpointPool, or a URL or list of them"""
+        if not isinstance(endpoints, EndpointPool):
+            endpoints = EndpointPool([endpoints] if isinstance(endpoints, str) else endpoints)
+        self.endpoints = endpoints
+        self.timeout = timeout
+        self._local = threading.local()
+        self._hedge_executor = None
+        self._executor_lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def _executor(self):
+        with self._executor_lock:
+            if self._hedge_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=2 * STORE_QUERY_BUDGET, thread_name_prefix="sparql-hedge")
+            return self._hedge_executor
+
+    def _attempt(self, endpoint, query: str, accept: str):
+        """POSTs the query to an acquired endpoint, returning the response once it begins, having counted the request
+        out of the endpoint, raising if it failed, i.e. there was no response, or a server error"""
+        start = time.monotonic()
+        try:
+            response = self._session().post(
+                endpoint.url,
+                data={"query": query},
+                headers={"Accept": accept},
+                stream=True,
+                timeout=self.timeout,
+            )
+        except Exception:
+            endpoint.failed()
+            raise
+        if response.status_code >= 500:
+            endpoint.failed()
+            response.close()
+            response.raise_for_status()
+        endpoint.succeeded(time.monotonic() - start)
+        return response
+
+    def _post(self, query: str, accept: str):
+        endpoints = self.endpoints.order()
+        delay = self.endpoints.hedge_delay(endpoints[0])
+        if delay is None:
+            response = self._failover(endpoints, query, accept)
+        else:
+            response = self._hedged(endpoints, delay, query, accept)
+        if not response.ok:
+            # a client error, e.g. a malformed query, that any other endpoint would give too
+            response.close()
+            response.raise_for_status()
+        return response
+
+    def _failover(self, endpoints: list, query: str, accept: str):
+        """The response of the first of the endpoints that doesn't fail, tried one after the other"""
+        error = EndpointsUnavailable(0)  # if half-open circuits' trials were all taken meanwhile
+        for endpoint in endpoints:
+            if endpoint.acquire():
+                try:
+                    return self._attempt(endpoint, query, accept)
+                except Exception as e:
+                    logging.debug("query to {} failed: {}".format(endpoint.url, e))
+                    error = e
+        raise error
+
+    def _hedged(self, endpoints: list, delay: float, query: str, accept: str):
+        """As _failover() but, if the first endpoint's response hasn't begun after delay seconds, the next endpoint is
+        asked too, and the response that begins first is used, the other being closed"""
+        from concurrent.futures import wait, FIRST_COMPLETED
+        pending = {}
+        remaining = iter(endpoints)
+
+        def ask_next():
+            for endpoint in remaining:
+                if endpoint.acquire():
+                    pending[self._executor().submit(self._attempt, endpoint, query, accept)] = endpoint
+                    return
+
+        error = EndpointsUnavailable(0)
+        ask_next()
+        deadline = time.monotonic() + delay
+        while len(pending) > 0:
+            timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if len(done) == 0:
+                logging.debug("no response from {} after {:.3f}s, hedging".format(list(pending.values()), delay))
+                deadline = None  # only once
+                ask_next()
+                continue
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    logging.debug("query to {} failed: {}".format(endpoint.url, e))
+                    error = e
+                    ask_next()
+                    continue
+                for other in pending:
+                    other.add_done_callback(_close_response)
+                return response
+        raise error
+
+    def select(self, query: str, variables: List[str]) -> Iterator[tuple]:
+        """The rows of a SELECT query, lazily, as tuples of the variables' values, as strings, or None where unbound
+
+        The query is only sent once the first row is asked for, and the response is closed once the rows run out or
+        the iterator is discarded.
+        """
+        response = self._post(query, "{}, {};q=0.5".format(TSV, JSON))
+        try:
+            if response.headers.get("Content-Type", "").startswith(JSON):
+                # for endpoints without TSV support, which are parsed whole
+                for binding in json.loads(response.content.decode("utf-8"))["results"]["bindings"]:
+                    yield tuple(binding[x]["value"] if x in binding else None for x in variables)
+                return
+
+            lines = _lines(response)
+            header = next(lines, "")
+            columns = [x.lstrip("?$") for x in header.split("\t")]
+            positions = [columns.index(x) if x in columns else None for x in variables]
+            for line in lines:
+                if line == "":
+                    continue
+                terms = line.split("\t")
+                yield tuple(term_value(terms[i]) if i is not None else None for i in positions)
+        finally:
+            response.close()
+
+    def construct(self, query: str) -> Iterator[Tuple[str, str, str]]:
+        """The triples of a CONSTRUCT query, lazily, as (subject, predicate, object) values, as strings, with blank
+        nodes as their labels, which are only meaningful within the one result"""
+        response = self._post(query, "{}, {};q=0.5".format(NTRIPLES, TURTLE))
+        try:
+            mediatype = response.headers.get("Content-Type", "").split(";")[0].strip()
+            if mediatype not in [NTRIPLES, "text/plain"]:
+                # for endpoints without N-Triples support, which are parsed whole
+                from rdflib import Graph
+                g = Graph()
+                g.parse(data=response.content.decode("utf-8"), format=mediatype or TURTLE)
+                for s, p, o in g:
+                    yield str(s), str(p), str(o)
+                return
+
+            for line in _lines(response):
+                if line.strip() == "" or line.lstrip().startswith("#"):
+                    continue
+                yield tuple(term_value(x) for x in _triple(line))
+        finally:
+            response.close()
@@ -0,0 +1,419 @@
+"""A Dataset loaded from RDF files into an on-disk SQLite database, for serving with no SPARQL endpoint
+
+The database holds the source triples, for get_graph() and so the API's SPARQL queries, plus tables of the
+Collections, Features and geometries, with each WGS84 geometry's envelope, that the Backend operations are answered
+from with indexed SQL.
+
+Build one with: python -m api.sqlite_backend SOURCE_RDF_FILE... SQLITE_FILE
+"""
+import os
+import sqlite3
+import sys
+import threading
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+from rdflib import Graph, URIRef
+from rdflib.store import Store
+from rdflib.util import from_n3, guess_format
+from api.backend import Backend, CollectionRow, FeatureRow, FeatureDescription, WKT, DGGS, HAS_GEOMETRY, \
+    FEATURE_PROPERTIES, GEOMETRY_NODE_PROPERTIES, OPTIONAL_PROPERTIES, feature_descriptions, optional_properties
+from api.filters import TEMPORAL_PROPERTIES, And, Comparison, In, IsNull, Like, Not, Or, TIntersects, \
+    intervals_intersect, temporal_interval
+from api.sparql import term_value
+from api.triple_index import n3
+
+SCHEMA = """
+    CREATE TABLE triple (s TEXT NOT NULL, p TEXT NOT NULL, o TEXT NOT NULL);
+    CREATE INDEX triple_spo ON triple (s, p, o);
+    CREATE INDEX triple_pos ON triple (p, o, s);
+    CREATE TABLE namespace (prefix TEXT PRIMARY KEY, uri TEXT NOT NULL);
+    CREATE TABLE collection (
+        uri TEXT PRIMARY KEY, dataset TEXT, identifier TEXT, title TEXT, description TEXT);
+    CREATE INDEX collection_identifier ON collection (identifier);
+    CREATE TABLE feature (
+        uri TEXT PRIMARY KEY, collection TEXT NOT NULL, identifier TEXT, title TEXT, description TEXT);
+    CREATE INDEX feature_collection ON feature (collection, uri);
+    CREATE INDEX feature_identifier ON feature (identifier, collection);
+    CREATE TABLE geometry (
+        feature TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL,
+        min_x REAL, min_y REAL, max_x REAL, max_y REAL);
+    CREATE INDEX geometry_feature ON geometry (feature, kind);
+    """
+
+# the Backend's tables, derived from the triples
+TABLE_QUERIES = {
+    "collection": """
+        PREFIX dcterms: <http://purl.org/dc/terms/>
+        PREFIX ogcapi: <https://data.surroundaustralia.com/def/ogcapi/>
+
+        SELECT ?c ?dataset ?identifier ?title ?description
+        WHERE {
+            ?c a ogcapi:Collection .
+            OPTIONAL {?c dcterms:isPartOf ?dataset}
+            OPTIONAL {?c dcterms:identifier ?identifier}
+            OPTIONAL {?c dcterms:title ?title}
+            OPTIONAL {?c dcterms:description ?description}
+        }
+        """,
+    "feature": """
+        PREFIX dcterms: <http://purl.org/dc/terms/>
+        PREFIX ogcapi: <https://data.surroundaustralia.com/def/ogcapi/>
+
+        SELECT ?f ?c ?identifier ?title ?description
+        WHERE {
+            ?f dcterms:isPartOf ?c .
+            ?c a ogcapi:Collection .
+            OPTIONAL {?f dcterms:identifier ?identifier}
+            OPTIONAL {?f dcterms:title ?title}
+            OPTIONAL {?f dcterms:description ?description}
+        }
+        """,
+    "geometry": """
+        PREFIX geo: <http://www.opengis.net/ont/geosparql#>
+        PREFIX geox: <https://linked.data.gov.au/def/geox#>
+
+        SELECT ?f ?kind ?value
+        WHERE {
+            { ?f geo:hasGeometry/geo:asWKT ?value . BIND ("wkt" AS ?kind) }
+            UNION
+            { ?f geo:hasGeometry/geox:asDGGS ?value . BIND ("dggs" AS ?kind) }
+        }
+        """,
+}
+
+
+def build_sqlite(sources: List[str], path: str):
+    """Loads RDF files into a new database at path, replacing any there atomically"""
+    from api.model.spatial_object import wkt_envelope
+
+    g = Graph()
+    for source in sources:
+        g.parse(source, format=guess_format(source))
+
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    try:
+        db.executescript(SCHEMA)
+        db.executemany("INSERT INTO triple VALUES (?, ?, ?)", ((n3(s), n3(p), n3(o)) for s, p, o in g))
+        db.executemany("INSERT INTO namespace VALUES (?, ?)", ((k, str(v)) for k, v in g.namespaces()))
+
+        def rows(name):
+            seen = set()
+            for r in g.query(TABLE_QUERIES[name]):
+                r = tuple(str(x) if x is not None else None for x in r)
+                # the first of any repeated properties, as for SPARQLBackend
+                if name == "geometry" or r[0] not in seen:
+                    seen.add(r[0])
+                    yield r
+
+        db.executemany("INSERT INTO collection VALUES (?, ?, ?, ?, ?)", rows("collection"))
+        db.executemany("INSERT INTO feature VALUES (?, ?, ?, ?, ?)", rows("feature"))
+
+        def geometries():
+            for r in rows("geometry"):
+                envelope = wkt_envelope(r[2]) if r[1] == WKT else None
+                yield r + (envelope if envelope is not None else (None,) * 4)
+
+        db.executemany("INSERT INTO geometry VALUES (?, ?, ?, ?, ?, ?, ?)", geometries())
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp, path)
+
+
+class SQLiteStore(Store):
+    """A read-only rdflib Store over a database's triple table, for get_graph()"""
+    context_aware = False
+    formula_aware = False
+    graph_aware = False
+    transaction_aware = False
+
+    def __init__(self, backend: "SQLiteBackend"):
+        super().__init__()
+        self.backend = backend
+        self._term = lru_cache(maxsize=65536)(from_n3)
+        self._namespaces = {k: URIRef(v) for k, v in backend.execute("SELECT prefix, uri FROM namespace")}
+
+    def triples(self, triple_pattern, context=None):
+        conditions = []
+        values = []
+        for column, term in zip(["s", "p", "o"], triple_pattern):
+            if term is not None:
+                conditions.append("{} = ?".format(column))
+                values.append(n3(term))
+        q = "SELECT s, p, o FROM triple"
+        if len(conditions) > 0:
+            q += " WHERE " + " AND ".join(conditions)
+        term = self._term
+        for s, p, o in self.backend.execute(q, values):
+            yield (term(s), term(p), term(o)), iter(())
+
+    def __len__(self, context=None):
+        return self.backend.execute("SELECT COUNT(*) FROM triple")[0][0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError("A SQLiteStore is read-only")
+
+    def remove(self, triple, context=None):
+        raise TypeError("A SQLiteStore is read-only")
+
+    def bind(self, prefix, namespace, override=True):
+        self._namespaces[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def prefix(self, namespace):
+        for k, v in self._namespaces.items():
+            if v == namespace:
+                return k
+        return None
+
+    def namespaces(self):
+        for k, v in self._namespaces.items():
+            yield k, v
+
+
+def term_number(term: str) -> Optional[float]:
+    """The numeric value of a term in N-Triples syntax, or None if it has none"""
+    try:
+        return float(term_value(term))
+    except (TypeError, ValueError):
+        return None
+
+
+def term_intersects(term: str, start: Optional[str], end: Optional[str]) -> bool:
+    """Whether a term in N-Triples syntax, an ISO 8601 instant or interval, intersects the interval from start to end"""
+    value = term_value(term)
+    return value is not None and intervals_intersect(temporal_interval(value), start, end)
+
+
+def like_glob(pattern: str) -> str:
+    """A CQL2 LIKE pattern as a GLOB pattern, which, unlike LIKE in SQLite, is case sensitive as CQL2's LIKE is"""
+    return "".join(
+        "*" if c == "%" else "?" if c == "_" else "[{}]".format(c) if c in "*?[" else c for c in pattern
+    )
+
+
+def sql_filter(tree) -> Tuple[str, list]:
+    """A filter tree, see api.filters, as an SQL condition, with its parameters, on the feature table aliased f"""
+    if isinstance(tree, (Comparison, Like, In)):
+        if isinstance(tree, Comparison) and isinstance(tree.value, float):
+            condition, values = "term_number(t.o) {} ?".format(tree.operator), [tree.value]
+        elif isinstance(tree, Comparison):
+            condition, values = "term_value(t.o) {} ?".format(tree.operator), [tree.value]
+        elif isinstance(tree, Like):
+            condition, values = "term_value(t.o) GLOB ?", [like_glob(tree.pattern)]
+        elif any(isinstance(x, float) for x in tree.values):
+            return sql_filter(Or(tuple(Comparison(tree.property, "=", x) for x in tree.values)))
+        else:
+            condition, values = "term_value(t.o) IN ({})".format(",".join("?" * len(tree.values))), list(tree.values)
+        return (
+            "EXISTS (SELECT 1 FROM triple t WHERE t.s = '<' || f.uri || '>' AND t.p = ? AND {})".format(condition),
+            ["<{}>".format(tree.property)] + values
+        )
+    if isinstance(tree, TIntersects):
+        return (
+            "EXISTS (SELECT 1 FROM triple t WHERE t.s = '<' || f.uri || '>' AND t.p IN ({}) "
+            "AND term_intersects(t.o, ?, ?))".format(",".join("?" * len(TEMPORAL_PROPERTIES))),
+            ["<{}>".format(x) for x in TEMPORAL_PROPERTIES] + [tree.start, tree.end]
+        )
+    if isinstance(tree, IsNull):
+        return "NOT EXISTS (SELECT 1 FROM triple t WHERE t.s = '<' || f.uri || '>' AND t.p = ?)", \
+            ["<{}>".format(tree.property)]
+    if isinstance(tree, Not):
+        condition, values = sql_filter(tree.item)
+        return "NOT ({})".format(condition), values
+    conditions = [sql_filter(x) for x in tree.items]
+    return (
+        "({})".format((" AND " if isinstance(tree, And) else " OR ").join(x[0] for x in conditions)),
+        [v for x in conditions for v in x[1]]
+    )
+
+
+class SQLiteBackend(Backend):
+    """A Dataset's database, built by build_sqlite(), opened read-only once per thread"""
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.path = dataset.sqlite_file
+        self._local = threading.local()
+        self._graph = None
+        self._graph_lock = threading.Lock()
+
+    def execute(self, q: str, values=()) -> list:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True)
+            # for filters on the triples' values, see sql_filter()
+            db.create_function("term_value", 1, term_value, deterministic=True)
+            db.create_function("term_number", 1, term_number, deterministic=True)
+            db.create_function("term_intersects", 3, term_intersects, deterministic=True)
+        return db.execute(q, values).fetchall()
+
+    def graph(self) -> Graph:
+        with self._graph_lock:
+            if self._graph is None:
+                self._graph = Graph(store=SQLiteStore(self))
+            return self._graph
+
+    def collections(self) -> List[CollectionRow]:
+        return [CollectionRow(*r) for r in self.execute(
+            "SELECT uri, identifier, title, description FROM collection WHERE dataset = ? ORDER BY uri",
+            (self.dataset.dataset_uri,)
+        )]
+
+    def collection(self, uri: str) -> Optional[CollectionRow]:
+        rows = self.execute(
+            "SELECT uri, identifier, title, description FROM collection WHERE uri = ? AND identifier IS NOT NULL",
+            (uri,)
+        )
+        return CollectionRow(*rows[0]) if len(rows) > 0 else None
+
+    def collection_uri(self, identifier: str) -> Optional[str]:
+        rows = self.execute(
+            "SELECT uri FROM collection WHERE identifier = ? AND dataset = ? ORDER BY uri LIMIT 1",
+            (identifier, self.dataset.dataset_uri)
+        )
+        return rows[0][0] if len(rows) > 0 else None
+
+    def feature_uri(self, collection_uri: str, identifier: str) -> Optional[str]:
+        rows = self.execute(
+            "SELECT uri FROM feature WHERE identifier = ? AND collection = ? LIMIT 1", (identifier, collection_uri))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def member_count(self, collection_uri: str) -> int:
+        return self.execute("SELECT COUNT(*) FROM feature WHERE collection = ?", (collection_uri,))[0][0]
+
+    def members(self, collection_uri: str, start: int = 0, end: int = None) -> List[str]:
+        return [r[0] for r in self.execute(
+            "SELECT uri FROM feature WHERE collection = ? ORDER BY uri LIMIT ? OFFSET ?",
+            (collection_uri, end - start if end is not None else -1, start)
+        )]
+
+    def features(
+            self,
+            feature_uris: List[str] = None,
+            collection_uri: str = None,
+            properties: Iterable[str] = None
+    ) -> List[FeatureRow]:
+        wanted = optional_properties(properties)
+        columns = "uri, identifier, {}, collection".format(
+            ", ".join(x if x in wanted else "NULL" for x in OPTIONAL_PROPERTIES))
+        if feature_uris is None:
+            return [FeatureRow(*r) for r in self.execute(
+                "SELECT {} FROM feature WHERE collection = ? AND identifier IS NOT NULL ORDER BY uri".format(columns),
+                (collection_uri,)
+            )]
+        rows = {}
+        # in batches, as SQLite limits the number of parameters in a statement
+        for i in range(0, len(feature_uris), 500):
+            batch = [str(x) for x in feature_uris[i:i + 500]]
+            for r in self.execute(
+                    "SELECT {} FROM feature WHERE uri IN ({}) AND identifier IS NOT NULL".format(
+                        columns, ",".join("?" * len(batch))),
+                    batch
+            ):
+                rows[r[0]] = FeatureRow(*r)
+        return [rows[str(x)] for x in feature_uris if str(x) in rows]
+
+    def geometries(
+            self,
+            feature_uris: List[str] = None,
+            collection_uri: str = None,
+            kinds: Tuple[str] = (WKT,)
+    ) -> Iterable[Tuple[str, str, str]]:
+        kinds_in = "kind IN ({})".format(",".join("?" * len(kinds)))
+        if feature_uris is None:
+            return self.execute(
+                "SELECT feature, kind, value FROM geometry WHERE {} AND feature IN "
+                "(SELECT uri FROM feature WHERE collection = ?) ORDER BY feature".format(kinds_in),
+                list(kinds) + [collection_uri]
+            )
+        rows = []
+        for i in range(0, len(feature_uris), 500):
+            batch = [str(x) for x in feature_uris[i:i + 500]]
+            rows.extend(self.execute(
+                "SELECT feature, kind, value FROM geometry WHERE {} AND feature IN ({}) ORDER BY feature"
+                .format(kinds_in, ",".join("?" * len(batch))),
+                list(kinds) + batch
+            ))
+        return rows
+
+    def temporals(self, collection_uri: str) -> Iterable[Tuple[str, str]]:
+        return self.execute(
+            "SELECT f.uri, term_value(t.o) FROM feature f JOIN triple t ON t.s = '<' || f.uri || '>' "
+            "WHERE f.collection = ? AND t.p IN ({})".format(",".join("?" * len(TEMPORAL_PROPERTIES))),
+            [collection_uri] + ["<{}>".format(x) for x in TEMPORAL_PROPERTIES]
+        )
+
+    def describe_features(
+            self,
+            feature_uris: List[str],
+            properties: Iterable[str] = None,
+            geometries: bool = True
+    ) -> List[FeatureDescription]:
+        wanted = optional_properties(properties)
+        feature_properties = ["<{}>".format(k) for k, v in FEATURE_PROPERTIES.items()
+                              if v not in OPTIONAL_PROPERTIES or v in wanted]
+        node_properties = ["<{}>".format(x) for x in GEOMETRY_NODE_PROPERTIES]
+        if geometries:
+            feature_properties.append("<{}>".format(HAS_GEOMETRY))
+        triples = []
+        for i in range(0, len(feature_uris), 500):
+            batch = ["<{}>".format(x) for x in feature_uris[i:i + 500]]
+            q = "SELECT s, p, o FROM triple WHERE s IN ({}) AND p IN ({})".format(
+                ",".join("?" * len(batch)), ",".join("?" * len(feature_properties)))
+            values = batch + feature_properties
+            if geometries:
+                q += " UNION ALL SELECT g.s, g.p, g.o FROM triple f JOIN triple g ON g.s = f.o " \
+                     "WHERE f.s IN ({}) AND f.p = ? AND g.p IN ({})".format(
+                         ",".join("?" * len(batch)), ",".join("?" * len(node_properties)))
+                values += batch + ["<{}>".format(HAS_GEOMETRY)] + node_properties
+            triples.extend(self.execute(q, values))
+        return feature_descriptions(
+            ((term_value(s), term_value(p), term_value(o)) for s, p, o in triples), [str(x) for x in feature_uris])
+
+    def features_where(self, collection_uri: str, where, feature_uris: List[str] = None) -> List[str]:
+        condition, values = sql_filter(where)
+        if feature_uris is None:
+            return [r[0] for r in self.execute(
+                "SELECT uri FROM feature f WHERE collection = ? AND {} ORDER BY uri".format(condition),
+                [collection_uri] + values
+            )]
+        uris = []
+        for i in range(0, len(feature_uris), 500):
+            batch = [str(x) for x in feature_uris[i:i + 500]]
+            uris.extend(r[0] for r in self.execute(
+                "SELECT uri FROM feature f WHERE collection = ? AND uri IN ({}) AND {}".format(
+                    ",".join("?" * len(batch)), condition),
+                [collection_uri] + batch + values
+            ))
+        return sorted(uris)
+
+    def features_in_bbox(self, collection_uri: str, bbox: Tuple[float, float, float, float], where=None) -> List[str]:
+        condition, values = sql_filter(where) if where is not None else ("1", [])
+        return [r[0] for r in self.execute(
+            "SELECT DISTINCT f.uri FROM feature f JOIN geometry g ON g.feature = f.uri "
+            "WHERE f.collection = ? AND g.kind = ? AND g.min_x <= ? AND g.max_x >= ? AND g.min_y <= ? AND g.max_y >= ? "
+            "AND {} ORDER BY f.uri".format(condition),
+            [collection_uri, WKT, bbox[2], bbox[0], bbox[3], bbox[1]] + values
+        )]
+
+    def features_in_cell(self, collection_uri: str, cell_id: str, where=None) -> List[str]:
+        condition, values = sql_filter(where) if where is not None else ("1", [])
+        return [r[0] for r in self.execute(
+            "SELECT DISTINCT f.uri FROM feature f JOIN geometry g ON g.feature = f.uri "
+            "WHERE f.collection = ? AND g.kind = ? AND instr(g.value, ?) > 0 AND {} ORDER BY f.uri".format(condition),
+            [collection_uri, DGGS, cell_id] + values
+        )]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("Usage: python -m api.sqlite_backend SOURCE_RDF_FILE... SQLITE_FILE")
+    build_sqlite(sys.argv[1:-1], sys.argv[-1])
@@ -0,0 +1,43 @@
+"""Measures how long a new worker takes to start: importing api.app, create_app() and serving its first request
+
+Each run is made in a new Python process, so nothing is already imported or cached, and the median of the runs is
+reported. The first request is made with the test client, to the API documentation, which needs no SPARQL endpoint.
+
+Run with: python -m api.startup_benchmark [RUNS]
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+RUN = """
+import json, sys, time
+start = time.perf_counter()
+from api.app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get("/doc/")
+served = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "create_app": created - imported,
+    "first_request": served - created,
+    "total": served - start,
+    "status": response.status_code,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def run() -> dict:
+    out = subprocess.run([sys.executable, "-c", RUN], stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    runs = [run() for _ in range(int(sys.argv[1]) if len(sys.argv) > 1 else 5)]
+    for k in ["import", "create_app", "first_request", "total"]:
+        print("{:<14}{:>8.1f} ms".format(k, statistics.median(r[k] for r in runs) * 1000))
+    print("{:<14}{:>8}".format("modules", runs[-1]["modules"]))
+    print("{:<14}{:>8}".format("status", runs[-1]["status"]))
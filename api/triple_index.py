@@ -0,0 +1,203 @@
+import hashlib
+from functools import lru_cache
+import numpy
+from rdflib import Graph, URIRef
+from rdflib.store import Store
+from rdflib.util import from_n3
+
+TERM_ID = numpy.uint32  # up to 4 billion distinct terms
+
+
+def term_hash(n3: bytes) -> int:
+    """A stable 64 bit hash of a term's N3, the same in every process unlike hash()"""
+    return int.from_bytes(hashlib.blake2b(n3, digest_size=8).digest(), "little")
+
+
+def n3(term) -> str:
+    # URIRef.n3() validates the URI every time, which dominates lookups, so URIRefs are written here
+    return "<{}>".format(term) if type(term) is URIRef else term.n3()
+
+
+class TermDictionary(object):
+    """Maps RDF terms to integer IDs and back, holding every distinct term once as N3 in a single UTF-8 blob
+
+    A term's ID is its position in the blob, where offsets give where each term's N3 starts and ends. Terms are
+    found by their N3's term_hash() in a sorted array of hashes, with the IDs in the same order alongside.
+    """
+    __slots__ = ("blob", "offsets", "hashes", "hash_ids", "_term", "_id")
+
+    def __init__(self, blob, offsets: numpy.ndarray, hashes: numpy.ndarray, hash_ids: numpy.ndarray):
+        # blob is bytes or, for a mapped snapshot, a memoryview
+        self.blob = blob
+        self.offsets = offsets
+        self.hashes = hashes
+        self.hash_ids = hash_ids
+        self._term = lru_cache(maxsize=65536)(self._decode)
+        self._id = lru_cache(maxsize=65536)(self._lookup)
+
+    @classmethod
+    def build(cls, n3s: list) -> "TermDictionary":
+        """A dictionary of a list of distinct N3 strings, whose IDs are their positions in the list"""
+        encoded = [x.encode("utf-8") for x in n3s]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.uint64)
+        numpy.cumsum([len(x) for x in encoded], out=offsets[1:])
+        hashes = numpy.fromiter((term_hash(x) for x in encoded), dtype=numpy.uint64, count=len(encoded))
+        order = numpy.argsort(hashes, kind="stable")
+        return cls(b"".join(encoded), offsets, hashes[order], order.astype(TERM_ID))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _n3(self, i: int) -> bytes:
+        return bytes(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])])
+
+    def _decode(self, i: int):
+        return from_n3(self._n3(i).decode("utf-8"))
+
+    def term(self, i: int):
+        return self._term(int(i))
+
+    def id(self, term):
+        """The ID of term, or None if it is not in the dictionary"""
+        return self._id(n3(term).encode("utf-8"))
+
+    def _lookup(self, n3_bytes: bytes):
+        h = numpy.uint64(term_hash(n3_bytes))
+        lo = int(numpy.searchsorted(self.hashes, h, side="left"))
+        while lo < len(self.hashes) and self.hashes[lo] == h:
+            if self._n3(self.hash_ids[lo]) == n3_bytes:
+                return int(self.hash_ids[lo])
+            lo += 1
+        return None
+
+
+class TripleIndex(Store):
+    """A read-only, in-memory rdflib Store of dictionary-encoded triples
+
+    Each triple is held as three integer term IDs, twice: in SPO and in POS order, as sorted column arrays. Patterns
+    with a subject are answered from a range of the SPO arrays, those with a predicate but no subject from a range of
+    the POS arrays, found by binary search in both cases, so the lookups the API makes - predicate_objects(s),
+    subjects(p, o) and (s, p, o) in g - and the basic graph patterns of its SPARQL queries never scan. Memory is 24
+    bytes per triple plus each distinct term once, rather than a set of Python objects per triple.
+    """
+    context_aware = False
+    formula_aware = False
+    graph_aware = False
+    transaction_aware = False
+
+    def __init__(self, terms: TermDictionary, spo, pos):
+        super().__init__()
+        self.terms = terms
+        self.spo = spo  # (s, p, o) arrays, sorted by s, p, o
+        self.pos = pos  # (p, o, s) arrays, sorted by p, o, s
+        self._namespaces = {}
+
+    @classmethod
+    def from_graph(cls, g: Graph) -> "TripleIndex":
+        ids = {}
+        columns = ([], [], [])
+        for triple in g:
+            for column, t in zip(columns, triple):
+                i = ids.get(t)
+                if i is None:
+                    i = ids[t] = len(ids)
+                column.append(i)
+        terms = TermDictionary.build([n3(t) for t in ids])  # in ID order, as dicts keep insertion order
+        index = cls._from_columns(terms, *(numpy.array(x, dtype=TERM_ID) for x in columns))
+        for prefix, namespace in g.namespaces():
+            index.bind(prefix, namespace)
+        return index
+
+    @classmethod
+    def _from_columns(cls, terms: TermDictionary, s, p, o) -> "TripleIndex":
+        order = numpy.lexsort((o, p, s))
+        spo = (s[order], p[order], o[order])
+        order = numpy.lexsort((s, o, p))
+        pos = (p[order], o[order], s[order])
+        return cls(terms, spo, pos)
+
+    @classmethod
+    def load(cls, source: str, format: str = None) -> "TripleIndex":
+        """Indexes an RDF file"""
+        from rdflib.util import guess_format
+        g = Graph()
+        g.parse(source, format=format if format is not None else guess_format(source))
+        return cls.from_graph(g)
+
+    def graph(self) -> Graph:
+        """A Graph over this index, for get_graph()"""
+        return Graph(store=self)
+
+    @staticmethod
+    def _range(columns, lo: int, hi: int, key: list):
+        """Narrows [lo, hi) of lexically sorted columns to the rows starting with the IDs in key"""
+        for column, value in zip(columns, key):
+            # the rows of value are those from its first up to the first of value + 1, both found in one search, in
+            # the column's own type so as not to convert the column
+            first, last = column[lo:hi].searchsorted(numpy.array([value, value + 1], dtype=TERM_ID))
+            lo, hi = lo + int(first), lo + int(last)
+            if lo == hi:
+                break
+        return lo, hi
+
+    def _ids(self, s, p, o):
+        """IDs of the bound terms of a pattern, None for those unbound or not in the dictionary"""
+        return [self.terms.id(t) if t is not None else None for t in (s, p, o)]
+
+    def triples(self, triple_pattern, context=None):
+        s, p, o = triple_pattern
+        ids = self._ids(s, p, o)
+        if any(i is None and t is not None for i, t in zip(ids, (s, p, o))):
+            return
+        si, pi, oi = ids
+
+        if si is not None:
+            key = [si] + ([pi] + ([oi] if oi is not None else []) if pi is not None else [])
+            lo, hi = self._range(self.spo, 0, len(self.spo[0]), key)
+            rows = slice(lo, hi)
+            if pi is None and oi is not None:
+                rows = lo + numpy.nonzero(self.spo[2][lo:hi] == oi)[0]
+            columns = self.spo
+        elif pi is not None:
+            key = [pi] + ([oi] if oi is not None else [])
+            lo, hi = self._range(self.pos, 0, len(self.pos[0]), key)
+            rows = slice(lo, hi)
+            columns = (self.pos[2], self.pos[0], self.pos[1])
+        elif oi is not None:
+            rows = numpy.nonzero(self.spo[2] == oi)[0]
+            columns = self.spo
+        else:
+            rows = slice(None)
+            columns = self.spo
+
+        term = self.terms.term
+        for s, p, o in zip(columns[0][rows].tolist(), columns[1][rows].tolist(), columns[2][rows].tolist()):
+            yield (term(s), term(p), term(o)), iter(())
+
+    def __len__(self, context=None):
+        return len(self.spo[0])
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError("A TripleIndex is read-only")
+
+    def remove(self, triple, context=None):
+        raise TypeError("A TripleIndex is read-only")
+
+    def bind(self, prefix, namespace, override=True):
+        self._namespaces[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def prefix(self, namespace):
+        for k, v in self._namespaces.items():
+            if v == namespace:
+                return k
+        return None
+
+    def namespaces(self):
+        for k, v in self._namespaces.items():
+            yield k, v
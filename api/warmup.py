@@ -0,0 +1,108 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from api.config import *
+from api.dataset import DATASETS
+from api.admission import INTERNAL_KEY
+
+# set once every Dataset has been warmed up, or straight away if WARMUP is off
+ready = threading.Event()
+
+
+def warm_up_urls(dataset, collection_uris: list = None) -> list:
+    """The pages of a Dataset to request when warming up: its landing page, conformance targets, Collections list
+    and each Collection, or each of those listed, with its first WARMUP_PAGES pages of items"""
+    from api.model.collections import Collections
+
+    urls = ["/", "/conformance", "/collections"]
+    with dataset.activate():
+        identifiers = [
+            x.identifier for x in Collections().collections if collection_uris is None or x.uri in collection_uris]
+    for identifier in identifiers:
+        urls.append("/collections/{}".format(identifier))
+        for page in range(1, WARMUP_PAGES + 1):
+            urls.append("/collections/{}/items?page={}".format(identifier, page))
+    return urls
+
+
+def warm_up(app, datasets=None, collection_uris: list = None):
+    """Requests each Dataset's warm-up pages, in each of WARMUP_MEDIATYPES, with at most WARMUP_CONCURRENCY at once
+
+    Responses are discarded: the point is to fill the per-Dataset caches, and the triplestore's own, before clients
+    arrive. Each Dataset's search index is built too. Given collection_uris, e.g. those that have changed, only those
+    Collections' pages are requested. Failures are logged and do not stop the warm-up.
+    """
+    from api.search import get_search_index
+    client = app.test_client()
+
+    def index(dataset):
+        try:
+            with dataset.activate():
+                get_search_index()
+        except Exception as e:
+            logging.warning("building the search index of {} failed: {}".format(dataset, e))
+
+    def fetch(dataset, url, mediatype):
+        # addressed as clients address the Dataset so that it is selected, and its links made, as for them
+        headers = {"Accept": mediatype}
+        if dataset.hostname is not None:
+            headers["Host"] = dataset.hostname
+        try:
+            r = client.get((dataset.path_prefix or "") + url, headers=headers, environ_overrides={INTERNAL_KEY: True})
+            if r.status_code >= 400:
+                logging.warning("warm-up of {} {} for {} got {}".format(dataset, url, mediatype, r.status_code))
+        except Exception as e:
+            logging.warning("warm-up of {} {} for {} failed: {}".format(dataset, url, mediatype, e))
+
+    with ThreadPoolExecutor(max_workers=WARMUP_CONCURRENCY) as executor:
+        for dataset in datasets if datasets is not None else DATASETS:
+            try:
+                urls = warm_up_urls(dataset, collection_uris)
+            except Exception as e:
+                logging.warning("warm-up of {} could not list its Collections: {}".format(dataset, e))
+                continue
+            executor.submit(index, dataset)
+            for url in urls:
+                for mediatype in WARMUP_MEDIATYPES:
+                    executor.submit(fetch, dataset, url, mediatype)
+    logging.info("warm-up finished")
+
+
+def build_all_fragments(datasets=None, collection_uris: list = None):
+    """Builds the geosp fragments of each Dataset's Collections, or of those listed, see api.model.fragments"""
+    from api.model.fragments import build_fragments
+
+    for dataset in datasets if datasets is not None else DATASETS:
+        try:
+            with dataset.activate():
+                uris = [x.uri for x in dataset.backend.collections()
+                        if collection_uris is None or x.uri in collection_uris]
+        except Exception as e:
+            logging.warning("building the fragments of {} could not list its Collections: {}".format(dataset, e))
+            continue
+        for collection_uri in uris:
+            try:
+                with dataset.activate():
+                    build_fragments(collection_uri)
+            except Exception as e:
+                logging.warning("building the fragments of {} in {} failed: {}".format(collection_uri, dataset, e))
+
+
+def start_warm_up(app) -> threading.Thread:
+    """Warms up in the background, setting ready when finished, so the worker can answer /ready meanwhile. The
+    Collections' geosp fragments are then built, once the worker is ready, as they take long and are built as needed
+    until then"""
+    if not WARMUP:
+        ready.set()
+        return None
+
+    def run():
+        try:
+            warm_up(app)
+        finally:
+            ready.set()
+        build_all_fragments()
+
+    t = threading.Thread(target=run, name="warm-up", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,18 @@
+import os
+import tempfile
+import pytest
+
+# the app reads its configuration when api.config is imported, so this must be set first
+os.environ["LOCAL_DATASET_FILE"] = os.path.join(os.path.dirname(__file__), "data", "dataset.ttl")
+os.environ["DATASET_URI"] = "https://example.org/dataset/x"
+os.environ["LOGFILE"] = os.path.join(tempfile.gettempdir(), "ogcldapi-tests.log")
+os.environ["WARMUP"] = "false"
+os.environ["CHANGES_POLL_SECONDS"] = "0"
+os.environ["RESPONSE_CACHE_SECONDS"] = "0"
+
+
+@pytest.fixture(scope="session")
+def client():
+    from api.app import create_app
+
+    return create_app().test_client()
@@ -0,0 +1,31 @@
+import pytest
+from rdflib import Graph, URIRef
+from rdflib.namespace import DCTERMS, RDF, RDFS
+from api.config import GEO, GEOX
+
+LDP_PAGE = URIRef("http://www.w3.org/ns/ldp#Page")
+
+
+@pytest.mark.parametrize("mediatype,rdf_format", [("text/turtle", "turtle"), ("application/n-triples", "nt")])
+def test_geosp_items_page(client, mediatype, rdf_format):
+    r = client.get("/collections/a/items?_profile=geosp&_mediatype={}".format(mediatype))
+    assert r.status_code == 200
+    assert r.mimetype == mediatype
+
+    g = Graph().parse(data=r.get_data(as_text=True), format=rdf_format)
+
+    # the page's own triples
+    pages = list(g.subjects(RDF.type, LDP_PAGE))
+    assert len(pages) == 1
+    assert (URIRef("https://example.org/c/a"), GEOX.featureCount, None) in g
+
+    # and every Feature's fragment
+    for feature in ["https://example.org/f/1", "https://example.org/f/2"]:
+        f = URIRef(feature)
+        assert (f, RDF.type, GEO.Feature) in g
+        assert (f, DCTERMS.isPartOf, URIRef("https://example.org/c/a")) in g
+        geometries = list(g.objects(f, GEO.hasGeometry))
+        assert len(geometries) == 2
+        for geometry in geometries:
+            assert (geometry, RDFS.label, None) in g
+            assert (geometry, GEO.asWKT, None) in g or (geometry, GEOX.asDGGS, None) in g